@@ -143,3 +143,14 @@ DEFAULT_FROM_EMAIL = "info@gradia.net"
 
 # need to allow more form field when we input 50 stones
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 2000
+
+# add a Server-Timing header with the timings of the csv upload stages to the upload responses
+UPLOAD_TIMING_HEADER = False
+
+# the grading loggers (e.g. the upload stage timings of grading.upload_timing) log to the console
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {"grading": {"handlers": ["console"], "level": os.environ.get("GRADING_LOG_LEVEL", "WARNING")}},
+}
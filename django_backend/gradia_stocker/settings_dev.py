@@ -1,3 +1,4 @@
+import os
 import sys
 
 from .settings import *
@@ -15,3 +16,9 @@ DATABASES["default"]["NAME"] = "db.sqlite3"
 del DATABASES["default"]["OPTIONS"]
 if "--keepdb" in sys.argv:
     DATABASES["default"]["TEST"] = {"NAME": "/dev/shm/gradia-test-db.sqlite3"}
+
+UPLOAD_TIMING_HEADER = True
+
+# the upload stage timings and discrepancy summaries are logged at INFO in development,
+# GRADING_LOG_LEVEL=WARNING silences them (as in the CI test runs)
+LOGGING["loggers"]["grading"]["level"] = os.environ.get("GRADING_LOG_LEVEL", "INFO")
@@ -1,19 +1,34 @@
+import os
 from datetime import datetime
 from os import read
-import pandas as pd
 
 from django.contrib import admin, messages
-from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils.timezone import utc
-from django.http import HttpResponse
-from django.shortcuts import redirect
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.urls import path, reverse
+from django.utils.html import format_html
 from django.forms.models import BaseInlineFormSet
 from django.forms import ValidationError
 
-from ownerships.models import ParcelTransfer, StoneTransfer
+from ownerships.models import AbstractItemCustody, ParcelTransfer, StoneTransfer
+from ownerships.system_users import SYSTEM_USERS
 
 from .forms import StoneForm
-from .models import GiaVerification, GoldwayVerification, Parcel, Receipt, Split, Stone
+from .models import (
+    COLUMNAR_EXPORT_FORMATS,
+    ExportJob,
+    GiaVerification,
+    GoldwayVerification,
+    Parcel,
+    Receipt,
+    Split,
+    Stone,
+)
 
 
 class StoneInline(admin.TabularInline):
@@ -85,7 +100,7 @@ class SplitAdmin(admin.ModelAdmin):
                 instance.save()
                 ParcelTransfer.objects.create(
                     item=instance,
-                    from_user=User.objects.get(username="split"),
+                    from_user=SYSTEM_USERS.split,
                     created_by=request.user,
                     to_user=parcel_owner,
                     confirmed_date=datetime.utcnow().replace(tzinfo=utc),
@@ -96,7 +111,7 @@ class SplitAdmin(admin.ModelAdmin):
                 instance.save()
                 StoneTransfer.objects.create(
                     item=instance,
-                    from_user=User.objects.get(username="split"),
+                    from_user=SYSTEM_USERS.split,
                     created_by=request.user,
                     to_user=parcel_owner,
                     confirmed_date=datetime.utcnow().replace(tzinfo=utc),
@@ -109,7 +124,7 @@ class SplitAdmin(admin.ModelAdmin):
         ParcelTransfer.initiate_transfer(
             obj.original_parcel,
             from_user=current_holder,
-            to_user=User.objects.get(username="split"),
+            to_user=SYSTEM_USERS.split,
             created_by=request.user,
         )
 
@@ -124,7 +139,6 @@ class ItemOwnerFilter(admin.SimpleListFilter):
     title = "current owner"
     parameter_name = "owner"
     default_value = "me"
-    transfer_model = None
 
     def lookups(self, request, model_admin):
         return (
@@ -145,30 +159,60 @@ class ItemOwnerFilter(admin.SimpleListFilter):
         if username_filter == "me":
             username_filter = request.user.username
 
+        # the items whose most recent transfer is fresh, through the custody table
+        queryset = queryset.filter(
+            custody__status__in=[AbstractItemCustody.CONFIRMED, AbstractItemCustody.UNCONFIRMED]
+        )
         if username_filter:
-            fresh_transfers = self.transfer_model.objects.filter(to_user__username=username_filter, fresh=True)
-        else:
-            # the __all__ case where self.value() == None
-            fresh_transfers = (
-                self.transfer_model.objects.filter(fresh=True)
-                .exclude(to_user__username="split")
-                .exclude(to_user__username="exit")
-            )
-        parcel_ids = (p.item.id for p in fresh_transfers)
-        return queryset.filter(id__in=parcel_ids)
+            return queryset.filter(custody__holder__username=username_filter)
+        # the __all__ case where self.value() == None
+        return queryset.exclude(custody__holder__username__in=["split", "exit"])
 
 
 class ParcelOwnerFilter(ItemOwnerFilter):
-    transfer_model = ParcelTransfer
+    pass
 
 
 class StoneOwnerFilter(ItemOwnerFilter):
-    transfer_model = StoneTransfer
+    pass
+
+
+def current_location(obj):
+    try:
+        return obj.custody.location()
+    except ObjectDoesNotExist:
+        return None
+
+
+current_location.short_description = "current location"
+
+
+def subquery_count(queryset, group_by):
+    """
+    Number of rows of queryset (filtered on an OuterRef) as an annotation, 0 if there are none
+    :param queryset:
+    :param group_by: the field queryset is filtered on
+    :return:
+    """
+    counts = queryset.order_by().values(group_by).annotate(count=Count("pk")).values("count")
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
 
 
 def make_parcel_actions(user):
+    # the groups of user are looked up once per changelist page, not once per parcel
+    vault_manager = []
+
+    def is_vault_manager():
+        if not vault_manager:
+            vault_manager.append(user.groups.filter(name="vault_manager").exists())
+        return vault_manager[0]
+
     def actions(parcel):
-        return parcel.get_action_html_link_for_user(user)
+        try:
+            transfer = parcel.custody.transfer
+        except ObjectDoesNotExist:
+            transfer = None
+        return parcel.get_action_html_link_for_user(user, transfer=transfer, is_vault_manager=is_vault_manager)
 
     return actions
 
@@ -204,10 +248,51 @@ class ParcelAdmin(admin.ModelAdmin):
             "total_carats",
             "total_pieces",
             "finished_basic_grading",
-            "current_location",
+            current_location,
             make_parcel_actions(request.user),
         ]
 
+    def get_queryset(self, request):
+        """
+        Join and annotate everything the list columns show, so a page runs the same number of queries
+        whatever its number of parcels
+        :param request:
+        :return:
+        """
+        return (
+            super()
+            .get_queryset(request)
+            .select_related(
+                "receipt",
+                "split",
+                "split_from__original_parcel__receipt",
+                "custody__holder",
+                "custody__transfer__from_user",
+                "custody__transfer__to_user",
+            )
+            .annotate(
+                # Parcel.finished_basic_grading counts the stones of the split the parcel came from
+                basic_graded_stones=subquery_count(
+                    Stone.objects.filter(split_from=OuterRef("split_from")), "split_from"
+                ),
+                split_parcels=subquery_count(Parcel.objects.filter(split_from=OuterRef("pk")), "split_from"),
+                split_stones=subquery_count(Stone.objects.filter(split_from=OuterRef("pk")), "split_from"),
+            )
+        )
+
+    def finished_basic_grading(self, obj):
+        return obj.basic_graded_stones == obj.total_pieces
+
+    finished_basic_grading.boolean = True
+
+    def split_into(self, obj):
+        # raises ObjectDoesNotExist for the parcels that are not split, shown as empty like before
+        return obj.split.split_into_summary(parcels=obj.split_parcels, stones=obj.split_stones)
+
+    def most_recent_transfer(self, obj):
+        transfer = obj.custody.transfer
+        return f"{transfer.from_user} -> {transfer.to_user} (on {transfer.initiated_date:%D})"
+
     def has_view_permission(self, request, obj=None):
         return True
 
@@ -261,11 +346,39 @@ class ReceiptAdmin(admin.ModelAdmin):
                 ParcelTransfer.objects.create(
                     item=instance,
                     from_user=request.user,
-                    to_user=User.objects.get(username="vault"),
+                    to_user=SYSTEM_USERS.vault,
                     created_by=request.user,
                 )
 
 
+def csv_download_response(filename_prefix, lines):
+    """
+    Returns a streaming csv attachment response, rows are sent to the client as they are generated
+    :param filename_prefix:
+    :param lines:
+    :return:
+    """
+    response = StreamingHttpResponse(lines, content_type="text/csv")
+    filename = filename_prefix + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
+    response["Content-Disposition"] = "attachment; filename=%s" % filename
+    return response
+
+
+def columnar_download_response(filename_prefix, content, export_format):
+    """
+    Returns an attachment response for the content of an `export_format` file
+    :param filename_prefix:
+    :param content:
+    :param export_format: one of COLUMNAR_EXPORT_FORMATS
+    :return:
+    """
+    _, extension, content_type = COLUMNAR_EXPORT_FORMATS[export_format]
+    response = HttpResponse(content, content_type=content_type)
+    filename = filename_prefix + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + "." + extension
+    response["Content-Disposition"] = "attachment; filename=%s" % filename
+    return response
+
+
 def parcel(stone):
     return stone.split_from.original_parcel.get_parcel_with_html_link()
 
@@ -280,12 +393,22 @@ class StoneAdmin(admin.ModelAdmin):
 
     change_list_template = "grading/stone_data_upload.html"
 
+    # set to True to keep a copy of every csv download under MEDIA_ROOT/csv_downloads/
+    archive_csv_downloads = False
+
+    # serve reports of unchanged stones from the export cache, see export_csv. Off as the cache is only
+    # invalidated by changes to the stones, not to the parcels, verifications or users in the reports
+    cache_csv_downloads = False
+
+    # report downloads of more stones than this are queued as an ExportJob instead of built in the request
+    background_export_threshold = 1000
+
     def get_list_display(self, request):
         return [
             "external_id",
             "parcel_code",
             "customer_receipt_number",
-            "current_location",
+            current_location,
             "basic_carat",
             "basic_color_final",
             "basic_clarity_final",
@@ -294,6 +417,12 @@ class StoneAdmin(admin.ModelAdmin):
             "split_from",
         ]
 
+    def get_queryset(self, request):
+        # parcel_code, customer_receipt_number, split_from and current_location follow these for every stone
+        return (
+            super().get_queryset(request).select_related("split_from__original_parcel__receipt", "custody__holder")
+        )
+
     actions = [
         "transfer_to_goldway",
         "transfer_to_GIA",
@@ -305,10 +434,14 @@ class StoneAdmin(admin.ModelAdmin):
         "download_gia_grading_template",
         "download_adjust_goldway_csv",
         "download_master_reports",
+        "download_master_reports_parquet",
+        "download_master_reports_feather",
         "download_to_GIA_csv",
         "download_adjust_GIA_csv",
         "download_to_basic_report_csv",
         "download_export_triple_report_to_lab",
+        "download_triple_report_parquet",
+        "download_triple_report_feather",
     ]
 
     def get_actions(self, request):
@@ -319,89 +452,97 @@ class StoneAdmin(admin.ModelAdmin):
         return actions
 
     def download_external_ids(self, request, queryset):
-        file_path = Stone.objects.generate_external_id_csv(queryset)
-        with open(file_path, mode="r") as file:
-            response = HttpResponse(file, content_type="text/csv")
-            filename = "Gradia_ids_" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
-            response["Content-Disposition"] = "attachment; filename=%s" % filename
-            return response
+        lines = Stone.objects.generate_external_id_csv(queryset, stream=True, archive=self.archive_csv_downloads)
+        return csv_download_response("Gradia_ids_", lines)
 
     download_external_ids.short_description = "Download External IDs"
 
     def download_basic_grading_template(self, request, queryset):
-        file_path = Stone.objects.generate_basic_grading_template(request, queryset)
-        with open(file_path, mode="r") as file:
-            response = HttpResponse(file, content_type="text/csv")
-            filename = "Basic_Grading_Template_" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
-            response["Content-Disposition"] = "attachment; filename=%s" % filename
-            return response
+        lines = Stone.objects.generate_basic_grading_template(
+            request, queryset, stream=True, archive=self.archive_csv_downloads
+        )
+        return csv_download_response("Basic_Grading_Template_", lines)
 
     download_basic_grading_template.short_description = "Download Basic Grading CSV Template"
 
     def download_goldway_grading_template(self, request, queryset):
-        file_path = Stone.objects.generate_goldway_grading_template(request, queryset)
-        with open(file_path, mode="r") as file:
-            response = HttpResponse(file, content_type="text/csv")
-            filename = "Goldway_Grading_Template_" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
-            response["Content-Disposition"] = "attachment; filename=%s" % filename
-            return response
+        lines = Stone.objects.generate_goldway_grading_template(
+            request, queryset, stream=True, archive=self.archive_csv_downloads
+        )
+        return csv_download_response("Goldway_Grading_Template_", lines)
 
     download_goldway_grading_template.short_description = "Download Goldway Grading CSV Template"
 
     def download_gia_grading_template(self, request, queryset):
-        file_path = Stone.objects.generate_gia_grading_template(request, queryset)
-        with open(file_path, mode="r") as file:
-            response = HttpResponse(file, content_type="text/csv")
-            filename = "GIA_Grading_Template_" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
-            response["Content-Disposition"] = "attachment; filename=%s" % filename
-            return response
+        lines = Stone.objects.generate_gia_grading_template(
+            request, queryset, stream=True, archive=self.archive_csv_downloads
+        )
+        return csv_download_response("GIA_Grading_Template_", lines)
 
     download_gia_grading_template.short_description = "Download GIA Grading CSV Template"
 
     def download_adjust_goldway_csv(self, request, queryset):
-        file_path = Stone.objects.generate_adjust_goldway_csv(queryset)
-        with open(file_path, mode="r") as file:
-            response = HttpResponse(file, content_type="text/csv")
-            filename = "Adjust_Goldway" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
-            response["Content-Disposition"] = "attachment; filename=%s" % filename
-            return response
+        lines = Stone.objects.generate_adjust_goldway_csv(
+            queryset, stream=True, archive=self.archive_csv_downloads, cache=self.cache_csv_downloads
+        )
+        return csv_download_response("Adjust_Goldway", lines)
 
     download_adjust_goldway_csv.short_description = "Download Adjust Goldway CSV"
 
     def download_to_GIA_csv(self, request, queryset):
-        file_path = Stone.objects.generate_to_GIA_csv(queryset)
-        read_file = pd.read_csv(file_path)
-        data_frame = pd.DataFrame(read_file)
-        field = data_frame["nano_etch_inscription"].to_dict()[0]
-        if pd.isna(field):
+        # the first exported row is the last stone of the queryset
+        first_stone = queryset.last()
+        if first_stone is None or not first_stone.external_id:
             messages.warning(request, "There is not enough data to download")
             return redirect(request.path)
 
-        with open(file_path, mode="r") as file:
-            response = HttpResponse(file, content_type="text/csv")
-            filename = "To_GIA_" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
-            response["Content-Disposition"] = "attachment; filename=%s" % filename
-            return response
+        lines = Stone.objects.generate_to_GIA_csv(
+            queryset, stream=True, archive=self.archive_csv_downloads, cache=self.cache_csv_downloads
+        )
+        return csv_download_response("To_GIA_", lines)
 
     download_to_GIA_csv.short_description = "Download GIA CSV Transfer"
 
     def download_adjust_GIA_csv(self, request, queryset):
-        file_path = Stone.objects.generate_adjust_GIA_csv(queryset)
-        with open(file_path, mode="r") as file:
-            response = HttpResponse(file, content_type="text/csv")
-            filename = "Adjust_GIA" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
-            response["Content-Disposition"] = "attachment; filename=%s" % filename
-            return response
+        lines = Stone.objects.generate_adjust_GIA_csv(
+            queryset, stream=True, archive=self.archive_csv_downloads, cache=self.cache_csv_downloads
+        )
+        return csv_download_response("Adjust_GIA", lines)
 
     download_adjust_GIA_csv.short_description = "Download Adjust GIA CSV"
 
+    def queue_export_job(self, request, queryset, export_type):
+        """
+        Queues the export for the `run_export_jobs` worker if the selection is larger than
+        background_export_threshold. Returns the job or None if the export should be built right away
+        :param request:
+        :param queryset:
+        :param export_type: one of ExportJob.EXPORT_TYPES
+        :return:
+        """
+        if queryset.count() <= self.background_export_threshold:
+            return None
+
+        job = ExportJob.enqueue(export_type, queryset, created_by=request.user)
+        job_url = reverse("admin:grading_exportjob_change", args=(job.pk,))
+        messages.info(
+            request,
+            format_html(
+                'The export of {} stones has been queued, the file will be available from <a href="{}">{}</a>',
+                job.total_rows,
+                job_url,
+                job,
+            ),
+        )
+        return job
+
     def download_to_basic_report_csv(self, request, queryset):
-        file_path = Stone.objects.generate_basic_report_csv(queryset)
-        with open(file_path, mode="r") as file:
-            response = HttpResponse(file, content_type="text/csv")
-            filename = "Basic_Report" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
-            response["Content-Disposition"] = "attachment; filename=%s" % filename
-            return response
+        if self.queue_export_job(request, queryset, "basic_report"):
+            return
+        lines = Stone.objects.generate_basic_report_csv(
+            queryset, stream=True, archive=self.archive_csv_downloads, cache=self.cache_csv_downloads
+        )
+        return csv_download_response("Basic_Report", lines)
 
     download_to_basic_report_csv.short_description = "Download Basic Report"
 
@@ -412,69 +553,107 @@ class StoneAdmin(admin.ModelAdmin):
         :param queryset:
         :return:
         """
-        file_path = Stone.objects.generate_triple_report_csv(queryset)
-        with open(file_path, mode="r") as file:
-            response = HttpResponse(file, content_type="text/csv")
-            filename = "Triple_Report_Lab_Export" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
-            response["Content-Disposition"] = "attachment; filename=%s" % filename
-            return response
+        if self.queue_export_job(request, queryset, "triple_report"):
+            return
+        lines = Stone.objects.generate_triple_report_csv(
+            queryset, stream=True, archive=self.archive_csv_downloads, cache=self.cache_csv_downloads
+        )
+        return csv_download_response("Triple_Report_Lab_Export", lines)
 
     download_export_triple_report_to_lab.short_description = "Download Triple Report"
 
     def download_master_reports(self, request, queryset):
-        file_path = Stone.objects.generate_master_report_csv(queryset)
-        with open(file_path, mode="r") as file:
-            response = HttpResponse(file, content_type="text/csv")
-            filename = "Master_report_" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
-            response["Content-Disposition"] = "attachment; filename=%s" % filename
-            return response
+        if self.queue_export_job(request, queryset, "master_report"):
+            return
+        lines = Stone.objects.generate_master_report_csv(
+            queryset, stream=True, archive=self.archive_csv_downloads, cache=self.cache_csv_downloads
+        )
+        return csv_download_response("Master_report_", lines)
 
     download_master_reports.short_description = "Download Master Report"
 
-    def transfer_to_goldway(self, request, queryset):
-        vault = User.objects.get(username="vault")
-        goldway = User.objects.get(username="goldway")
+    def download_columnar_report(self, request, queryset, generate_report, filename_prefix, export_format):
+        """
+        Downloads a report built by `generate_report` as an `export_format` file
+        :param request:
+        :param queryset:
+        :param generate_report: Stone.objects method taking (queryset, export_format)
+        :param filename_prefix:
+        :param export_format: one of COLUMNAR_EXPORT_FORMATS
+        :return:
+        """
+        try:
+            content = generate_report(queryset, export_format)
+        except ImportError:
+            messages.error(request, "pyarrow must be installed to download %s files" % export_format)
+            return
+        return columnar_download_response(filename_prefix, content, export_format)
+
+    def download_master_reports_parquet(self, request, queryset):
+        return self.download_columnar_report(
+            request, queryset, Stone.objects.generate_master_report, "Master_report_", "parquet"
+        )
 
-        for stone in queryset.all():
-            StoneTransfer.can_create_transfer(item=stone, from_user=vault, to_user=goldway)
+    download_master_reports_parquet.short_description = "Download Master Report (Parquet)"
 
-        verification = GoldwayVerification.objects.create()
-        for stone in queryset.all():
-            StoneTransfer.initiate_transfer(item=stone, from_user=vault, to_user=goldway, created_by=request.user)
-            stone.goldway_verification = verification
-            stone.save()
+    def download_master_reports_feather(self, request, queryset):
+        return self.download_columnar_report(
+            request, queryset, Stone.objects.generate_master_report, "Master_report_", "feather"
+        )
 
-    transfer_to_goldway.short_description = "Transfer to Goldway"
+    download_master_reports_feather.short_description = "Download Master Report (Feather)"
 
-    def transfer_to_GIA(self, request, queryset):
-        vault = User.objects.get(username="vault")
-        gia = User.objects.get(username="gia")
+    def download_triple_report_parquet(self, request, queryset):
+        return self.download_columnar_report(
+            request, queryset, Stone.objects.generate_triple_report, "Triple_Report_Lab_Export", "parquet"
+        )
+
+    download_triple_report_parquet.short_description = "Download Triple Report (Parquet)"
 
-        for stone in queryset.all():
-            StoneTransfer.can_create_transfer(item=stone, from_user=vault, to_user=gia)
+    def download_triple_report_feather(self, request, queryset):
+        return self.download_columnar_report(
+            request, queryset, Stone.objects.generate_triple_report, "Triple_Report_Lab_Export", "feather"
+        )
+
+    download_triple_report_feather.short_description = "Download Triple Report (Feather)"
 
-        verification = GiaVerification.objects.create()
-        for stone in queryset.all():
-            StoneTransfer.initiate_transfer(item=stone, from_user=vault, to_user=gia, created_by=request.user)
-            stone.gia_verification = verification
-            stone.save()
+    def transfer_to_goldway(self, request, queryset):
+        vault = SYSTEM_USERS.vault
+        goldway = SYSTEM_USERS.goldway
+
+        stones = list(queryset.all())
+        with transaction.atomic():
+            verification = GoldwayVerification.objects.create()
+            StoneTransfer.bulk_initiate_transfer(stones, from_user=vault, to_user=goldway, created_by=request.user)
+            Stone.objects.filter(pk__in=[stone.pk for stone in stones]).update(
+                gw_verification=verification, modified_date=datetime.utcnow().replace(tzinfo=utc)
+            )
+
+    transfer_to_goldway.short_description = "Transfer to Goldway"
+
+    def transfer_to_GIA(self, request, queryset):
+        vault = SYSTEM_USERS.vault
+        gia = SYSTEM_USERS.gia
+
+        stones = list(queryset.all())
+        with transaction.atomic():
+            verification = GiaVerification.objects.create()
+            StoneTransfer.bulk_initiate_transfer(stones, from_user=vault, to_user=gia, created_by=request.user)
+            Stone.objects.filter(pk__in=[stone.pk for stone in stones]).update(
+                gia_verification=verification, modified_date=datetime.utcnow().replace(tzinfo=utc)
+            )
 
     transfer_to_GIA.short_description = "Transfer to GIA"
 
     def transfer_to_vault(self, request, queryset):
-        for stone in queryset.all():
-            StoneTransfer.initiate_transfer(
-                item=stone,
-                from_user=User.objects.get(username=request.user.username),
-                to_user=User.objects.get(username="vault"),
-                created_by=request.user,
-            )
+        StoneTransfer.bulk_initiate_transfer(
+            queryset.all(), from_user=request.user, to_user=SYSTEM_USERS.vault, created_by=request.user
+        )
 
     transfer_to_vault.short_description = "Transfer to Vault"
 
     def confirm_received_stones(self, request, queryset):
-        for stone in queryset.all():
-            StoneTransfer.confirm_received(item=stone)
+        StoneTransfer.bulk_confirm_received(queryset.all())
 
     confirm_received_stones.short_description = "Confirm Received Stones"
 
@@ -510,3 +689,54 @@ class GoldwayVerificationAdmin(admin.ModelAdmin):
 class GiaVerificationAdmin(admin.ModelAdmin):
     model = GiaVerification
     list_display = ["receipt_number", "invoice_number", "started", "summary"]
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    model = ExportJob
+
+    list_display = ["__str__", "status", "progress", "created_by", "created_date", "finished_date", "download_link"]
+    list_filter = ["status", "export_type"]
+    readonly_fields = [field.name for field in ExportJob._meta.fields] + ["progress", "download_link"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def progress(self, instance):
+        return f"{instance.progress}% ({instance.processed_rows}/{instance.total_rows})"
+
+    def get_urls(self):
+        urls = [
+            path(
+                "<int:object_id>/download/",
+                self.admin_site.admin_view(self.download_file),
+                name="grading_exportjob_download",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def download_file(self, request, object_id):
+        """
+        Serves the file of a finished job to the user who queued it or to users allowed to view the jobs
+        :param request:
+        :param object_id:
+        :return:
+        """
+        job = get_object_or_404(ExportJob, pk=object_id)
+        if job.created_by_id != request.user.pk and not self.has_view_permission(request, job):
+            raise PermissionDenied
+        if job.status != ExportJob.DONE or not job.file:
+            raise Http404("The export is not finished")
+        return FileResponse(job.file.open("rb"), as_attachment=True, filename=os.path.basename(job.file.name))
+
+    def download_link(self, instance):
+        if instance.status != ExportJob.DONE or not instance.file:
+            return "-"
+        return format_html(
+            '<a href="{}">Download</a>', reverse("admin:grading_exportjob_download", args=[instance.pk])
+        )
+
+    download_link.short_description = "File"
@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class GradingConfig(AppConfig):
     name = "grading"
+
+    def ready(self):
+        from stonegrading.models import Inclusion
+
+        from .inclusion_cache import INCLUSIONS
+
+        post_save.connect(INCLUSIONS.clear, sender=Inclusion, dispatch_uid="grading.inclusion_cache.save")
+        post_delete.connect(INCLUSIONS.clear, sender=Inclusion, dispatch_uid="grading.inclusion_cache.delete")
@@ -0,0 +1,74 @@
+"""
+Per-stone cost of the cut grade estimation table lookup, building a DiamondAngleGrader for every stone (as
+grade_with_cut_grade_estimation_table used to) vs the preloaded CutGradeTableRegistry
+
+Run from django_backend/:
+    python -m grading.auto_grade.cut_grade_estimation_table_generation_tool.benchmark_tables --stones 5000
+"""
+
+import argparse
+import os
+import random
+import time
+
+from .core.angle_grader import DiamondAngleGrader
+from .core.table_registry import CutGradeTableRegistry
+
+TABLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "core", "all_grade_tables")
+
+
+def random_stones(count, seed=0):
+    """
+    Random valid (table size, crown angle, pavilion angle) triples
+    :param count:
+    :param seed:
+    :return:
+    """
+    rng = random.Random(seed)
+    crown_angles = [22.0 + 0.5 * index for index in range(36)]
+    pavilion_angles = [round(38.8 + 0.2 * index, 1) for index in range(21)]
+    return [(rng.randint(50, 67), rng.choice(crown_angles), rng.choice(pavilion_angles)) for _ in range(count)]
+
+
+def per_stone_grader(stones):
+    return [
+        DiamondAngleGrader(table_file_path=os.path.join(TABLES_DIR, f"{table_size}.txt")).get_grade(crown, pavilion)
+        for table_size, crown, pavilion in stones
+    ]
+
+
+def preloaded_registry(stones, registry):
+    return [registry.get_grade(table_size, crown, pavilion) for table_size, crown, pavilion in stones]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stones", type=int, default=5000)
+    args = parser.parse_args()
+
+    stones = random_stones(args.stones)
+
+    start = time.perf_counter()
+    before = per_stone_grader(stones)
+    before_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    registry = CutGradeTableRegistry(tables_dir=TABLES_DIR)
+    registry.load()
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    after = preloaded_registry(stones, registry)
+    after_seconds = time.perf_counter() - start
+
+    assert before == after, "registry grades differ from DiamondAngleGrader"
+
+    print(f"stones graded:                    {args.stones}")
+    print(f"DiamondAngleGrader per stone:     {before_seconds / args.stones * 1e6:10.2f} us/stone")
+    print(f"registry load (once per process): {load_seconds * 1e3:10.2f} ms")
+    print(f"preloaded registry:               {after_seconds / args.stones * 1e6:10.2f} us/stone")
+    print(f"speed-up:                         {before_seconds / after_seconds:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
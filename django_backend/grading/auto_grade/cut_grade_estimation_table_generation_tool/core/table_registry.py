@@ -0,0 +1,173 @@
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from .angle_grader import DiamondAngleGrader
+
+LoadedTables = namedtuple(
+    "LoadedTables",
+    ["codes", "table_size_index", "crown_angle_index", "pavilion_angle_index", "crown_angles", "pavilion_angles"],
+)
+
+
+def _positions(index, values):
+    """
+    Look every value up in a {float: position} map at once
+    :param index:
+    :param values:
+    :return: (positions, found)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    keys = np.array(sorted(index), dtype=np.float64)
+    key_positions = np.array([index[key] for key in keys], dtype=np.intp)
+
+    slots = np.searchsorted(keys, values).clip(max=len(keys) - 1)
+    found = keys[slots] == values
+    return np.where(found, key_positions[slots], 0), found
+
+
+class CutGradeTableRegistry:
+
+    # All estimation tables, loaded once into a single array of grade codes
+    # codes[table size, pavilion angle, crown angle] -> index into GRADE_LABELS (MISSING_CODE if the cell is unknown)
+
+    GRADE_LABELS = ("PR", "FR", "GD", "VG", "EX")
+    MISSING_CODE = -1
+
+    def __init__(self, tables_dir, table_sizes=range(50, 68)):
+        self.tables_dir = tables_dir
+        self.table_sizes = tuple(table_sizes)
+        self._lock = threading.Lock()
+        self._loaded = None
+
+    def _build(self):
+        """
+        Parse every table file (through DiamondAngleGrader, so the angle ranges and grade letters stay the same)
+        and pack them into one int8 array
+        :return: LoadedTables
+        """
+        code_of = {label: code for code, label in enumerate(self.GRADE_LABELS)}
+        codes = None
+        crown_angle_index = pavilion_angle_index = None
+        crown_angles = pavilion_angles = None
+
+        for position, table_size in enumerate(self.table_sizes):
+            grader = DiamondAngleGrader(table_file_path=os.path.join(self.tables_dir, f"{table_size}.txt"))
+            if codes is None:
+                crown_angle_index = {float(angle): index for angle, index in grader.crown_angle_map_dict.items()}
+                pavilion_angle_index = {
+                    float(angle): index for angle, index in grader.pavilion_angle_map_dict.items()
+                }
+                crown_angles = frozenset(grader.crown_angle_ranges.tolist())
+                pavilion_angles = frozenset(grader.pavilion_angle_ranges.tolist())
+                codes = np.full(
+                    (len(self.table_sizes), len(pavilion_angle_index), len(crown_angle_index)),
+                    self.MISSING_CODE,
+                    dtype=np.int8,
+                )
+            elif (
+                len(grader.crown_angle_map_dict) != codes.shape[2]
+                or len(grader.pavilion_angle_map_dict) != codes.shape[1]
+            ):
+                raise ValueError(f"{table_size}.txt does not have the same dimensions as the other tables")
+
+            for row in range(codes.shape[1]):
+                for column in range(codes.shape[2]):
+                    codes[position, row, column] = code_of.get(grader.table[row][column], self.MISSING_CODE)
+
+        codes.setflags(write=False)
+        table_size_index = {float(table_size): position for position, table_size in enumerate(self.table_sizes)}
+        return LoadedTables(
+            codes=codes,
+            table_size_index=table_size_index,
+            crown_angle_index=crown_angle_index,
+            pavilion_angle_index=pavilion_angle_index,
+            crown_angles=crown_angles,
+            pavilion_angles=pavilion_angles,
+        )
+
+    def load(self):
+        """
+        Load the tables if they have not been loaded yet in this process
+        :return:
+        """
+        if self._loaded is None:
+            with self._lock:
+                if self._loaded is None:
+                    self._loaded = self._build()
+        return self._loaded
+
+    def reload(self):
+        """
+        Re-read the table files, e.g. after they were regenerated.
+        Graders running concurrently keep using the previous tables until the new ones are fully built
+        :return:
+        """
+        loaded = self._build()
+        with self._lock:
+            self._loaded = loaded
+        return loaded
+
+    @property
+    def codes(self):
+        return self.load().codes
+
+    def get_grade_code(self, table_size, crown_angle, pavilion_angle):
+        """
+        Return the grade code given the table size, crown_angle and the pavilion_angle
+        :param table_size:
+        :param crown_angle:
+        :param pavilion_angle:
+        :return:
+        """
+        tables = self.load()
+
+        if float(table_size) not in tables.table_size_index:
+            raise ValueError(f"no estimation table for table size {table_size}")
+
+        if crown_angle not in tables.crown_angles:
+            raise ValueError(f"{crown_angle} specified is invalid")
+
+        if pavilion_angle not in tables.pavilion_angles:
+            raise ValueError(f"{pavilion_angle} specified is invalid")
+
+        return tables.codes[
+            tables.table_size_index[float(table_size)],
+            tables.pavilion_angle_index[pavilion_angle],
+            tables.crown_angle_index[crown_angle],
+        ]
+
+    def get_grade_codes(self, table_sizes, crown_angles, pavilion_angles):
+        """
+        Vectorized get_grade_code over float arrays
+        :param table_sizes:
+        :param crown_angles:
+        :param pavilion_angles:
+        :return: (codes, found) - found is False where get_grade_code would not find a table cell (it raises for
+            those), codes is MISSING_CODE there
+        """
+        tables = self.load()
+        table_positions, table_found = _positions(tables.table_size_index, table_sizes)
+        crown_positions, crown_found = _positions(tables.crown_angle_index, crown_angles)
+        pavilion_positions, pavilion_found = _positions(tables.pavilion_angle_index, pavilion_angles)
+
+        found = table_found & crown_found & pavilion_found
+        codes = np.full(len(found), self.MISSING_CODE, dtype=np.int8)
+        codes[found] = tables.codes[table_positions[found], pavilion_positions[found], crown_positions[found]]
+        return codes, found
+
+    def get_grade(self, table_size, crown_angle, pavilion_angle):
+        """
+        Return the grade given the table size, crown_angle and the pavilion_angle
+        Same result as DiamondAngleGrader(<table_size>.txt).get_grade(crown_angle, pavilion_angle)
+        :param table_size:
+        :param crown_angle:
+        :param pavilion_angle:
+        :return:
+        """
+        code = self.get_grade_code(table_size, crown_angle, pavilion_angle)
+        if code == self.MISSING_CODE:
+            return None
+        return self.GRADE_LABELS[code]
@@ -8,6 +8,7 @@ import numpy as np
 sys.path.append(".")
 print(sys.path)
 from ..core.angle_grader import DiamondAngleGrader
+from ..core.table_registry import CutGradeTableRegistry
 
 
 class DiamondAngleGraderTest(unittest.TestCase):
@@ -61,3 +62,47 @@ class DiamondAngleGraderTest(unittest.TestCase):
             self.table_1 = DiamondAngleGrader(table_file_path=table_1_path)
 
     # Jason you can try working on more test cases. Just try thinking of possible edges (happy / sad cases)
+
+
+class CutGradeTableRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.tables_dir = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core", "all_grade_tables"
+        )
+        self.registry = CutGradeTableRegistry(tables_dir=self.tables_dir)
+
+    def test_registry_matches_angle_grader_for_every_table_and_angle(self):
+        """
+        Tests that the preloaded tables return exactly what a fresh DiamondAngleGrader returns
+        :return:
+        """
+        self.assertEqual(self.registry.codes.shape, (18, 21, 36))
+        for table_size in range(50, 68):
+            grader = DiamondAngleGrader(table_file_path=os.path.join(self.tables_dir, f"{table_size}.txt"))
+            for crown_angle in grader.crown_angle_map_dict:
+                for pavilion_angle in grader.pavilion_angle_map_dict:
+                    self.assertEqual(
+                        self.registry.get_grade(table_size, float(crown_angle), float(pavilion_angle)),
+                        grader.get_grade(float(crown_angle), float(pavilion_angle)),
+                    )
+
+    def test_registry_raises_value_error_if_invalid_angles_or_table_size(self):
+        with self.assertRaises(ValueError):
+            self.registry.get_grade(55, 999, 240)
+
+        with self.assertRaises(ValueError):
+            self.registry.get_grade(55, 34.3, 40.0)
+
+        with self.assertRaises(ValueError):
+            self.registry.get_grade(55, 34.5, 40.1)
+
+        with self.assertRaises(ValueError):
+            self.registry.get_grade(68, 34.5, 40.0)
+
+    def test_reload_replaces_the_loaded_tables(self):
+        codes = self.registry.codes
+        self.assertIs(self.registry.codes, codes)
+
+        self.registry.reload()
+        self.assertIsNot(self.registry.codes, codes)
+        np.testing.assert_array_equal(self.registry.codes, codes)
@@ -3,7 +3,23 @@ import sys
 
 from django.conf import settings
 
-from grading.auto_grade.cut_grade_estimation_table_generation_tool.core.angle_grader import DiamondAngleGrader
+from grading.auto_grade.cut_grade_estimation_table_generation_tool.core.table_registry import CutGradeTableRegistry
+
+from .grades import (
+    BLANK,
+    DOWNGRADE_CODES,
+    EX,
+    FR,
+    GD,
+    GIRDLE_GRADE_CODES,
+    GIRDLE_INDEX,
+    GRADE_CODES,
+    NONE,
+    PR,
+    STANDARD_GRADES,
+    VG,
+    label_of,
+)
 
 GRADE_PARA = {
     "table_size_rounded": [52, 62, 50, 66, 47, 69, 44, 72],
@@ -16,6 +32,20 @@ GRADE_PARA = {
     "total_depth_rounded": [57.5, 63.0, 56.0, 64.5, 53.0, 66.5, 51.9, 70.9],
 }
 
+# Loaded on first use and shared by every stone graded in this process; call CUT_GRADE_TABLES.reload()
+# after regenerating the table files
+CUT_GRADE_TABLES = CutGradeTableRegistry(
+    tables_dir=os.path.join(
+        settings.BASE_DIR,
+        "grading",
+        "auto_grade",
+        "cut_grade_estimation_table_generation_tool",
+        "core",
+        "all_grade_tables",
+    ),
+    table_sizes=range(50, 68),
+)
+
 
 def grade_table_size_pct(stone_dict: dict) -> dict:
     # auto_table_size_rounded_grade
@@ -148,19 +178,24 @@ def grade_final_gradia_cut(stone_dict: dict) -> dict:
 
 
 def grade_with_range_parameters(stone_data: str, parameters: list) -> str:
+    return label_of(grade_code_with_range_parameters(stone_data, parameters))
+
+
+def grade_code_with_range_parameters(stone_data: str, parameters: list) -> int:
     if not stone_data:
-        return ""
+        return BLANK
     stone_data = float(stone_data)
     if parameters[0] <= stone_data <= parameters[1]:
-        return "EX"
+        return EX
     elif parameters[2] <= stone_data <= parameters[3]:
-        return "VG"
+        return VG
     elif parameters[4] <= stone_data <= parameters[5]:
-        return "GD"
+        return GD
     elif parameters[6] <= stone_data <= parameters[7]:
-        return "FR"
+        return FR
     elif 0 <= stone_data <= 100:
-        return "PR"
+        return PR
+    return NONE
 
 
 def grade_with_girdle_description(g_min: str, g_max: str) -> str:
@@ -170,37 +205,22 @@ def grade_with_girdle_description(g_min: str, g_max: str) -> str:
         g_min = "ETN"
     if g_max.upper() == "ETN TO VTN":
         g_max = "ETN"
-    g_dict = {}
-    g_dict["ETN"] = {
-        "ETN": "GD",
-        "VTN": "VG",
-        "THN": "VG",
-        "MED": "VG",
-        "STK": "VG",
-        "THK": "VG",
-        "VTK": "GD",
-        "ETK": "FR",
-    }
-    g_dict["VTN"] = {"VTN": "VG", "THN": "VG", "MED": "VG", "STK": "VG", "THK": "VG", "VTK": "GD", "ETK": "FR"}
-    g_dict["THN"] = {"THN": "EX", "MED": "EX", "STK": "EX", "THK": "VG", "VTK": "GD", "ETK": "FR"}
-    g_dict["MED"] = {"MED": "EX", "STK": "EX", "THK": "VG", "VTK": "GD", "ETK": "FR"}
-    g_dict["STK"] = {"STK": "EX", "THK": "VG", "VTK": "GD", "ETK": "FR"}
-    g_dict["THK"] = {"THK": "VG", "VTK": "GD", "ETK": "FR"}
-    g_dict["VTK"] = {"VTK": "GD", "ETK": "FR"}
-    g_dict["ETK"] = {"ETK": "FR"}
-    return g_dict[g_min][g_max]
+    code = GIRDLE_GRADE_CODES[GIRDLE_INDEX[g_min], GIRDLE_INDEX[g_max]]
+    if code == NONE:
+        # g_max is thinner than g_min
+        raise KeyError(g_max)
+    return label_of(code)
 
 
 def grade_with_list_return_lowest_grade(stone_data_list: list) -> str:
-    standard_grade = ["PR", "FR", "GD", "VG", "EX"]
-    lowest = standard_grade.index("EX")
+    lowest = EX
     for grade in stone_data_list:
-        if grade not in standard_grade:
+        code = GRADE_CODES.get(grade)
+        if code is None:
             return ""
-        index = standard_grade.index(grade)
-        if index < lowest:
-            lowest = index
-    return standard_grade[lowest]
+        if code < lowest:
+            lowest = code
+    return STANDARD_GRADES[lowest]
 
 
 def grade_with_cut_grade_estimation_table(
@@ -209,42 +229,20 @@ def grade_with_cut_grade_estimation_table(
     if table_size_pct == "" or not 50 <= int(table_size_pct) <= 67:
         return ""
 
-    table_data_path = os.path.join(
-        settings.BASE_DIR,
-        "grading",
-        "auto_grade",
-        "cut_grade_estimation_table_generation_tool",
-        "core",
-        "all_grade_tables",
-        f"{table_size_pct}.txt",
-    )
-    # table_data_path = os.path.join(
-    #     "cut_grade_estimation_table_generation_tool", "core", "all_grade_tables", table_size_pct + ".txt"
-    # )
-    table = DiamondAngleGrader(table_file_path=table_data_path)
-    if not table:
-        return ""
-    return table.get_grade(float(crown_angle_degree), float(pavilion_angle_degree))
+    return CUT_GRADE_TABLES.get_grade(table_size_pct, float(crown_angle_degree), float(pavilion_angle_degree))
 
 
 def grade_determind_if_cut_needs_downgrade_with_two_parameter(cut: str, para1: str, para2: str) -> dict:
     # Assume all input are in short forms
-    cut = cut[:2]
-    para1 = para1[:2]
-    para2 = para2[:2]
-    standard_grade = ["PR", "FR", "GD", "VG", "EX"]
+    cut_code = GRADE_CODES.get(cut[:2])
+    para1_code = GRADE_CODES.get(para1[:2])
+    para2_code = GRADE_CODES.get(para2[:2])
 
-    if cut not in standard_grade or para1 not in standard_grade or para2 not in standard_grade:
+    if cut_code is None or para1_code is None or para2_code is None:
         print("EMPTY")
         return ""
 
-    cut_index = standard_grade.index(cut)
-    para1_index = standard_grade.index(para1) + 1
-    para2_index = standard_grade.index(para2) + 1
-
-    if para1_index < cut_index or para2_index < cut_index:
-        return standard_grade[para1_index] if para2_index > para1_index else standard_grade[para2_index]
-    return standard_grade[cut_index]
+    return STANDARD_GRADES[DOWNGRADE_CODES[cut_code, para1_code, para2_code]]
 
 
 def convert_long_grade_to_short(long):
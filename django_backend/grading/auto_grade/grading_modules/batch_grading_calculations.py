@@ -0,0 +1,378 @@
+import numpy as np
+import pandas as pd
+
+from .all_grading_calculations import (
+    CUT_GRADE_TABLES,
+    GRADE_PARA,
+    grade_determind_if_cut_needs_downgrade_with_two_parameter,
+    grade_with_cut_grade_estimation_table,
+    grade_with_girdle_description,
+)
+from .grades import (
+    BLANK,
+    DOWNGRADE_CODES,
+    EX,
+    FR,
+    GD,
+    GIRDLE_GRADE_CODES,
+    GIRDLE_INDEX,
+    GRADE_CODES,
+    LABEL_ARRAY,
+    NONE,
+    PR,
+    VG,
+    code_of,
+)
+
+# Batch counterpart of all_grading_calculations: every grade is kept as an int8 code (see grades.py) while the
+# columns are computed and converted to the same strings as the per-stone functions at the end
+
+# (auto field, stone field graded with GRADE_PARA[stone field])
+RANGE_GRADED_FIELDS = [
+    ("auto_table_size_rounded_grade", "table_size_rounded"),
+    ("auto_crown_angle_rounded_grade_grade", "crown_angle_rounded"),
+    ("auto_pavilion_angle_rounded_grade", "pavilion_angle_rounded"),
+    ("auto_star_length_rounded_grade", "star_length_rounded"),
+    ("auto_lower_half_rounded_grade", "lower_half_rounded"),
+    ("auto_girdle_thick_rounded_grade", "girdle_thickness_rounded"),
+    ("auto_crown_height_rounded_grade", "crown_height_rounded"),
+    ("auto_total_depth_rounded_grade", "total_depth_rounded"),
+]
+
+# Stone fields the auto grading reads
+AUTO_GRADE_INPUT_FIELDS = [field for _, field in RANGE_GRADED_FIELDS] + [
+    "girdle_min_grade",
+    "girdle_max_grade",
+    "table_size_dev_grade",
+    "crown_angle_dev_grade",
+    "pavilion_angle_dev_grade",
+    "star_length_dev_grade",
+    "lower_half_dev_grade",
+    "girdle_thick_dev_grade",
+    "crown_height_dev_grade",
+    "sarine_cut_pre_polish_symmetry",
+    "sarine_symmetry",
+    "basic_polish_final",
+]
+
+# Columns graded by auto_grade_frame, in the order auto_grade_stone adds them
+AUTO_GRADE_FIELDS = [
+    "auto_table_size_rounded_grade",
+    "auto_crown_angle_rounded_grade_grade",
+    "auto_pavilion_angle_rounded_grade",
+    "auto_star_length_rounded_grade",
+    "auto_lower_half_rounded_grade",
+    "auto_girdle_thick_rounded_grade",
+    "auto_girdle_grade",
+    "auto_crown_height_rounded_grade",
+    "auto_total_depth_rounded_grade",
+    "auto_individual_cut_grade_grade",
+    "auto_est_table_cut_grade_grade",
+    "auto_gradia_cut_grade_grade",
+    "auto_final_sarine_cut_grade",
+    "auto_final_gradia_cut_grade",
+]
+
+
+def labels_of(codes):
+    """
+    The strings (or None) the per-stone grading functions return for these codes
+    :param codes:
+    :return:
+    """
+    return LABEL_ARRAY[codes]
+
+
+def for_each_distinct(values, function, missing, dtype):
+    """
+    function(value) for every value, calling it once per distinct value (the columns hold few of them)
+    :param values:
+    :param function:
+    :param missing: result for None / NaN
+    :param dtype:
+    :return:
+    """
+    positions, distinct_values = pd.factorize(values)
+    results = np.array([function(value) for value in distinct_values] + [missing], dtype=dtype)
+    # position -1 (missing) picks the last result
+    return results[positions]
+
+
+def grade_codes_of(values):
+    """
+    Code of the standard grades ("PR", ..., "EX") in values, NONE for anything else
+    :param values:
+    :return:
+    """
+    return for_each_distinct(values, lambda value: GRADE_CODES.get(value, NONE), NONE, np.int8)
+
+
+def is_blank(values):
+    """
+    Which values the per-stone functions treat as missing (`not value`)
+    :param values:
+    :return:
+    """
+    if values.dtype.kind in "iuf":
+        return (values == 0) | np.isnan(values)
+    return for_each_distinct(values, lambda value: not value, True, bool)
+
+
+def as_floats(values):
+    """
+    float(value) for the values that are not blank, NaN for the blank ones
+    :param values:
+    :return: (floats, blank)
+    """
+    blank = is_blank(values)
+    if values.dtype.kind in "iuf":
+        floats = values.astype(np.float64)
+    else:
+        floats = for_each_distinct(values, lambda value: float(value) if value else np.nan, np.nan, np.float64)
+    floats[blank] = np.nan
+    return floats, blank
+
+
+def converted(values, convert):
+    """
+    convert(value) for every value, convert being float or int as in the per-stone function
+    :param values:
+    :param convert:
+    :return: (numbers, ok) - ok is False where convert raises (NaN there)
+    """
+    if values.dtype.kind in "iuf":
+        numbers = values.astype(np.float64)
+        return (np.trunc(numbers) if convert is int else numbers), ~np.isnan(numbers)
+
+    def convert_or_nan(value):
+        try:
+            return convert(value)
+        except (TypeError, ValueError):
+            return np.nan
+
+    def converts(value):
+        try:
+            convert(value)
+        except (TypeError, ValueError):
+            return False
+        return True
+
+    return (
+        for_each_distinct(values, convert_or_nan, np.nan, np.float64),
+        for_each_distinct(values, converts, False, bool),
+    )
+
+
+def fall_back(codes, rows, grade, *columns):
+    """
+    Grade the rows the vectorized path does not handle with the per-stone function, so results (and errors) stay
+    the same as auto_grade_stone's
+    :param codes:
+    :param rows:
+    :param grade:
+    :param columns:
+    :return:
+    """
+    for position in np.flatnonzero(rows):
+        codes[position] = code_of(grade(*(column[position] for column in columns)))
+    return codes
+
+
+def grade_codes_with_range_parameters(values, parameters):
+    """
+    Vectorized grade_with_range_parameters
+    :param values:
+    :param parameters:
+    :return:
+    """
+    floats, blank = as_floats(values)
+
+    def between(low, high):
+        return (low <= floats) & (floats <= high)
+
+    return np.select(
+        [
+            blank,
+            between(parameters[0], parameters[1]),
+            between(parameters[2], parameters[3]),
+            between(parameters[4], parameters[5]),
+            between(parameters[6], parameters[7]),
+            between(0, 100),
+        ],
+        [BLANK, EX, VG, GD, FR, PR],
+        default=NONE,
+    ).astype(np.int8)
+
+
+def girdle_indexes(values):
+    """
+    Position of each girdle in GIRDLES ("ETN to VTN" counting as "ETN"), -1 for anything else
+    :param values:
+    :return:
+    """
+
+    def girdle_index(girdle):
+        if isinstance(girdle, str) and girdle.upper() == "ETN TO VTN":
+            girdle = "ETN"
+        return GIRDLE_INDEX.get(girdle, -1)
+
+    return for_each_distinct(values, girdle_index, -1, np.intp)
+
+
+def grade_codes_with_girdle_description(g_min, g_max):
+    """
+    Vectorized grade_with_girdle_description
+    :param g_min:
+    :param g_max:
+    :return:
+    """
+    blank = is_blank(g_min) | is_blank(g_max)
+    min_index, max_index = girdle_indexes(g_min), girdle_indexes(g_max)
+    known = (min_index >= 0) & (max_index >= 0)
+
+    codes = np.full(len(blank), BLANK, dtype=np.int8)
+    codes[known] = GIRDLE_GRADE_CODES[min_index[known], max_index[known]]
+    # unknown girdles and combinations the per-stone function has no grade for
+    return fall_back(codes, ~blank & ~(known & (codes != NONE)), grade_with_girdle_description, g_min, g_max)
+
+
+def lowest_grade_codes(*codes):
+    """
+    Vectorized grade_with_list_return_lowest_grade: BLANK if any grade is not a standard one, else the lowest
+    :param codes:
+    :return:
+    """
+    lowest = np.minimum.reduce(codes)
+    return np.where(lowest < 0, BLANK, lowest).astype(np.int8)
+
+
+def grade_codes_with_cut_grade_estimation_table(table_sizes, crown_angles, pavilion_angles):
+    """
+    Vectorized grade_with_cut_grade_estimation_table
+    :param table_sizes:
+    :param crown_angles:
+    :param pavilion_angles:
+    :return:
+    """
+    truncated_sizes, truncated = converted(table_sizes, int)
+    in_range = truncated & (50 <= truncated_sizes) & (truncated_sizes <= 67)
+    outside = truncated & ~in_range
+    if table_sizes.dtype == object:
+        outside |= table_sizes == ""
+
+    sizes, _ = converted(table_sizes, float)
+    crowns, crown_converted = converted(crown_angles, float)
+    pavilions, pavilion_converted = converted(pavilion_angles, float)
+    table_codes, found = CUT_GRADE_TABLES.get_grade_codes(sizes, crowns, pavilions)
+    graded = in_range & crown_converted & pavilion_converted & found
+
+    codes = np.where(graded, table_codes, BLANK).astype(np.int8)
+    # get_grade raises for these
+    return fall_back(
+        codes,
+        ~graded & ~outside,
+        grade_with_cut_grade_estimation_table,
+        table_sizes,
+        crown_angles,
+        pavilion_angles,
+    )
+
+
+def truncated_grade_codes(values):
+    """
+    Codes of value[:2] (NONE if it is not a standard grade) and which values are strings at all
+    :param values:
+    :return: (codes, strings)
+    """
+    strings = for_each_distinct(values, lambda value: isinstance(value, str), False, bool)
+    codes = for_each_distinct(
+        values, lambda value: GRADE_CODES.get(value[:2], NONE) if isinstance(value, str) else NONE, NONE, np.int8
+    )
+    return codes, strings
+
+
+def grade_codes_with_downgrade(cut, para1, para2):
+    """
+    Vectorized grade_determind_if_cut_needs_downgrade_with_two_parameter: the cut grade, lowered to one grade above
+    the lowest of the two parameters
+    :param cut:
+    :param para1:
+    :param para2:
+    :return:
+    """
+    cut_codes, cut_strings = truncated_grade_codes(cut)
+    para1_codes, para1_strings = truncated_grade_codes(para1)
+    para2_codes, para2_strings = truncated_grade_codes(para2)
+
+    standard = (cut_codes >= 0) & (para1_codes >= 0) & (para2_codes >= 0)
+    codes = np.full(len(standard), BLANK, dtype=np.int8)
+    codes[standard] = DOWNGRADE_CODES[cut_codes[standard], para1_codes[standard], para2_codes[standard]]
+    # cut[:2] raises for None and other non strings
+    return fall_back(
+        codes,
+        ~(cut_strings & para1_strings & para2_strings),
+        grade_determind_if_cut_needs_downgrade_with_two_parameter,
+        cut,
+        para1,
+        para2,
+    )
+
+
+def auto_grade_frame(stones: pd.DataFrame) -> pd.DataFrame:
+    """
+    Batch version of process_csv.auto_grade_stone: compute every auto_* grade for all the stones (one per row) at once.
+    Values are the same as auto_grade_stone gives for each row as a stone dict, except NaN is read as a missing value
+    (None) since that is how pandas stores None in most columns
+    :param stones: one column per Stone field used by the grading (as in model_to_dict)
+    :return: a copy of stones with the auto_* columns set
+    """
+
+    def values(field):
+        column = stones[field]
+        if column.dtype.kind in "iuf":
+            return column.to_numpy()
+        column = column.to_numpy(dtype=object, copy=True)
+        column[pd.isna(column)] = None
+        return column
+
+    codes = {}
+    for auto_field, field in RANGE_GRADED_FIELDS:
+        codes[auto_field] = grade_codes_with_range_parameters(values(field), GRADE_PARA[field])
+
+    codes["auto_girdle_grade"] = grade_codes_with_girdle_description(
+        values("girdle_min_grade"), values("girdle_max_grade")
+    )
+
+    codes["auto_individual_cut_grade_grade"] = lowest_grade_codes(
+        # prioritized using hand graded
+        grade_codes_of(values("table_size_dev_grade")),
+        grade_codes_of(values("crown_angle_dev_grade")),
+        grade_codes_of(values("pavilion_angle_dev_grade")),
+        grade_codes_of(values("star_length_dev_grade")),
+        grade_codes_of(values("lower_half_dev_grade")),
+        grade_codes_of(values("girdle_thick_dev_grade")),
+        codes["auto_girdle_grade"],  # from auto grading
+        grade_codes_of(values("crown_height_dev_grade")),
+        codes["auto_total_depth_rounded_grade"],  # from auto grading
+    )
+
+    codes["auto_est_table_cut_grade_grade"] = grade_codes_with_cut_grade_estimation_table(
+        values("table_size_rounded"), values("crown_angle_rounded"), values("pavilion_angle_rounded")
+    )
+
+    codes["auto_gradia_cut_grade_grade"] = lowest_grade_codes(
+        codes["auto_individual_cut_grade_grade"], codes["auto_est_table_cut_grade_grade"]
+    )
+
+    codes["auto_final_sarine_cut_grade"] = grade_codes_with_downgrade(
+        values("sarine_cut_pre_polish_symmetry"), values("sarine_symmetry"), values("basic_polish_final")
+    )
+
+    codes["auto_final_gradia_cut_grade"] = grade_codes_with_downgrade(
+        labels_of(codes["auto_gradia_cut_grade_grade"]), values("basic_polish_final"), values("sarine_symmetry")
+    )
+
+    graded = stones.copy()
+    for auto_field in AUTO_GRADE_FIELDS:
+        graded[auto_field] = pd.Series(labels_of(codes[auto_field]), index=stones.index, dtype=object)
+    return graded
@@ -1,96 +1,264 @@
-import sys
-import unittest
+import logging
 import os
-import csv
-import pprint
+
+import pandas as pd
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-OUTPUT_LOG = os.path.join(BASE_DIR, "differences_log", "log.txt")
-
-test_fields = "table_size_pct_grade,crown_angle_degree_grade,pavilion_angle_degree_grade,star_length_pct_grade,lower_half_pct_grade,girdle_thick_pct_grade,girdle_grade,individual_cut_grade,est_table_cut_grade,gradia_cut,final_gradia_cut,final_sarine_cut".split(
-    ","
-)
-
-
-def check_differences_print_and_store_log(original_csv_path: str, computed_csv_path: str) -> None:
-    return
-    expected = []
-    result = []
-    with open(original_csv_path, "r") as input_file:
-        input_reader = csv.DictReader(input_file)
-        for row in input_reader:
-            expected.append(row)
-    with open(computed_csv_path, "r") as output_file:
-        output_reader = csv.DictReader(output_file)
-        for row in output_reader:
-            result.append(row)
-
-    logs = []
-    rejected_stone = ["rej", "REJ"]
-    for i, (expected_stone, result_stone) in enumerate(zip(expected, result)):
-        if expected_stone["remarks"] in rejected_stone:
-            continue
-        for test_field in test_fields:
-            if expected_stone[test_field] != result_stone[test_field]:
-                logs.append(
-                    dict(
-                        test_field=test_field, computed=result_stone, hand_grading=expected_stone, line_number=i + 2
-                    )
-                )
-    open(OUTPUT_LOG, "w").close()
-    if logs:
-        print(len(logs), "Differences Found:\n")
-        for i, log in enumerate(logs, 1):
-            internal_id = str(log["computed"]["internal_id"])
-            line_number = str(log["line_number"])
-            test_field = str(log["test_field"])
-            computed_grading = str(log["computed"][test_field])
-            hand_grading = str(log["hand_grading"][test_field])
-            printlog(
-                index=i,
-                internal_id=internal_id,
-                line_number=line_number,
-                test_field=test_field,
-                computed_grading=computed_grading,
-                hand_grading=hand_grading,
+OUTPUT_LOG = os.path.join(BASE_DIR, "differences_log", "log.jsonl")
+
+logger = logging.getLogger(__name__)
+
+# hand graded csv column -> auto graded column
+test_fields = {
+    "table_size_pct_grade": "auto_table_size_rounded_grade",
+    "crown_angle_degree_grade": "auto_crown_angle_rounded_grade_grade",
+    "pavilion_angle_degree_grade": "auto_pavilion_angle_rounded_grade",
+    "star_length_pct_grade": "auto_star_length_rounded_grade",
+    "lower_half_pct_grade": "auto_lower_half_rounded_grade",
+    "girdle_thick_pct_grade": "auto_girdle_thick_rounded_grade",
+    "girdle_grade": "auto_girdle_grade",
+    "individual_cut_grade": "auto_individual_cut_grade_grade",
+    "est_table_cut_grade": "auto_est_table_cut_grade_grade",
+    "gradia_cut": "auto_gradia_cut_grade_grade",
+    "final_gradia_cut": "auto_final_gradia_cut_grade",
+    "final_sarine_cut": "auto_final_sarine_cut_grade",
+}
+
+# Stone fields graded by hand (the sarine deviation grades) -> Stone auto grade of the same measurement
+stone_test_fields = {
+    "table_size_dev_grade": "auto_table_size_rounded_grade",
+    "crown_angle_dev_grade": "auto_crown_angle_rounded_grade_grade",
+    "pavilion_angle_dev_grade": "auto_pavilion_angle_rounded_grade",
+    "star_length_dev_grade": "auto_star_length_rounded_grade",
+    "lower_half_dev_grade": "auto_lower_half_rounded_grade",
+    "girdle_thick_dev_grade": "auto_girdle_thick_rounded_grade",
+    "crown_height_dev_grade": "auto_crown_height_rounded_grade",
+}
+
+REJECTED_REMARKS = ["rej", "REJ"]
+# rows / columns order of the confusion matrices, other values follow
+GRADE_ORDER = ["EX", "VG", "GD", "FR", "PR", ""]
+
+
+class DiscrepancyReport:
+
+    # Hand graded vs computed grades of the stones found on both sides (joined on internal_id)
+
+    def __init__(self, comparisons, field_map, unmatched_hand_graded, unmatched_computed):
+        """
+        :param comparisons: one row per (stone, field): internal_id, field, computed_field, hand_graded, computed
+        :param field_map: hand graded field -> computed field
+        :param unmatched_hand_graded: internal_ids only in the hand graded results
+        :param unmatched_computed: internal_ids only in the computed results
+        """
+        self.comparisons = comparisons
+        self.field_map = field_map
+        self.unmatched_hand_graded = unmatched_hand_graded
+        self.unmatched_computed = unmatched_computed
+
+    @property
+    def differences(self):
+        return self.comparisons[self.comparisons["hand_graded"] != self.comparisons["computed"]]
+
+    def summary(self):
+        """
+        Per field: number of stones compared, differences, and agreement rate
+        :return: DataFrame indexed by the hand graded field
+        """
+        comparisons = self.comparisons.assign(
+            different=self.comparisons["hand_graded"] != self.comparisons["computed"],
+            hand_graded_missing=self.comparisons["hand_graded"] == "",
+            computed_missing=self.comparisons["computed"] == "",
+        )
+        summary = comparisons.groupby("field", sort=False, observed=True).agg(
+            computed_field=("computed_field", "first"),
+            compared=("different", "size"),
+            differences=("different", "sum"),
+            hand_graded_missing=("hand_graded_missing", "sum"),
+            computed_missing=("computed_missing", "sum"),
+        )
+        summary["agreement"] = 1 - summary["differences"] / summary["compared"]
+        return summary.reindex(list(self.field_map)).dropna(subset=["computed_field"])
+
+    def confusion_matrix(self, field):
+        """
+        Count of stones for every (hand graded, computed) pair of grades of a field
+        :param field: hand graded field
+        :return: DataFrame, hand graded grades as rows and computed grades as columns
+        """
+        return confusion_matrix(self.comparisons[self.comparisons["field"] == field])
+
+    def confusion_matrices(self):
+        matrices = {
+            field: confusion_matrix(comparisons)
+            for field, comparisons in self.comparisons.groupby("field", sort=False, observed=True)
+        }
+        return {field: matrices[field] for field in self.field_map if field in matrices}
+
+    def write_log(self, file, chunk_size=10000):
+        """
+        Stream the differences to file as JSON lines, one per stone and field
+        :param file: path or file object
+        :param chunk_size:
+        :return: number of differences written
+        """
+        if isinstance(file, str):
+            with open(file, "w") as log_file:
+                return self.write_log(log_file, chunk_size)
+
+        differences = self.differences
+        for start in range(0, len(differences), chunk_size):
+            records = differences.iloc[start : start + chunk_size].to_json(orient="records", lines=True)
+            file.write(records.rstrip("\n") + "\n")
+        return len(differences)
+
+    def log_summary(self):
+        """
+        Log one record per field, with the summary as structured `extra` data
+        :return:
+        """
+        for field, row in self.summary().iterrows():
+            data = {"field": field, **{key: getattr(value, "item", lambda: value)() for key, value in row.items()}}
+            logger.info(
+                "%s vs %s: %s differences in %s stones",
+                field,
+                data["computed_field"],
+                data["differences"],
+                data["compared"],
+                extra={"discrepancy": data},
             )
-            writelog(
-                output_log_file_path=OUTPUT_LOG,
-                index=i,
-                internal_id=internal_id,
-                line_number=line_number,
-                test_field=test_field,
-                computed_grading=computed_grading,
-                hand_grading=hand_grading,
+        if self.unmatched_hand_graded or self.unmatched_computed:
+            logger.warning(
+                "%s hand graded and %s computed stones have no counterpart",
+                len(self.unmatched_hand_graded),
+                len(self.unmatched_computed),
+                extra={
+                    "discrepancy": {
+                        "unmatched_hand_graded": self.unmatched_hand_graded,
+                        "unmatched_computed": self.unmatched_computed,
+                    }
+                },
+            )
+
+
+def ordered_grades(grades):
+    return [grade for grade in GRADE_ORDER if grade in grades] + sorted(set(grades) - set(GRADE_ORDER))
+
+
+def confusion_matrix(comparisons):
+    """
+    :param comparisons: comparisons of a single field
+    :return: DataFrame, hand graded grades as rows and computed grades as columns
+    """
+    matrix = comparisons.groupby(["hand_graded", "computed"]).size().unstack(fill_value=0)
+    matrix = matrix.reindex(index=ordered_grades(matrix.index), columns=ordered_grades(matrix.columns), fill_value=0)
+    return matrix.rename_axis(index="hand_graded", columns="computed")
+
+
+def normalize_grades(frame, fields):
+    """
+    internal_id as int and the grade fields as strings, missing values as ""
+    :param frame:
+    :param fields:
+    :return:
+    """
+    frame = frame[["internal_id", *fields]].copy()
+    frame["internal_id"] = pd.to_numeric(frame["internal_id"]).astype("int64")
+    for field in fields:
+        frame[field] = frame[field].astype(object).where(frame[field].notna(), "").astype(str)
+    return frame
+
+
+def compare_grades(hand_graded, computed, field_map=None):
+    """
+    Join the hand graded and the computed grades on internal_id and compare them field by field
+    :param hand_graded: DataFrame with internal_id, the field_map keys and optionally remarks (rejected stones are skipped)
+    :param computed: DataFrame with internal_id and the field_map values
+    :param field_map: hand graded field -> computed field, test_fields by default
+    :return: DiscrepancyReport
+    :raise ValueError: when none of the fields of field_map are in both results
+    """
+    # a computed csv may use the hand graded column names too
+    field_map = {
+        hand_field: computed_field if computed_field in computed.columns else hand_field
+        for hand_field, computed_field in (field_map or test_fields).items()
+        if hand_field in hand_graded.columns
+        and (computed_field in computed.columns or hand_field in computed.columns)
+    }
+    if not field_map:
+        raise ValueError("No grade field to compare in both results")
+
+    if "remarks" in hand_graded.columns:
+        hand_graded = hand_graded[~hand_graded["remarks"].isin(REJECTED_REMARKS)]
+    hand_graded = normalize_grades(hand_graded, list(field_map))
+    computed = normalize_grades(computed, list(dict.fromkeys(field_map.values())))
+
+    # suffixes keep the two sides apart when a field is both a hand graded and a computed field
+    merged = hand_graded.merge(
+        computed, on="internal_id", how="outer", suffixes=("", "__computed"), indicator=True, validate="one_to_one"
+    )
+    unmatched_hand_graded = merged.loc[merged["_merge"] == "left_only", "internal_id"].tolist()
+    unmatched_computed = merged.loc[merged["_merge"] == "right_only", "internal_id"].tolist()
+    merged = merged[merged["_merge"] == "both"]
+
+    comparisons = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "internal_id": merged["internal_id"],
+                    "field": hand_field,
+                    "computed_field": computed_field,
+                    "hand_graded": merged[hand_field],
+                    "computed": merged[
+                        f"{computed_field}__computed" if f"{computed_field}__computed" in merged else computed_field
+                    ],
+                }
             )
-        print("...differences stored in log.txt")
-
-    return len(logs)
-
-
-def printlog(index, internal_id, line_number, test_field, computed_grading, hand_grading):
-    print(index)
-    print(
-        "ID:          ",
-        internal_id,
-        "\n" "Line Number: ",
-        line_number,
-        "\n" "Field Name:  ",
-        test_field,
-        "\n" "Computed:    ",
-        computed_grading,
-        "\n" "Hand Graded: ",
-        hand_grading,
-        "\n",
+            for hand_field, computed_field in field_map.items()
+        ],
+        ignore_index=True,
     )
+    return DiscrepancyReport(comparisons, field_map, unmatched_hand_graded, unmatched_computed)
+
+
+def read_grades_csv(csv_path):
+    """
+    Read a grading csv keeping every value as a string ("" when empty)
+    :param csv_path:
+    :return:
+    """
+    return pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+
+
+def stone_grades_frame(queryset, fields):
+    """
+    internal_id and fields of the stones in queryset
+    :param queryset:
+    :param fields:
+    :return:
+    """
+    fields = ["internal_id", *dict.fromkeys(fields)]
+    return pd.DataFrame.from_records(queryset.values_list(*fields).iterator(), columns=fields)
+
+
+def compare_stone_grades(queryset, field_map=None):
+    """
+    Compare the grades of the stones in queryset, stone_test_fields by default
+    :param queryset:
+    :param field_map:
+    :return: DiscrepancyReport
+    """
+    field_map = field_map or stone_test_fields
+    grades = stone_grades_frame(queryset, [*field_map, *field_map.values()])
+    return compare_grades(grades, grades, field_map)
+
 
+def check_differences_print_and_store_log(original_csv_path: str, computed_csv_path: str) -> int:
+    report = compare_grades(read_grades_csv(original_csv_path), read_grades_csv(computed_csv_path))
+    number_of_differences = report.write_log(OUTPUT_LOG)
+    report.log_summary()
 
-def writelog(output_log_file_path, index, internal_id, line_number, test_field, computed_grading, hand_grading):
-    with open(output_log_file_path, "a", newline="") as log_file:
-        log_file.write(str(index) + "\n")
-        log_file.write("ID: " + internal_id + "\n")
-        log_file.write("Line Number: " + line_number + "\n")
-        log_file.write("Field Name: " + test_field + "\n")
-        log_file.write("Computed: " + computed_grading + "\n")
-        log_file.write("Hand Graded: " + hand_grading + "\n")
-        log_file.write("\n")
+    print(report.summary().to_string())
+    if number_of_differences:
+        print(number_of_differences, "Differences Found, stored in", OUTPUT_LOG)
+    return number_of_differences
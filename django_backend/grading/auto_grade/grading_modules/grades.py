@@ -0,0 +1,73 @@
+from enum import IntEnum
+
+import numpy as np
+
+
+class Grade(IntEnum):
+
+    # Ordinal of the standard grades, lowest first, so the lowest of several grades is min()
+
+    PR = 0
+    FR = 1
+    GD = 2
+    VG = 3
+    EX = 4
+
+
+PR, FR, GD, VG, EX = map(int, Grade)
+STANDARD_GRADES = tuple(grade.name for grade in Grade)
+
+# Codes for what the grading functions return when there is no standard grade
+NONE = -1  # None (same value as CutGradeTableRegistry.MISSING_CODE)
+BLANK = -2  # ""
+
+# LABELS[code] is the string (or None) for a code, negative codes included
+LABELS = STANDARD_GRADES + ("", None)
+LABEL_ARRAY = np.array(LABELS, dtype=object)
+GRADE_CODES = {grade.name: int(grade) for grade in Grade}
+
+GIRDLES = ("ETN", "VTN", "THN", "MED", "STK", "THK", "VTK", "ETK")
+GIRDLE_INDEX = {girdle: index for index, girdle in enumerate(GIRDLES)}
+# GIRDLE_GRADE_CODES[min girdle, max girdle], NONE where the max girdle is thinner than the min girdle
+GIRDLE_GRADE_CODES = np.array(
+    [
+        [GD, VG, VG, VG, VG, VG, GD, FR],
+        [NONE, VG, VG, VG, VG, VG, GD, FR],
+        [NONE, NONE, EX, EX, EX, VG, GD, FR],
+        [NONE, NONE, NONE, EX, EX, VG, GD, FR],
+        [NONE, NONE, NONE, NONE, EX, VG, GD, FR],
+        [NONE, NONE, NONE, NONE, NONE, VG, GD, FR],
+        [NONE, NONE, NONE, NONE, NONE, NONE, GD, FR],
+        [NONE, NONE, NONE, NONE, NONE, NONE, NONE, FR],
+    ],
+    dtype=np.int8,
+)
+GIRDLE_GRADE_CODES.setflags(write=False)
+
+# DOWNGRADE_CODES[cut, para1, para2]: the cut grade, lowered to one grade above the lowest of the two parameters
+DOWNGRADE_CODES = np.fromfunction(
+    lambda cut, para1, para2: np.minimum(cut, np.minimum(para1, para2) + 1), (len(Grade),) * 3, dtype=np.int8
+)
+DOWNGRADE_CODES.setflags(write=False)
+
+
+def code_of(grade):
+    """
+    Code of a grade string ("", None or a standard grade)
+    :param grade:
+    :return:
+    """
+    if grade is None:
+        return NONE
+    if grade == "":
+        return BLANK
+    return GRADE_CODES[grade]
+
+
+def label_of(code):
+    """
+    Grade string (or None) of a code
+    :param code:
+    :return:
+    """
+    return LABELS[code]
@@ -1,7 +1,10 @@
 import os
 import csv
 
+import pandas as pd
+
 from .grading_modules.all_grading_calculations import *
+from .grading_modules.batch_grading_calculations import AUTO_GRADE_FIELDS, auto_grade_frame
 
 all_grading_calculations = [
     grade_table_size_pct,
@@ -27,3 +30,27 @@ def auto_grade_stone(stone_dict):
         stone_dict.update(calculation(stone_dict=stone_dict))
 
     return stone_dict
+
+
+def grade_chunk(stones):
+    """
+    Auto grade a chunk of stones (runs in the worker processes of regrade_stones, which unpickle it without
+    setting up Django: this module must not import the models)
+    Stones the grading fails for (e.g. angles outside the estimation tables) are left out and reported
+    :param stones: DataFrame with the pk, internal_id and AUTO_GRADE_INPUT_FIELDS of the stones
+    :return: (DataFrame of the pk, internal_id and AUTO_GRADE_FIELDS of the graded stones, {internal_id: error})
+    """
+    columns = ["pk", "internal_id", *AUTO_GRADE_FIELDS]
+    try:
+        return auto_grade_frame(stones)[columns], {}
+    except Exception:
+        pass
+
+    graded, errors = [], {}
+    for stone in stones.to_dict("records"):
+        stone = {field: (None if pd.isna(value) else value) for field, value in stone.items()}
+        try:
+            graded.append(auto_grade_stone(stone))
+        except Exception as error:
+            errors[stone["internal_id"]] = f"{type(error).__name__}: {error}"
+    return pd.DataFrame.from_records(graded, columns=columns), errors
@@ -2,6 +2,11 @@ import sys
 import unittest
 import os
 import csv
+import io
+import json
+from decimal import Decimal
+
+import pandas as pd
 
 from django.conf import settings
 from django.test import TestCase
@@ -9,7 +14,12 @@ from django.test import TestCase
 from grading.models import Stone
 
 # sys.path.append(".")
-from grading.auto_grade.process_csv import auto_grade_stone
+from grading.auto_grade.process_csv import auto_grade_stone, auto_grade_frame
+from grading.auto_grade.grading_modules.all_grading_calculations import (
+    grade_determind_if_cut_needs_downgrade_with_two_parameter,
+    grade_with_girdle_description,
+)
+from grading.auto_grade.grading_modules.check_differences import compare_grades
 
 """
     list of tests: (* done)
@@ -270,3 +280,136 @@ class AutoGradeTest(TestCase):
     #     check if return the number of differences is 0 (Should not have differences)
     #     """
     #     self.assertEqual(self.number_of_differences, 0)
+
+
+class AutoGradeFrameTest(TestCase):
+    def setUp(self):
+        input_file_path = os.path.join(settings.BASE_DIR, "grading", "auto_grade", "tests", "test_input_file.csv")
+        with open(input_file_path, "r") as file:
+            self.csv_stones = list(csv.DictReader(file))
+
+        # the same stones as a queryset would give them: Decimals for the measurements, None when missing
+        self.stones = []
+        for csv_stone in self.csv_stones:
+            stone = {field: (value or None) for field, value in csv_stone.items()}
+            for field in stone:
+                if field.endswith("_rounded") and stone[field] is not None:
+                    stone[field] = Decimal(stone[field])
+            self.stones.append(stone)
+        self.stones[0]["star_length_rounded"] = None
+        self.stones[1]["girdle_max_grade"] = None
+        self.stones[2]["crown_height_rounded"] = Decimal("0")
+
+    def assert_frame_matches_auto_grade_stone(self, stones):
+        graded_frame = auto_grade_frame(pd.DataFrame.from_records(stones))
+
+        for row, stone in enumerate(stones):
+            graded_stone = auto_grade_stone(dict(stone))
+            for field, value in graded_stone.items():
+                if field.startswith("auto"):
+                    self.assertEqual(graded_frame[field].iloc[row], value, f"stone {row}: {field}")
+
+    def test_frame_matches_auto_grade_stone_for_csv_values(self):
+        self.assert_frame_matches_auto_grade_stone(self.csv_stones)
+
+    def test_frame_matches_auto_grade_stone_for_model_values(self):
+        self.assert_frame_matches_auto_grade_stone(self.stones)
+
+    def test_frame_raises_like_auto_grade_stone(self):
+        self.stones[0]["crown_angle_rounded"] = Decimal("34.3")
+
+        with self.assertRaises(ValueError):
+            auto_grade_stone(dict(self.stones[0]))
+
+        with self.assertRaises(ValueError):
+            auto_grade_frame(pd.DataFrame.from_records(self.stones))
+
+
+class GradeCodesTest(TestCase):
+    def test_downgrade_lowers_cut_to_one_grade_above_lowest_parameter(self):
+        """
+        input(cut, para1, para2)        output
+        EX, VG, GD                      VG
+        EX, EXCELLENT, VG               EX
+        GD, PR, EX                      FR
+        FR, EX, EX                      FR
+        VG, xx, EX                      ''
+        """
+        cases = [
+            (("EX", "VG", "GD"), "VG"),
+            (("EX", "EXCELLENT", "VG"), "EX"),
+            (("GD", "PR", "EX"), "FR"),
+            (("FR", "EX", "EX"), "FR"),
+            (("VG", "xx", "EX"), ""),
+        ]
+        for (cut, para1, para2), expected_output in cases:
+            self.assertEqual(
+                grade_determind_if_cut_needs_downgrade_with_two_parameter(cut, para1, para2), expected_output
+            )
+
+    def test_girdle_thinner_max_than_min_raises_key_error(self):
+        self.assertEqual(grade_with_girdle_description("etn to vtn", "MED"), "VG")
+        with self.assertRaises(KeyError):
+            grade_with_girdle_description("THK", "MED")
+        with self.assertRaises(KeyError):
+            grade_with_girdle_description("med", "THK")
+
+
+class DiscrepancyReportTest(TestCase):
+    def setUp(self):
+        field_map = {"girdle_grade": "auto_girdle_grade", "final_sarine_cut": "auto_final_sarine_cut_grade"}
+        hand_graded = pd.DataFrame(
+            {
+                "internal_id": ["1", "2", "3", "4", "5"],
+                "remarks": ["", "", "rej", "", ""],
+                "girdle_grade": ["EX", "VG", "PR", "GD", ""],
+                "final_sarine_cut": ["EX", "EX", "EX", "VG", "GD"],
+            }
+        )
+        computed = pd.DataFrame(
+            {
+                "internal_id": [6, 4, 3, 2, 1],
+                "auto_girdle_grade": ["EX", "GD", "EX", "VG", "EX"],
+                "auto_final_sarine_cut_grade": ["EX", "VG", "EX", "VG", None],
+            }
+        )
+        self.report = compare_grades(hand_graded, computed, field_map)
+
+    def test_joins_on_internal_id_skipping_rejected_stones(self):
+        self.assertEqual(self.report.unmatched_hand_graded, [5])
+        self.assertEqual(self.report.unmatched_computed, [3, 6])
+
+        differences = self.report.differences
+        self.assertEqual(
+            list(zip(differences["internal_id"], differences["field"], differences["computed"])),
+            [(1, "final_sarine_cut", ""), (2, "final_sarine_cut", "VG")],
+        )
+
+    def test_summary_and_confusion_matrix(self):
+        summary = self.report.summary()
+        self.assertEqual(list(summary.index), ["girdle_grade", "final_sarine_cut"])
+        self.assertEqual(list(summary["compared"]), [3, 3])
+        self.assertEqual(list(summary["differences"]), [0, 2])
+        self.assertEqual(list(summary["computed_missing"]), [0, 1])
+        self.assertAlmostEqual(summary.loc["final_sarine_cut", "agreement"], 1 / 3)
+
+        matrix = self.report.confusion_matrices()["final_sarine_cut"]
+        self.assertEqual(list(matrix.index), ["EX", "VG"])
+        self.assertEqual(list(matrix.columns), ["VG", ""])
+        self.assertEqual(matrix.loc["EX"].tolist(), [1, 1])
+        self.assertEqual(matrix.loc["VG"].tolist(), [1, 0])
+
+    def test_write_log_writes_a_json_line_per_difference(self):
+        log = io.StringIO()
+        self.assertEqual(self.report.write_log(log), 2)
+        records = [json.loads(line) for line in log.getvalue().splitlines()]
+        self.assertEqual(
+            records[1],
+            {
+                "internal_id": 2,
+                "field": "final_sarine_cut",
+                "computed_field": "auto_final_sarine_cut_grade",
+                "hand_graded": "EX",
+                "computed": "VG",
+            },
+        )
@@ -1,16 +1,22 @@
+import functools
 import os
 
+import numpy as np
 import pandas as pd
 
 from django import forms
 from django.forms import ModelForm
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.utils import IntegrityError
+from django.utils import timezone
 from django.utils.timezone import utc
 from django.utils.datetime_safe import datetime
 from django.forms.models import model_to_dict
 
 from ownerships.models import ParcelTransfer, StoneTransfer
+from ownerships.system_users import SYSTEM_USERS
 
 from stonegrading.grades import (
     GirdleGrades,
@@ -29,9 +35,11 @@ from stonegrading.mixins import (
     GWGradingAdjustMixin,
     GIAGradingMixin,
 )
-from stonegrading.models import Inclusion
 
 from .models import Parcel, Stone, Split, GiaVerification, GoldwayVerification
+from .row_validator import RowValidator
+from .upload_timing import UploadTimings
+from .inclusion_cache import INCLUSIONS
 from grading.auto_grade.process_csv import auto_grade_stone
 
 User = get_user_model()
@@ -96,9 +104,27 @@ class UploadFormMetaClass(type(forms.Form)):
 
         setattr(clsobj, "processing_methods", processing_methods)
 
+        if "save" in clsdict:
+            setattr(clsobj, "save", timed_save(clsdict["save"]))
+
         return clsobj
 
 
+def timed_save(save):
+    """
+    Wrap the save method of an upload form to record it as the `save` stage of the form's timings
+    :param save:
+    :return:
+    """
+
+    @functools.wraps(save)
+    def wrapper(self, *args, **kwargs):
+        with self.timings.stage("save", rows=len(self.cleaned_data)):
+            return save(self, *args, **kwargs)
+
+    return wrapper
+
+
 def get_error_headers(error_dict):
     """
     Returns a list of headers given a dict
@@ -114,6 +140,146 @@ def get_error_headers(error_dict):
     return error_headers
 
 
+# display name to db name maps used to clean the uploaded csv values
+GENERAL_GRADES_DB_NAMES = {key.upper(): value for (value, key) in GeneralGrades.CHOICES}
+FLUORESCENCE_DB_NAMES = {key: value for (value, key) in FluorescenceGrades.CHOICES}
+GIRDLE_CONDITION_DB_NAMES = {key.upper(): value for (value, key) in GirdleCondition.CHOICES}
+CULET_DB_NAMES = {key.upper(): value for (value, key) in CuletGrades.CHOICES}
+CULET_CHARACTERISTICS_DB_NAMES = {key.upper(): value for (value, key) in CuletCharacteristics.CHOICES}
+CULET_CHARACTERISTICS_DB_NAMES.update({"SL ABR": "SAB", "V SL ABR": "VSAB"})
+
+# uploaded values made uppercase
+CAPS_FIELDS = (
+    "basic_diamond_description",
+    "basic_girdle_condition_1",
+    "basic_girdle_condition_2",
+    "basic_girdle_condition_3",
+    "basic_girdle_condition_final",
+    "culet_size_description",
+)
+
+
+def clean_column(column, cleaners):
+    """
+    Returns an array of the column values passed through `cleaners` in order. The cleaners run once per
+    distinct value of the column, missing values are cleaned as None
+    :param column: pandas Series
+    :param cleaners:
+    :return:
+    """
+    codes, uniques = pd.factorize(column.astype(object))
+
+    # the last item is for missing values, their code is -1
+    cleaned_values = np.empty(len(uniques) + 1, dtype=object)
+    for index, value in enumerate(list(uniques) + [None]):
+        for cleaner in cleaners:
+            value = cleaner(value)
+        cleaned_values[index] = value
+
+    return cleaned_values[codes]
+
+
+# number of stones written per UPDATE statement when an upload is saved
+BULK_UPDATE_BATCH_SIZE = 500
+
+
+def get_stones_by(field_name, stone_data):
+    """
+    Returns the stones of the upload as a dict of `field_name` value: stone, loaded with a single query
+    :param field_name: a unique stone field, internal_id or external_id
+    :param stone_data:
+    :return:
+    """
+    return Stone.objects.in_bulk([data[field_name] for data in stone_data], field_name=field_name)
+
+
+def bulk_update_stones(stones, fields):
+    """
+    Saves `fields` of the stones with bulk_update, BULK_UPDATE_BATCH_SIZE stones at a time.
+    Like save(), attributes which are not stone fields are ignored and modified_date is updated
+    :param stones:
+    :param fields:
+    :return:
+    """
+    modified_date = timezone.now()
+    for stone in stones:
+        stone.modified_date = modified_date
+
+    stone_fields = {field.name for field in Stone._meta.concrete_fields}
+    fields = [field for field in dict.fromkeys(fields) if field in stone_fields] + ["modified_date"]
+    Stone.objects.bulk_update(stones, fields, batch_size=BULK_UPDATE_BATCH_SIZE)
+
+
+def bulk_add_inclusions(stone_inclusions):
+    """
+    Adds inclusions to the stones with a single bulk_create per through table.
+    Inclusions a stone already has are ignored, like m2m add() does
+    :param stone_inclusions: list of (stone, many to many field name, inclusions)
+    :return:
+    """
+    through_rows = {}
+    for stone, field_name, inclusions in stone_inclusions:
+        field = Stone._meta.get_field(field_name)
+        through = field.remote_field.through
+        rows = through_rows.setdefault(through, {})
+        for inclusion in inclusions:
+            rows[(stone.pk, inclusion.pk)] = through(
+                **{f"{field.m2m_field_name()}_id": stone.pk, f"{field.m2m_reverse_field_name()}_id": inclusion.pk}
+            )
+
+    for through, rows in through_rows.items():
+        through.objects.bulk_create(rows.values(), batch_size=BULK_UPDATE_BATCH_SIZE, ignore_conflicts=True)
+
+
+class GraderResolver:
+
+    # Resolves the grader usernames of an upload to users, each distinct username once and the
+    # usernames not seen yet in a single query. A form keeps one for its upload (its request)
+
+    def __init__(self):
+        self.users = {}
+
+    def get_users(self, usernames):
+        """
+        Returns a dict of username: user (None when there is no such user) for the (lowercased) usernames
+        :param usernames:
+        :return:
+        """
+        usernames = {str(username).lower() for username in usernames}
+        missing = usernames.difference(self.users)
+        if missing:
+            found = User.objects.in_bulk(missing, field_name="username")
+            for username in missing:
+                self.users[username] = found.get(username)
+
+        return {username: self.users[username] for username in usernames}
+
+    def resolve(self, stone_data, grader_fields):
+        """
+        Replace the grader usernames of stone_data by their user
+        :param stone_data:
+        :param grader_fields:
+        :return: errors, {row: {field: error}} with every unknown grader of the upload
+        """
+        users = self.get_users(
+            data[field] for data in stone_data for field in grader_fields if data.get(field) is not None
+        )
+
+        errors = {}
+        for row, data in enumerate(stone_data):
+            for field in grader_fields:
+                value = data.get(field)
+                if value is None:
+                    continue
+                user = users[str(value).lower()]
+                if user is None:
+                    errors.setdefault(row, {})[field] = f"Grader user `{value}` account does not exist"
+                else:
+                    data[field] = user
+
+        return errors
+
+
 class BaseUploadForm(forms.Form, metaclass=UploadFormMetaClass):
     file = forms.FileField()
 
@@ -123,6 +289,8 @@ class BaseUploadForm(forms.Form, metaclass=UploadFormMetaClass):
 
     def __init__(self, *args, **kwargs):
         super(BaseUploadForm, self).__init__(*args, **kwargs)
+        self.timings = UploadTimings(type(self).__name__)
+        self.grader_resolver = GraderResolver()
 
         if not hasattr(self, "Meta"):
             raise ValueError("You need to define a class `Meta` for extra data")
@@ -163,6 +331,7 @@ class BaseUploadForm(forms.Form, metaclass=UploadFormMetaClass):
         :return:
         """
         is_new = self.new
+        upload_form = self
 
         class StoneDataForm(forms.ModelForm):
             internal_id = forms.IntegerField()
@@ -177,10 +346,7 @@ class BaseUploadForm(forms.Form, metaclass=UploadFormMetaClass):
                 :return:
                 """
                 internal_id = self.cleaned_data["internal_id"]
-                try:
-                    stone = Stone.objects.get(internal_id=internal_id)
-                except Stone.DoesNotExist:
-                    stone = None
+                stone = upload_form.get_stone(internal_id)
 
                 if is_new and stone is not None:
                     raise ValidationError(f"Stone with internal id: {internal_id} already exist")
@@ -218,22 +384,41 @@ class BaseUploadForm(forms.Form, metaclass=UploadFormMetaClass):
     def stone_data(self):
         return self.__stone_data
 
+    def get_stone(self, internal_id):
+        """
+        Returns the stone with `internal_id` from the stone index of the upload, or None if it does not exist
+        :param internal_id:
+        :return:
+        """
+        try:
+            return self.stone_index.get(int(internal_id))
+        except (TypeError, ValueError):
+            return None
+
+    def __build_stone_index(self, stone_data):
+        """
+        Loads the stones of the upload with a single query and returns them as a dict of internal_id: stone
+        :param stone_data:
+        :return:
+        """
+        internal_ids = set()
+        for data in stone_data:
+            try:
+                internal_ids.add(int(data["internal_id"]))
+            except (TypeError, ValueError):
+                pass
+
+        return Stone.objects.in_bulk(internal_ids, field_name="internal_id")
+
     def __build_error_dict(self, data):
         """
-        Create a form instance and return form errors if it exists
+        Validate every row with StoneDataForm's fields and return the errors (same as the form's) of the invalid rows
         :param data:
         :return:
         """
-        errors = {}
-        for row, _dt in enumerate(data):
-            form = self.StoneDataForm(_dt)
-            if not form.is_valid():
-                errors[row] = form.errors
+        return RowValidator(self.StoneDataForm).errors(data)
 
-        return errors
-
-    def __to_db_name_grades(self, data):
-        # cleaning for grades
+    def __get_grade_fields(self):
         grade_fields = [field for field in self.all_fields if "grade" in field] + [
             "sarine_cut_pre_polish_symmetry",
             "sarine_symmetry",
@@ -242,199 +427,147 @@ class BaseUploadForm(forms.Form, metaclass=UploadFormMetaClass):
             if field in grade_fields:
                 grade_fields.remove(field)
 
-        choices_display_name_map = {key.upper(): value for (value, key) in GeneralGrades.CHOICES}
-
-        for field in grade_fields:
-            if data.get(field) is not None:
-                try:
-                    data[field] = choices_display_name_map.get(data[field].upper().strip()) or data[field].strip()
-                except:
-                    data[field] = data[field]
-
-        return data
-
-    def __to_db_name_fluorescence(self, data):
-        fluorescence_choices_map = {key: value for (value, key) in FluorescenceGrades.CHOICES}
-        for field, value in data.items():
-            if "fluorescence" in field:
-                data[field] = fluorescence_choices_map[value] if value in fluorescence_choices_map else value
-
-        return data
-
-    def __to_db_name_inclusions(self, data):
-        for field, value in data.items():
-            if "inclusion" in field:
-                inclusions = [value.strip() for value in value.split(",")] if value is not None else []
-
-                try:
-                    data[field] = [Inclusion.objects.get(inclusion=inclusion) for inclusion in inclusions]
-                except Inclusion.DoesNotExist:
-                    pass
-
-        return data
-
-    def __to_db_name_culet_characteristics(self, data):
-        culet_characteristics_choices_map = {key.upper(): value for (value, key) in CuletCharacteristics.CHOICES}
-        culet_characteristics_choices_map.update({"SL ABR": "SAB", "V SL ABR": "VSAB"})
-        for field, value in data.items():
-            if value is not None:
-                if "culet_characteristic" in field:
-                    data[field] = (
-                        culet_characteristics_choices_map[value.upper().strip()]
-                        if value.upper() in culet_characteristics_choices_map
-                        else value
-                    )
-
-        return data
-
-    def __make_caps(self, data):
-        # Make uppercase
-        fields = (
-            "basic_diamond_description",
-            "basic_girdle_condition_1",
-            "basic_girdle_condition_2",
-            "basic_girdle_condition_3",
-            "basic_girdle_condition_final",
-            "culet_size_description",
-        )
+        return grade_fields
 
-        for field in fields:
-            if field in data:
-                if data[field] is not None:
-                    data[field] = data[field].upper().strip()
-
-        return data
-
-    def __to_db_name_girdles(self, data):
-        girdle_conditions_choices_map = {key.upper(): value for (value, key) in GirdleCondition.CHOICES}
-        for field, value in data.items():
-            if "girdle_condition" in field:
-                data[field] = (
-                    girdle_conditions_choices_map[value.upper()] if value in girdle_conditions_choices_map else value
-                )
-
-        return data
-
-    def __to_db_name_culet_descriptions(self, data):
-        culet_choices_display_map = {key.upper(): value for (value, key) in CuletGrades.CHOICES}
-
-        if "culet_size_description" in data:
-            if data["culet_size_description"] is not None:
-                data["culet_size_description"] = "/".join(
-                    [
-                        culet_choices_display_map.get(size.strip())
-                        for size in data["culet_size_description"].split("/")
-                    ]
-                )
-
-        return data
-
-    def __clean_date_fields(self, data):
-        # Clean date fields
-        for field in data:
-            if "date" in field:
-                try:
-                    day, month, year = [int(value) for value in data[field].split("/")]
-                    data[field] = datetime(year, month, day)
-                except:
-                    pass
-        return data
-
-    def __to_db_name(self, data):
+    def __get_value_cleaners(self, field, grade_fields):
         """
-        Change from display name to db name
+        Returns the cleaners the values of the `field` column go through, in the order they are applied
+        :param field:
+        :param grade_fields:
         :return:
         """
-        data = data.copy()
+        cleaners = [self.__strip]
+
+        # Change from display name to db name
+        if field in CAPS_FIELDS:
+            cleaners.append(self.__make_caps)
+        if field in grade_fields:
+            cleaners.append(self.__to_db_name_grade)
+        if "fluorescence" in field:
+            cleaners.append(self.__to_db_name_fluorescence)
+        if "inclusion" in field:
+            cleaners.append(self.__to_db_name_inclusions)
+        if "girdle_condition" in field:
+            cleaners.append(self.__to_db_name_girdle)
+        if field == "culet_size_description":
+            cleaners.append(self.__to_db_name_culet_description)
+        if "culet_characteristic" in field:
+            cleaners.append(self.__to_db_name_culet_characteristic)
+
+        if "date" in field:
+            cleaners.append(self.__clean_date)
+        if field == "height":
+            cleaners.append(self.__clean_height)
+        if "girdle_min_grade" in field or "girdle_max_grade" in field:
+            cleaners.append(self.__clean_girdle)
+        if "remarks" in field:
+            cleaners.append(self.__clean_remarks)
+        if "weight" in field:
+            cleaners.append(self.__clean_weight)
+        if field == "basic_carat":
+            cleaners.append(self.__clean_carat)
+
+        return cleaners
+
+    def __strip(self, value):
+        return value.strip() if isinstance(value, str) else value
+
+    def __make_caps(self, value):
+        return value.upper().strip() if value is not None else value
+
+    def __to_db_name_grade(self, value):
+        if value is None:
+            return value
+        try:
+            return GENERAL_GRADES_DB_NAMES.get(value.upper().strip()) or value.strip()
+        except:
+            return value
 
-        cleaners = (
-            self.__make_caps,
-            self.__to_db_name_grades,
-            self.__to_db_name_fluorescence,
-            self.__to_db_name_inclusions,
-            self.__to_db_name_girdles,
-            self.__to_db_name_culet_descriptions,
-            self.__to_db_name_culet_characteristics,
-        )
-        for cleaner in cleaners:
-            data = cleaner(data)
+    def __to_db_name_fluorescence(self, value):
+        return FLUORESCENCE_DB_NAMES[value] if value in FLUORESCENCE_DB_NAMES else value
 
-        return data
+    def __to_db_name_inclusions(self, value):
+        inclusions = [value.strip() for value in value.split(",")] if value is not None else []
 
-    def __clean_heights(self, data):
+        found = INCLUSIONS.get_inclusions(inclusions)
         try:
-            if "height" in data:
-                if data["height"] is not None:
-                    data["height"] = round(float(data["height"]), 2)
+            return [found[inclusion] for inclusion in inclusions]
+        except KeyError:
+            return value
+
+    def __to_db_name_girdle(self, value):
+        return GIRDLE_CONDITION_DB_NAMES[value.upper()] if value in GIRDLE_CONDITION_DB_NAMES else value
+
+    def __to_db_name_culet_description(self, value):
+        if value is None:
+            return value
+        return "/".join([CULET_DB_NAMES.get(size.strip()) for size in value.split("/")])
+
+    def __to_db_name_culet_characteristic(self, value):
+        if value is None:
+            return value
+        if value.upper() in CULET_CHARACTERISTICS_DB_NAMES:
+            return CULET_CHARACTERISTICS_DB_NAMES[value.upper().strip()]
+        return value
+
+    def __clean_date(self, value):
+        try:
+            day, month, year = [int(value) for value in value.split("/")]
+            return datetime(year, month, day)
+        except:
+            return value
+
+    def __clean_height(self, value):
+        try:
+            if value is not None:
+                return round(float(value), 2)
         except ValueError:
             pass
 
-        return data
+        return value
 
-    def __clean_carats(self, data):
+    def __clean_carat(self, value):
         try:
-            if "basic_carat" in data:
-                if data["basic_carat"] is not None:
-                    data["basic_carat"] = round(float(data["basic_carat"]), 5)
+            if value is not None:
+                return round(float(value), 5)
         except ValueError:
             pass
 
-        return data
+        return value
 
-    def __clean_girdles(self, data):
-        girdle_grades = [grade for grade in data if "girdle_min_grade" in grade or "girdle_max_grade" in grade]
+    def __clean_girdle(self, value):
+        return value.upper() if type(value) == str else value
 
-        for girdle_grade in girdle_grades:
-            data[girdle_grade] = (
-                data[girdle_grade].upper() if type(data[girdle_grade]) == str else data[girdle_grade]
-            )
-
-        return data
-
-    def __clean_remarks(self, data):
-        for field in data:
-            if "remarks" in field:
-                data[field] = "" if data[field] is None else data[field]
+    def __clean_remarks(self, value):
+        return "" if value is None else value
 
-        return data
-
-    def __clean_weights(self, data):
+    def __clean_weight(self, value):
         """
-        Cleans weight fields (rounding to 6 decimal places)
-        :param data:
+        Cleans weight values (rounding to 5 decimal places)
+        :param value:
         :return:
         """
-        for field, value in data.items():
-            if "weight" in field:
-                data[field] = float("%.5f" % value) if isinstance(value, float) or isinstance(value, int) else value
-
-        return data
+        return float("%.5f" % value) if isinstance(value, float) or isinstance(value, int) else value
 
     def __process_csv_content(self, csv_file):
         """
-        Do some processing and return data
+        Do some processing and return data. Every column is cleaned as a whole, each distinct value once
         :param csv_file:
         :returns:
         """
-        data_frame = pd.read_csv(csv_file)
-        data_frame = data_frame.rename(str.strip, axis="columns")
-        data_frame = data_frame.applymap(lambda x: x.strip() if isinstance(x, str) else x)
-        data_frame = pd.DataFrame(data_frame, columns=self.all_fields)
-        stone_data = [dict(zip(self.all_fields, data)) for data in data_frame.values]
-
-        for data in stone_data:
-            for column in data:
-                if pd.isna(data[column]):
-                    data[column] = None
-
-        stone_data = [self.__to_db_name(data) for data in stone_data]
-
-        stone_data = [self.__clean_date_fields(data) for data in stone_data]
-        stone_data = [self.__clean_heights(data) for data in stone_data]
-        stone_data = [self.__clean_girdles(data) for data in stone_data]
-        stone_data = [self.__clean_remarks(data) for data in stone_data]
-        stone_data = [self.__clean_weights(data) for data in stone_data]
-        stone_data = [self.__clean_carats(data) for data in stone_data]
+        with self.timings.stage("read_csv") as stage:
+            data_frame = pd.read_csv(csv_file)
+            data_frame = data_frame.rename(str.strip, axis="columns")
+            data_frame = pd.DataFrame(data_frame, columns=self.all_fields)
+            stage["rows"] = len(data_frame)
+
+        with self.timings.stage("clean_columns", rows=len(data_frame)):
+            grade_fields = self.__get_grade_fields()
+            columns = [
+                clean_column(data_frame[field], self.__get_value_cleaners(field, grade_fields))
+                for field in self.all_fields
+            ]
+            stone_data = [dict(zip(self.all_fields, data)) for data in zip(*columns)]
 
         self.__stone_data = stone_data
 
@@ -482,12 +615,15 @@ class BaseUploadForm(forms.Form, metaclass=UploadFormMetaClass):
         cleaned_data = super().clean()
         csv_file = cleaned_data["file"]
         stone_data = self.__process_csv_content(csv_file)
+        with self.timings.stage("stone_index", rows=len(stone_data)):
+            self.stone_index = self.__build_stone_index(stone_data)
         csv_processing_methods = self.__get_all_data_processing_methods()
 
         method_errors = {}
 
         for method in csv_processing_methods:
-            stone_data, errors = method(self, stone_data, file_name=csv_file.name)
+            with self.timings.stage(method.__name__.lstrip("_"), rows=len(stone_data)):
+                stone_data, errors = method(self, stone_data, file_name=csv_file.name)
             method_errors.update(errors)
 
         if "file" in method_errors:
@@ -496,7 +632,8 @@ class BaseUploadForm(forms.Form, metaclass=UploadFormMetaClass):
 
         # Do error handling here and return error_dict
 
-        form_errors = self.__build_error_dict(stone_data)
+        with self.timings.stage("validate_rows", rows=len(stone_data)):
+            form_errors = self.__build_error_dict(stone_data)
 
         for row, error_dict in method_errors.items():
             for field, error in error_dict.items():
@@ -566,13 +703,13 @@ class SarineUploadForm(BaseUploadForm):
             parcel_transfer = ParcelTransfer.most_recent_transfer(self.parcel)
 
             if parcel_transfer is None:
-                parcel_owner = User.objects.get(username="split")
+                parcel_owner = SYSTEM_USERS.split
             else:
                 parcel_owner = parcel_transfer.to_user
 
             StoneTransfer.objects.create(
                 item=stone,
-                from_user=User.objects.get(username="split"),
+                from_user=SYSTEM_USERS.split,
                 created_by=self.user,
                 to_user=parcel_owner,
                 confirmed_date=datetime.utcnow().replace(tzinfo=utc),
@@ -602,19 +739,8 @@ class BasicUploadForm(BaseUploadForm):
         :return:
         """
 
-        errors = {}
-
-        for row, data in enumerate(stone_data):
-            for field, value in data.items():
-                if "basic_grader_" in field:
-                    try:
-                        if value is not None:
-                            data[field] = User.objects.get(username=value.lower())
-                    except User.DoesNotExist:
-                        errors[row] = {}
-                        errors[row][field] = f"Grader user `{value}` account does not exist"
-
-        return stone_data, errors
+        grader_fields = [field for field in self.all_fields if "basic_grader_" in field]
+        return stone_data, self.grader_resolver.resolve(stone_data, grader_fields)
 
     def __process_stone_upload(self, stone_data, file_name):
         """
@@ -624,8 +750,8 @@ class BasicUploadForm(BaseUploadForm):
         errors = {}
         for row, data in enumerate(stone_data):
 
-            stone = Stone.objects.get(internal_id=data["internal_id"])
-            if stone.is_basic_grading_complete:
+            stone = self.get_stone(data["internal_id"])
+            if stone is not None and stone.is_basic_grading_complete:
                 errors[row] = {}
                 errors[row][
                     "internal_id"
@@ -634,45 +760,53 @@ class BasicUploadForm(BaseUploadForm):
         return stone_data, errors
 
     def save(self):
+        inclusions_fields = (
+            "basic_inclusions_1",
+            "basic_inclusions_2",
+            "basic_inclusions_3",
+            "basic_inclusions_final",
+        )
+        auto_grade_fields = [field.name for field in Stone._meta.concrete_fields if field.name.startswith("auto")]
+        many_to_many_fields = [field.name for field in Stone._meta.many_to_many]
+
+        stone_index = get_stones_by("internal_id", self.cleaned_data)
+
         stones = []
+        stone_inclusions = []
+        updated_fields = {"external_id", *auto_grade_fields}
         for data in self.cleaned_data:
 
-            stone = Stone.objects.get(internal_id=data["internal_id"])  # After resolving the id stuff
-
-            inclusions_fields = (
-                "basic_inclusions_1",
-                "basic_inclusions_2",
-                "basic_inclusions_3",
-                "basic_inclusions_final",
-            )
+            stone = stone_index[data["internal_id"]]  # After resolving the id stuff
 
             savable_data = data.copy()
 
             for field in inclusions_fields:
-                inclusions = data[field]
-                stone_inclusions = getattr(stone, field)
-
-                for inclusion in inclusions:
-                    stone_inclusions.add(inclusion)
-
+                stone_inclusions.append((stone, field, data[field]))
                 del savable_data[field]
 
             for field, value in savable_data.items():
                 setattr(stone, field, value)
+            updated_fields.update(savable_data)
 
-            stone.generate_basic_external_id()
-            stone.save()
+            stone.generate_basic_external_id(save=False)
 
             # Perform auto_grading here
-            stone_dict = model_to_dict(stone)
+            stone_dict = model_to_dict(stone, exclude=many_to_many_fields)
             auto_graded_stone_dict = auto_grade_stone(stone_dict)
             for field, value in auto_graded_stone_dict.items():
                 if field.startswith("auto"):
                     setattr(stone, field, value)
-            stone.save()
 
             stones.append(stone)
 
+        updated_fields.discard("internal_id")
+        with transaction.atomic():
+            bulk_add_inclusions(stone_inclusions)
+            try:
+                bulk_update_stones(stones, sorted(updated_fields))
+            except IntegrityError:
+                raise IntegrityError("External Id already exists")
+
         return stones
 
 
@@ -710,8 +844,8 @@ class GWGradingUploadForm(BaseUploadForm):
         errors = {}
         for row, data in enumerate(stone_data):
 
-            stone = Stone.objects.get(internal_id=data["internal_id"])
-            if stone.is_goldway_grading_complete:
+            stone = self.get_stone(data["internal_id"])
+            if stone is not None and stone.is_goldway_grading_complete:
                 errors[row] = {}
                 errors[row][
                     "internal_id"
@@ -725,33 +859,33 @@ class GWGradingUploadForm(BaseUploadForm):
         :returns:
         """
         stones = []
-        for data in self.cleaned_data:
-            stone_data = data.copy()
+        with transaction.atomic():
+            for data in self.cleaned_data:
+                stone_data = data.copy()
 
-            gw_code = stone_data["goldway_code"]
-            del stone_data["goldway_code"]
+                gw_code = stone_data["goldway_code"]
+                del stone_data["goldway_code"]
 
-            stone = Stone.objects.get(internal_id=data["internal_id"])
-            for field, value in stone_data.items():
-                setattr(stone, field, value)
+                stone = Stone.objects.get(internal_id=data["internal_id"])
+                for field, value in stone_data.items():
+                    setattr(stone, field, value)
 
-            try:
-                goldway_verification = GoldwayVerification.objects.get(invoice_number=gw_code)
-            except GoldwayVerification.DoesNotExist:
-                goldway_verification = GoldwayVerification.objects.create(invoice_number=gw_code)
+                try:
+                    goldway_verification = GoldwayVerification.objects.get(invoice_number=gw_code)
+                except GoldwayVerification.DoesNotExist:
+                    goldway_verification = GoldwayVerification.objects.create(invoice_number=gw_code)
 
-            stone.gw_verification = goldway_verification
-            stone.save()
+                stone.gw_verification = goldway_verification
+                stone.save()
+                stones.append(stone)
 
             # Transfer to vault
-            goldway = User.objects.get(username="goldway")
-            vault = User.objects.get(username="vault")
-
-            StoneTransfer.initiate_transfer(item=stone, from_user=goldway, to_user=vault, created_by=self.user)
+            StoneTransfer.bulk_initiate_transfer(
+                stones, from_user=SYSTEM_USERS.goldway, to_user=SYSTEM_USERS.vault, created_by=self.user
+            )
 
             # TODO: Remove Confirm stone received temporal
-            StoneTransfer.confirm_received(item=stone)
-            stones.append(stone)
+            StoneTransfer.bulk_confirm_received(stones)
 
         return stones
 
@@ -766,8 +900,8 @@ class GWAdjustingUploadForm(BaseUploadForm):
         """
         errors = {}
         for row, data in enumerate(stone_data):
-            stone = Stone.objects.get(internal_id=data["internal_id"])
-            if stone.is_goldway_adjusting_grading_complete:
+            stone = self.get_stone(data["internal_id"])
+            if stone is not None and stone.is_goldway_adjusting_grading_complete:
                 errors[row] = {}
                 errors[row][
                     "internal_id"
@@ -782,39 +916,32 @@ class GWAdjustingUploadForm(BaseUploadForm):
         Conditions
         ----------
         1. basic_grading_1, basic_grading_2, basic_grading_3 ===> Not required
-        2. Raise error instantly when any of them contains a user that does not exist
+        2. Every grader user that does not exist is reported, looked up in a single query
         :param stone_data:
         :param file_name:
         :return:
         """
 
-        errors = {}
-
-        for row, data in enumerate(stone_data):
-            for field, value in data.items():
-                if "_grader_" in field and value is not None:
-                    try:
-                        if value is not None:
-                            data[field] = User.objects.get(username=value.lower())
-                    except User.DoesNotExist:
-                        errors[row] = {}
-                        errors[row][field] = f"Grader user `{value}` account does not exist"
-
-        return stone_data, errors
+        grader_fields = [field for field in self.all_fields if "_grader_" in field]
+        return stone_data, self.grader_resolver.resolve(stone_data, grader_fields)
 
     def save(self):
         """
         Updates stones with the results from GWGradingAdjust stage
         :return:
         """
+        stone_index = get_stones_by("internal_id", self.cleaned_data)
+
         stones = []
         for data in self.cleaned_data:
-            stone = Stone.objects.get(internal_id=data["internal_id"])
+            stone = stone_index[data["internal_id"]]
             for field, value in data.items():
                 setattr(stone, field, value)
-            stone.save()
             stones.append(stone)
 
+        with transaction.atomic():
+            bulk_update_stones(stones, [field for field in self.all_fields if field != "internal_id"])
+
         return stones
 
 
@@ -830,8 +957,8 @@ class GIAAdjustingUploadForm(BaseUploadForm):
         errors = {}
         for row, data in enumerate(stone_data):
 
-            stone = Stone.objects.get(internal_id=data["internal_id"])
-            if stone.is_gia_adjusting_grading_complete:
+            stone = self.get_stone(data["internal_id"])
+            if stone is not None and stone.is_gia_adjusting_grading_complete:
                 errors[row] = {}
                 errors[row][
                     "internal_id"
@@ -844,15 +971,19 @@ class GIAAdjustingUploadForm(BaseUploadForm):
         Updates stones with the results from GWGradingAdjust stage
         :return:
         """
+        stone_index = get_stones_by("internal_id", self.cleaned_data)
+
         stones = []
         for data in self.cleaned_data:
-            stone = Stone.objects.get(internal_id=data["internal_id"])
+            stone = stone_index[data["internal_id"]]
             for field, value in data.items():
                 setattr(stone, field, value)
 
-            stone.save()
             stones.append(stone)
 
+        with transaction.atomic():
+            bulk_update_stones(stones, [field for field in self.all_fields if field != "internal_id"])
+
         return stones
 
     def __process_graders(self, stone_data, file_name):
@@ -862,24 +993,13 @@ class GIAAdjustingUploadForm(BaseUploadForm):
         Conditions
         ----------
         1. basic_grading_1, basic_grading_2, basic_grading_3 ===> Not required
-        2. Raise error instantly when any of them contains a user that does not exist
+        2. Every grader user that does not exist is reported, looked up in a single query
         :param stone_data:
         :param file_name:
         :return:
         """
-        errors = {}
-
-        for row, data in enumerate(stone_data):
-            for field, value in data.items():
-                if "_grader_" in field:
-                    try:
-                        if value is not None:
-                            data[field] = User.objects.get(username=value.lower())
-                    except User.DoesNotExist:
-                        errors[row] = {}
-                        errors[row][field] = f"Grader user `{value}` account does not exist"
-
-        return stone_data, errors
+        grader_fields = [field for field in self.all_fields if "_grader_" in field]
+        return stone_data, self.grader_resolver.resolve(stone_data, grader_fields)
 
 
 class GIAUploadForm(BaseUploadForm):
@@ -898,27 +1018,29 @@ class GIAUploadForm(BaseUploadForm):
         """
         stones = []
 
-        for data in self.cleaned_data:
-            stone_data = data.copy()
+        with transaction.atomic():
+            for data in self.cleaned_data:
+                stone_data = data.copy()
 
-            gia_code = stone_data["gia_code"]
-            del stone_data["gia_code"]
-            stone = Stone.objects.get(internal_id=data["internal_id"])
-            for field, value in stone_data.items():
-                setattr(stone, field, value)
-            try:
-                gia_verification = GiaVerification.objects.get(receipt_number=gia_code)
-            except GiaVerification.DoesNotExist:
-                gia_verification = GiaVerification.objects.create(receipt_number=gia_code)
-            setattr(stone, "gia_verification", gia_verification)
-            stone.save()
-            gia = User.objects.get(username="gia")
-            vault = User.objects.get(username="vault")
-            StoneTransfer.initiate_transfer(item=stone, from_user=gia, to_user=vault, created_by=self.user)
+                gia_code = stone_data["gia_code"]
+                del stone_data["gia_code"]
+                stone = Stone.objects.get(internal_id=data["internal_id"])
+                for field, value in stone_data.items():
+                    setattr(stone, field, value)
+                try:
+                    gia_verification = GiaVerification.objects.get(receipt_number=gia_code)
+                except GiaVerification.DoesNotExist:
+                    gia_verification = GiaVerification.objects.create(receipt_number=gia_code)
+                setattr(stone, "gia_verification", gia_verification)
+                stone.save()
+                stones.append(stone)
+
+            StoneTransfer.bulk_initiate_transfer(
+                stones, from_user=SYSTEM_USERS.gia, to_user=SYSTEM_USERS.vault, created_by=self.user
+            )
 
             # TODO: Remove Confirm stone received temporal
-            StoneTransfer.confirm_received(item=stone)
-            stones.append(stone)
+            StoneTransfer.bulk_confirm_received(stones)
 
         return stones
 
@@ -930,8 +1052,8 @@ class GIAUploadForm(BaseUploadForm):
         errors = {}
         for row, data in enumerate(stone_data):
 
-            stone = Stone.objects.get(internal_id=data["internal_id"])
-            if stone.is_gia_grading_complete:
+            stone = self.get_stone(data["internal_id"])
+            if stone is not None and stone.is_gia_grading_complete:
                 errors[row] = {}
                 errors[row][
                     "internal_id"
@@ -985,13 +1107,17 @@ class MacroImageFilenameUploadForm(ImageFileNameUploadBaseForm):
 
     def save(self):
 
+        stone_index = get_stones_by("external_id", self.cleaned_data)
+
         stones = []
         for data in self.cleaned_data:
-            stone = Stone.objects.get(external_id=data["external_id"])
+            stone = stone_index[data["external_id"]]
             stone.macro_filename = data["macro_filename"]
 
-            stone.save()
             stones.append(stone)
+
+        with transaction.atomic():
+            bulk_update_stones(stones, ["macro_filename"])
         return stones
 
 
@@ -1003,11 +1129,15 @@ class NanoImageFilenameUploadForm(ImageFileNameUploadBaseForm):
         # Validate the nano_photo column name
 
     def save(self):
+        stone_index = get_stones_by("external_id", self.cleaned_data)
+
         stones = []
         for data in self.cleaned_data:
-            stone = Stone.objects.get(external_id=data["external_id"])
+            stone = stone_index[data["external_id"]]
             stone.nano_filename = data["nano_filename"]
 
-            stone.save()
             stones.append(stone)
+
+        with transaction.atomic():
+            bulk_update_stones(stones, ["nano_filename"])
         return stones
@@ -1,6 +1,10 @@
+# bookkeeping columns, not stone data, left out of the reports
+NON_REPORT_FIELDS = ("modified_date",)
+
+
 def get_stone_fields(model):
     fields = model._meta.fields
-    return [str(field).split(".")[2] for field in fields]
+    return [str(field).split(".")[2] for field in fields if field.name not in NON_REPORT_FIELDS]
 
 
 def column_tuple_to_value_tuple_dict_map(column, values):
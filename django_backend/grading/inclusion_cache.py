@@ -0,0 +1,53 @@
+import threading
+
+from stonegrading.models import Inclusion
+
+
+class InclusionCache:
+
+    # Process wide inclusion name -> Inclusion, loaded with one query and cleared by the Inclusion
+    # post_save / post_delete signals (connected in GradingConfig.ready). Names it does not know are
+    # looked up again, in one query per call, so inclusions added by other processes are found too
+
+    def __init__(self):
+        self.inclusions = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        """
+        Load all the inclusions if they are not cached
+        :return: dict of inclusion name: inclusion
+        """
+        inclusions = self.inclusions
+        if inclusions is None:
+            with self.lock:
+                if self.inclusions is None:
+                    self.inclusions = {inclusion.inclusion: inclusion for inclusion in Inclusion.objects.all()}
+                inclusions = self.inclusions
+        return inclusions
+
+    def get_inclusions(self, names):
+        """
+        Returns the inclusions of names, with a single query for the names not cached
+        :param names:
+        :return: dict of inclusion name: inclusion, without the names there is no inclusion for
+        """
+        inclusions = self.load()
+        missing = set(names).difference(inclusions)
+        if missing:
+            found = {inclusion.inclusion: inclusion for inclusion in Inclusion.objects.filter(inclusion__in=missing)}
+            if found:
+                self.inclusions = inclusions = {**inclusions, **found}
+
+        return {name: inclusions[name] for name in names if name in inclusions}
+
+    def clear(self, **kwargs):
+        """
+        Signal receiver, the inclusions are loaded again on the next use
+        :param kwargs:
+        :return:
+        """
+        self.inclusions = None
+
+
+INCLUSIONS = InclusionCache()
@@ -0,0 +1,82 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from grading.auto_grade.grading_modules.check_differences import (
+    compare_grades,
+    compare_stone_grades,
+    read_grades_csv,
+)
+from grading.models import Stone
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare hand graded with auto graded results, from two csv files or from the stones, "
+        "and report the differences per field"
+    )
+
+    def add_arguments(self, parser):
+        """
+        Add arguments
+        :param parser:
+        :return:
+        """
+        parser.add_argument("--hand-graded", help="csv of the hand graded results (requires --computed)")
+        parser.add_argument("--computed", help="csv of the computed results (requires --hand-graded)")
+        parser.add_argument("--parcel", nargs="+", help="only the stones of these gradia parcel codes")
+        parser.add_argument("--log", help="write every difference to this file as JSON lines")
+        parser.add_argument("--matrices", action="store_true", help="also print the confusion matrix of every field")
+
+    def get_report(self, options):
+        """
+        Report on the csv files when given, on the stones otherwise
+        :param options:
+        :return:
+        """
+        if bool(options["hand_graded"]) != bool(options["computed"]):
+            raise CommandError("--hand-graded and --computed must be given together")
+
+        if options["hand_graded"]:
+            try:
+                return compare_grades(read_grades_csv(options["hand_graded"]), read_grades_csv(options["computed"]))
+            except (OSError, KeyError, ValueError) as error:
+                raise CommandError(f"Cannot compare the csv files: {error}")
+
+        queryset = Stone.objects.all()
+        if options["parcel"]:
+            queryset = queryset.filter(split_from__original_parcel__gradia_parcel_code__in=options["parcel"])
+        return compare_stone_grades(queryset)
+
+    def handle(self, *args, **options):
+        """
+        Compare the grades, print the summary (and the matrices) and log the differences
+        :param args:
+        :param options:
+        :return:
+        """
+        start = time.perf_counter()
+        report = self.get_report(options)
+        report.log_summary()
+
+        self.stdout.write(report.summary().to_string())
+        if options["matrices"]:
+            for field, matrix in report.confusion_matrices().items():
+                self.stdout.write(f"\n{field} (rows) vs {report.field_map[field]} (columns)\n{matrix.to_string()}")
+
+        if report.unmatched_hand_graded or report.unmatched_computed:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Not compared: {len(report.unmatched_hand_graded)} hand graded and "
+                    f"{len(report.unmatched_computed)} computed stones without counterpart"
+                )
+            )
+        if options["log"]:
+            self.stdout.write(f"{report.write_log(options['log'])} differences written to {options['log']}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(report.differences)} differences in {len(report.comparisons)} comparisons "
+                f"({time.perf_counter() - start:.1f}s)"
+            )
+        )
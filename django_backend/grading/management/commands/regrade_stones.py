@@ -0,0 +1,170 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from grading.auto_grade.grading_modules.batch_grading_calculations import AUTO_GRADE_FIELDS, AUTO_GRADE_INPUT_FIELDS
+from grading.auto_grade.process_csv import grade_chunk
+from grading.forms import bulk_update_stones
+from grading.models import Stone
+
+
+class Command(BaseCommand):
+    help = "Re-run the auto grading of the stones, e.g. after GRADE_PARA or the cut grade estimation tables changed"
+
+    def add_arguments(self, parser):
+        """
+        Add arguments
+        :param parser:
+        :return:
+        """
+        parser.add_argument("--parcel", nargs="+", help="only the stones of these gradia parcel codes")
+        parser.add_argument("--receipt", nargs="+", help="only the stones of these customer receipt codes")
+        parser.add_argument("--since", help="only stones whose parcel was split on or after this date (YYYY-MM-DD)")
+        parser.add_argument("--until", help="only stones whose parcel was split on or before this date (YYYY-MM-DD)")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="stones read and graded at a time")
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count(), help="grading processes, 0 grades in this process"
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="print the grades that would change, save nothing"
+        )
+
+    def get_queryset(self, options):
+        """
+        Stones selected by the --parcel, --receipt, --since and --until options
+        :param options:
+        :return:
+        """
+        queryset = Stone.objects.all()
+        if options["parcel"]:
+            queryset = queryset.filter(split_from__original_parcel__gradia_parcel_code__in=options["parcel"])
+        if options["receipt"]:
+            queryset = queryset.filter(split_from__original_parcel__receipt__code__in=options["receipt"])
+
+        for option, lookup in (("since", "gte"), ("until", "lte")):
+            if options[option]:
+                date = parse_date(options[option])
+                if date is None:
+                    raise CommandError(f"--{option}: {options[option]} is not a valid YYYY-MM-DD date")
+                queryset = queryset.filter(**{f"split_from__split_date__date__{lookup}": date})
+        return queryset
+
+    def iterate_chunks(self, queryset, chunk_size):
+        """
+        Yield the stones (as values() dicts) chunk_size at a time in pk order, paginating on the pk
+        :param queryset:
+        :param chunk_size:
+        :return:
+        """
+        fields = ["pk", "internal_id", *AUTO_GRADE_INPUT_FIELDS, *AUTO_GRADE_FIELDS]
+        last_pk = None
+        while True:
+            chunk = queryset.order_by("pk")
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            rows = list(chunk.values(*fields)[:chunk_size])
+            if not rows:
+                return
+            last_pk = rows[-1]["pk"]
+            yield rows
+
+    def grade_chunks(self, chunks, workers):
+        """
+        Yield (stones, graded stones, errors) for every chunk, grading up to 2 chunks per worker ahead
+        grade_chunk lives outside this module so the workers can unpickle it without setting up Django,
+        which spawned workers (the default on macOS and Windows) do not do
+        :param chunks:
+        :param workers:
+        :return:
+        """
+        if workers < 1:
+            for stones in chunks:
+                yield (stones, *grade_chunk(pd.DataFrame.from_records(stones)))
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for stones in chunks:
+                pending.append((stones, executor.submit(grade_chunk, pd.DataFrame.from_records(stones))))
+                if len(pending) >= 2 * workers:
+                    stones, future = pending.popleft()
+                    yield (stones, *future.result())
+            while pending:
+                stones, future = pending.popleft()
+                yield (stones, *future.result())
+
+    def save_changes(self, stones, graded, dry_run):
+        """
+        Save (or print with dry_run) the auto grades that differ from the ones stored
+        :param stones:
+        :param graded:
+        :param dry_run:
+        :return: number of stones with changed grades
+        """
+        current = {stone["pk"]: stone for stone in stones}
+        changed_stones, changed_fields = [], set()
+        for row in graded.to_dict("records"):
+            stone = current[row["pk"]]
+            changes = {}
+            for field in AUTO_GRADE_FIELDS:
+                # pandas may hold a None grade as NaN
+                grade = None if pd.isna(row[field]) else row[field]
+                if grade != stone[field]:
+                    changes[field] = (stone[field], grade)
+            if not changes:
+                continue
+
+            if dry_run:
+                for field, (old, new) in changes.items():
+                    self.stdout.write(f"{stone['internal_id']} {field}: {old!r} -> {new!r}")
+
+            # every grade is set, as the fields changed for any stone of the chunk are saved for all of them
+            stone = Stone(pk=row["pk"])
+            for field in AUTO_GRADE_FIELDS:
+                setattr(stone, field, None if pd.isna(row[field]) else row[field])
+            changed_stones.append(stone)
+            changed_fields.update(changes)
+
+        if changed_stones and not dry_run:
+            with transaction.atomic():
+                bulk_update_stones(changed_stones, [field for field in AUTO_GRADE_FIELDS if field in changed_fields])
+        return len(changed_stones)
+
+    def handle(self, *args, **options):
+        """
+        Regrade the selected stones chunk by chunk and save the auto grades which changed
+        :param args:
+        :param options:
+        :return:
+        """
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+
+        queryset = self.get_queryset(options)
+        start = time.perf_counter()
+        graded_count = changed_count = 0
+        errors = {}
+
+        chunks = self.iterate_chunks(queryset, options["chunk_size"])
+        for stones, graded, chunk_errors in self.grade_chunks(chunks, options["workers"]):
+            changed_count += self.save_changes(stones, graded, options["dry_run"])
+            graded_count += len(graded)
+            errors.update(chunk_errors)
+
+        elapsed = time.perf_counter() - start
+        for internal_id, error in errors.items():
+            self.stdout.write(self.style.ERROR(f"{internal_id} could not be graded: {error}"))
+
+        verb = "would change" if options["dry_run"] else "changed"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{graded_count} stones graded, {verb} for {changed_count}, {len(errors)} failed "
+                f"in {elapsed:.1f}s ({graded_count / elapsed if elapsed else 0:.0f} stones/s)"
+            )
+        )
@@ -0,0 +1,44 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from grading.models import ExportJob
+
+
+class Command(BaseCommand):
+    help = "Worker building the queued csv exports (ExportJob) in the background"
+
+    def add_arguments(self, parser):
+        """
+        Add arguments
+        :param parser:
+        :return:
+        """
+        parser.add_argument("--once", action="store_true", help="exit once the queue is empty instead of polling")
+        parser.add_argument("--sleep", type=float, default=5, help="seconds to wait between polls of an empty queue")
+        parser.add_argument(
+            "--timeout", type=float, help="minutes after which a running job is queued again (default: 60)"
+        )
+
+    def handle(self, *args, **options):
+        """
+        Run pending export jobs one at a time, oldest first
+        :param args:
+        :param options:
+        :return:
+        """
+        timeout = timedelta(minutes=options["timeout"]) if options["timeout"] else None
+        while True:
+            job = ExportJob.claim_next(timeout)
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["sleep"])
+                continue
+
+            job.run()
+            if job.status == ExportJob.DONE:
+                self.stdout.write(self.style.SUCCESS(f"{job}: {job.processed_rows} rows written to {job.file.name}"))
+            else:
+                self.stdout.write(self.style.ERROR(f"{job} failed:\n{job.error}"))
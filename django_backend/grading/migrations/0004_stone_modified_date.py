@@ -0,0 +1,18 @@
+# Generated by Django 3.1.4 on 2026-10-18 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grading', '0003_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stone',
+            name='modified_date',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
@@ -1,17 +1,27 @@
 import csv
 import hashlib
+import io
 import os
 import itertools
+import secrets
+import tempfile
+import traceback
+from operator import attrgetter
 
 # import StringIO
-from datetime import datetime
+from datetime import datetime, timedelta
+
+import pandas as pd
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files import File
 from django.db import models
 from django.db.utils import IntegrityError
 from django.urls import reverse
 from django.utils.html import format_html
+from django.utils.timezone import utc
 
 
 """
@@ -46,89 +56,575 @@ from ownerships.models import ParcelTransfer, StoneTransfer
 from .helpers import get_stone_fields
 
 
-def generate_csv(filename, dir_name, field_names, queryset, field_map):
-    is_lab_export = False
-
+TRIPLE_REPORT_FIELD_NAMES = [
+    "date",
+    "gradia_ID",
+    "carat",
+    "color",
+    "clarity",
+    "fluorescence",
+    "culet",
+    "culet_description",
+    "cut",
+    "polish",
+    "symmetry",
+    "table_size",
+    "crown_angle",
+    "pavilion_angle",
+    "star_length",
+    "lower_half",
+    "girdle_thickness",
+    "girdle_maximum",
+    "girdle_minimum",
+    "crown_height",
+    "pavilion_depth",
+    "total_depth",
+    "comments",
+    "diameter_min",
+    "diameter_max",
+    "height",
+    "goldway_AI_code",
+    "GIA_batch_code",
+    "inclusion",
+]
+TRIPLE_REPORT_FIELD_MAP = {
+    "date": "adjust_gia_date",
+    "gradia_ID": "external_id",
+    "carat": "basic_carat",
+    "color": "gia_color_adjusted_final",
+    "clarity": "gw_clarity_adjusted_final",
+    "fluorescence": "gw_fluorescence_adjusted_final",
+    "culet": "gia_culet_adjusted_final",
+    "culet_description": "gia_culet_characteristic_final",
+    "cut": "auto_final_gradia_cut_grade",
+    "polish": "basic_polish_final",
+    "symmetry": "sarine_symmetry",
+    "girdle_thickness": "girdle_thickness_rounded",
+    "girdle_maximum": "girdle_max_grade",
+    "girdle_minimum": "basic_girdle_min_grade_final",
+    "table_size": "table_size_rounded",
+    "crown_angle": "crown_angle_rounded",
+    "pavilion_angle": "pavilion_angle_rounded",
+    "star_length": "star_length_rounded",
+    "lower_half": "lower_half_rounded",
+    "crown_height": "crown_height_rounded",
+    "pavilion_depth": "pavilion_depth_rounded",
+    "total_depth": "total_depth_rounded",
+    "goldway_AI_code": "gw_verification",
+    "GIA_batch_code": "gia_verification",
+    "inclusion": "basic_inclusions_final",
+}
+
+
+class Echo:
+    """
+    An object that implements just the write method of the file-like interface, csv.writer
+    hands each formatted row straight back instead of buffering it
+    """
+
+    def write(self, value):
+        return value
+
+
+def get_csv_file_path(filename, dir_name):
+    """
+    Creates the csv_downloads sub directory if needed and returns the full path of the file
+    :param filename:
+    :param dir_name:
+    :return:
+    """
     if not os.path.exists(dir_name):
         os.makedirs(dir_name)
-    file_path = dir_name + filename
+    return dir_name + filename
 
-    if "gradia_ID" in field_map:  # if gradia_ID found it means we're doing an export to lab
-        omit_plus_or_minus_fields = (
-            "gia_color_adjusted_final",
-            "gw_clarity_adjusted_final",
-            "gw_fluorescence_adjusted_final",
-            "basic_polish_final",
-        )
-        is_lab_export = True
 
-    with open(file_path, "w") as file:
-        writer = csv.writer(file, delimiter=",")
-        writer.writerow(field_names)
-        if len(field_map) > 1:
-            for field in field_map:
-                index = field_names.index(field)
-                field_names[index] = field_map[field]
-        for stone in reversed(queryset.all()):
-            values = []
+# number of stones fetched per query when exporting
+EXPORT_CHUNK_SIZE = 2000
+
+# cached exports live in MEDIA_ROOT/EXPORT_CACHE_DIR, the least recently used files are deleted
+# once the directory grows past EXPORT_CACHE_MAX_BYTES
+EXPORT_CACHE_DIR = "csv_downloads/cache/"
+EXPORT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+LAB_EXPORT_OMIT_PLUS_OR_MINUS_FIELDS = (
+    "gia_color_adjusted_final",
+    "gw_clarity_adjusted_final",
+    "gw_fluorescence_adjusted_final",
+    "basic_polish_final",
+)
+
+
+def empty_value(stone):
+    return ""
+
+
+def none_to_empty(value):
+    return "" if value is None else value
+
+
+def strip_plus_or_minus(value):
+    return value.strip("+").strip("-")
+
+
+def to_lab_export_culet_characteristic(value):
+    export_value = CuletCharacteristics.LAB_EXPORT_MAP.get(value)
+    return export_value if export_value is not None else value
+
+
+def round_height(value):
+    return "%.2f" % round(float(value), 2) if value != "" else value
+
+
+def join_inclusions(value):
+    return ", ".join([instance.inclusion for instance in value.all()]) if value != "" else value
+
 
-            for field in field_names:
-                try:
-                    value = getattr(stone, field)
-                except:
-                    # using the expected attribute
-                    # field_map value contains attributes that exists
+def verification_code(value):
+    return value.code if value != "" else value
 
-                    # there are some cases in which like gia code where both attributes and values don't exist but are needed
-                    try:
-                        attribute = stone.__dict__[field_map[field]]
-                        value = attribute
-                    except:
-                        value = ""
 
-                if value is None:
-                    value = ""
+def split_parcel_code(value):
+    return value.original_parcel.gradia_parcel_code if value != "" else value
 
-                if is_lab_export and field in omit_plus_or_minus_fields:
-                    value = value.strip("+").strip("-")
 
-                if is_lab_export and field == "gia_culet_characteristic_final":
-                    export_value = CuletCharacteristics.LAB_EXPORT_MAP.get(value)
-                    value = export_value if export_value is not None else value
+def get_csv_column_names(field_names, field_map):
+    """
+    Returns the column names with the field_map renaming applied (only done when mapping more than one field)
+    :param field_names:
+    :param field_map:
+    :return:
+    """
+    if len(field_map) > 1:
+        return [field_map.get(field, field) for field in field_names]
+    return list(field_names)
 
-                if is_lab_export and field == "height":
-                    value = "%.2f" % round(float(value), 2) if value != "" else value
 
-                if "inclusion" in field and value != "":
-                    value = ", ".join([instance.inclusion for instance in value.all()])
+def resolve_csv_attribute(field, field_map, model):
+    """
+    Returns the stone attribute a column reads from, or None if the column is always empty
+    :param field: the column name after the field_map renaming
+    :param field_map:
+    :param model:
+    :return:
+    """
+    if hasattr(model, field):
+        return field
 
-                if "verification" in field and value != "" and value is not None:
-                    value = value.code
+    # there are some cases like nano_etch_inscription where the column is not an attribute
+    # but field_map points to an attribute that exists
+    concrete_attnames = {model_field.attname for model_field in model._meta.concrete_fields}
+    if field_map.get(field) in concrete_attnames:
+        return field_map[field]
 
-                if "split_from" in field and value != "":
-                    value = value.original_parcel.gradia_parcel_code
+    return None
 
-                values.append(value)
-            writer.writerow(values)
+
+def compile_csv_column(field, field_map, model, is_lab_export):
+    """
+    Resolves a csv column once to a callable taking a stone and returning the formatted cell value
+    :param field: the column name after the field_map renaming
+    :param field_map:
+    :param model:
+    :param is_lab_export:
+    :return:
+    """
+    attribute = resolve_csv_attribute(field, field_map, model)
+    accessor = attrgetter(attribute) if attribute is not None else empty_value
+
+    formatters = [none_to_empty]
+    if is_lab_export and field in LAB_EXPORT_OMIT_PLUS_OR_MINUS_FIELDS:
+        formatters.append(strip_plus_or_minus)
+    if is_lab_export and field == "gia_culet_characteristic_final":
+        formatters.append(to_lab_export_culet_characteristic)
+    if is_lab_export and field == "height":
+        formatters.append(round_height)
+    if "inclusion" in field:
+        formatters.append(join_inclusions)
+    if "verification" in field:
+        formatters.append(verification_code)
+    if "split_from" in field:
+        formatters.append(split_parcel_code)
+
+    def column(stone):
+        try:
+            value = accessor(stone)
+        except Exception:
+            # e.g. parcel_code of a stone without split_from, like the row by row export the cell is left
+            # empty (or read from the field_map attribute) instead of aborting the download
+            value = stone.__dict__.get(field_map.get(field), "")
+        for formatter in formatters:
+            value = formatter(value)
+        return value
+
+    return column
+
+
+def compile_csv_columns(field_names, field_map, model):
+    """
+    Returns the list of column callables for an export, compiled once instead of for every cell
+    :param field_names:
+    :param field_map:
+    :param model:
+    :return:
+    """
+    is_lab_export = "gradia_ID" in field_map  # if gradia_ID found it means we're doing an export to lab
+
+    return [
+        compile_csv_column(field, field_map, model, is_lab_export)
+        for field in get_csv_column_names(field_names, field_map)
+    ]
+
+
+def plan_csv_queryset(queryset, field_names, field_map):
+    """
+    Applies the select_related / prefetch_related / only() the export columns need, so the number of
+    queries does not grow with the number of stones
+    :param queryset:
+    :param field_names:
+    :param field_map:
+    :return:
+    """
+    model = queryset.model
+    select_related = []
+    prefetch_related = []
+    only = []
+
+    for field in get_csv_column_names(field_names, field_map):
+        attribute = resolve_csv_attribute(field, field_map, model)
+        if attribute is None:
+            continue
+
+        try:
+            model_field = model._meta.get_field(attribute)
+        except FieldDoesNotExist:
+            # properties (e.g. parcel_code) can read any field, so nothing can be deferred
+            only = None
+            continue
+
+        if model_field.many_to_many:
+            prefetch_related.append(attribute)
+            continue
+
+        if not model_field.concrete:
+            only = None
+            continue
+
+        if only is not None:
+            only.append(model_field.name)
+
+        if model_field.is_relation and attribute == model_field.name:
+            if "split_from" in field:
+                select_related.append(f"{attribute}__original_parcel")
+            else:
+                select_related.append(attribute)
+
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    if only:
+        queryset = queryset.only(*only)
+
+    return queryset
+
+
+def iterate_reversed_in_chunks(queryset, chunk_size=None):
+    """
+    Yields the stones in the reverse of the queryset ordering (newest first for an unordered queryset),
+    fetching at most `chunk_size` stones per query so memory stays flat for large exports
+    :param queryset:
+    :param chunk_size:
+    :return:
+    """
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    pk_name = queryset.model._meta.pk.name
+
+    if not queryset.ordered:
+        queryset = queryset.order_by("pk")
+    ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+
+    if ordering in (["pk"], [pk_name], ["-pk"], [f"-{pk_name}"]):
+        # keyset pagination on the primary key, in the reverse direction of the queryset ordering
+        if ordering[0].startswith("-"):
+            queryset, next_chunk_lookup = queryset.order_by("pk"), "pk__gt"
+        else:
+            queryset, next_chunk_lookup = queryset.order_by("-pk"), "pk__lt"
+
+        chunk = list(queryset[:chunk_size])
+        while chunk:
+            yield from chunk
+            if len(chunk) < chunk_size:
+                break
+            chunk = list(queryset.filter(**{next_chunk_lookup: chunk[-1].pk})[:chunk_size])
+        return
+
+    # any other ordering (e.g. a sorted changelist column), only the ordered primary keys are held in memory
+    pks = list(queryset.reverse().values_list("pk", flat=True))
+    for start in range(0, len(pks), chunk_size):
+        chunk_pks = pks[start : start + chunk_size]
+        stones = queryset.order_by().in_bulk(chunk_pks)
+        for pk in chunk_pks:
+            yield stones[pk]
+
+
+def generate_csv_rows(field_names, queryset, field_map):
+    """
+    Yields the csv header followed by a list of values for every stone in the queryset
+    :param field_names:
+    :param queryset:
+    :param field_map:
+    :return:
+    """
+    yield list(field_names)
+
+    columns = compile_csv_columns(field_names, field_map, queryset.model)
+    queryset = plan_csv_queryset(queryset, field_names, field_map)
+    for stone in iterate_reversed_in_chunks(queryset):
+        yield [column(stone) for column in columns]
+
+
+def stream_csv(field_names, queryset, field_map, archive_path=None):
+    """
+    Yields the csv file line by line so it can be sent with a StreamingHttpResponse without
+    ever holding the whole file in memory. If `archive_path` is given, every line is also written to it
+    :param field_names:
+    :param queryset:
+    :param field_map:
+    :param archive_path:
+    :return:
+    """
+    writer = csv.writer(Echo(), delimiter=",", lineterminator="\n")
+    lines = (writer.writerow(row) for row in generate_csv_rows(field_names, queryset, field_map))
+    if archive_path is not None:
+        lines = write_lines(lines, archive_path)
+    return lines
+
+
+def write_lines(lines, file_path):
+    """
+    Yields `lines` while also writing them to `file_path`
+    :param lines:
+    :param file_path:
+    :return:
+    """
+    with open(file_path, "w", newline="") as file:
+        for line in lines:
+            file.write(line)
+            yield line
+
+
+def generate_csv(filename, dir_name, field_names, queryset, field_map):
+    file_path = get_csv_file_path(filename, dir_name)
+
+    with open(file_path, "w") as file:
+        writer = csv.writer(file, delimiter=",")
+        for row in generate_csv_rows(field_names, queryset, field_map):
+            writer.writerow(row)
 
     return file_path
 
 
+def get_export_cache_path(dir_name, field_names, queryset, field_map):
+    """
+    Returns the path the export is cached at. The file name is a hash of the export columns, the queryset
+    ordering and the pk and modified_date of every stone, so any change to the stones gives a new file.
+    Changes to related rows (parcel codes, verification codes, grader usernames) do not
+    :param dir_name: the export's csv_downloads sub directory, identifies the export type
+    :param field_names:
+    :param queryset:
+    :param field_map:
+    :return:
+    """
+    digest = hashlib.sha256()
+    ordering = [str(field) for field in queryset.query.order_by]
+    export = (dir_name, list(field_names), sorted(field_map.items()), queryset.ordered, ordering)
+    digest.update(repr(export).encode())
+
+    versions = queryset.order_by("pk").values_list("pk", "modified_date").iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for pk, modified_date in versions:
+        digest.update(f"{pk}:{modified_date.isoformat() if modified_date else ''};".encode())
+
+    return os.path.join(settings.MEDIA_ROOT, EXPORT_CACHE_DIR, digest.hexdigest() + ".csv")
+
+
+def read_cached_lines(cache_path):
+    """
+    Opens the cached export and marks it as recently used. Returns None if it is not cached
+    :param cache_path:
+    :return:
+    """
+    try:
+        os.utime(cache_path)
+        return open(cache_path, newline="")
+    except FileNotFoundError:
+        return None
+
+
+def cache_lines(lines, cache_path):
+    """
+    Yields `lines` while writing them to a temporary file which becomes `cache_path` once the last line
+    has been written, so an interrupted export never leaves a partial file in the cache
+    :param lines:
+    :param cache_path:
+    :return:
+    """
+    cache_dir = os.path.dirname(cache_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_file, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(temp_file, "w", newline="") as file:
+            for line in lines:
+                file.write(line)
+                yield line
+        os.replace(temp_path, cache_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    evict_export_cache(cache_dir)
+
+
+def evict_export_cache(cache_dir, max_bytes=None):
+    """
+    Deletes the least recently used cached exports until the cache is at most `max_bytes` big
+    :param cache_dir:
+    :param max_bytes: defaults to EXPORT_CACHE_MAX_BYTES
+    :return:
+    """
+    max_bytes = EXPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    cached_files = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and entry.name.endswith(".csv"):
+            stat = entry.stat()
+            cached_files.append((stat.st_mtime, stat.st_size, entry.path))
+
+    cache_size = sum(size for _, size, _ in cached_files)
+    for _, size, path in sorted(cached_files):
+        if cache_size <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        cache_size -= size
+
+
+def export_csv(filename, dir_name, field_names, queryset, field_map, stream=False, archive=False, cache=False):
+    """
+    Returns the path of the generated csv file, or when `stream` is True a generator of csv lines.
+    Streamed exports only touch the disk when `archive` or `cache` is True.
+    With `cache`, an export of unchanged stones is read back from the export cache instead of the database
+    :param filename:
+    :param dir_name:
+    :param field_names:
+    :param queryset:
+    :param field_map:
+    :param stream:
+    :param archive:
+    :param cache:
+    :return:
+    """
+    if not cache:
+        if not stream:
+            return generate_csv(filename, dir_name, field_names, queryset, field_map)
+        archive_path = get_csv_file_path(filename, dir_name) if archive else None
+        return stream_csv(field_names, queryset, field_map, archive_path=archive_path)
+
+    cache_path = get_export_cache_path(dir_name, field_names, queryset, field_map)
+    lines = read_cached_lines(cache_path)
+    if lines is None:
+        lines = cache_lines(stream_csv(field_names, queryset, field_map), cache_path)
+
+    if not stream:
+        for _ in lines:
+            pass
+        lines.close()
+        return cache_path
+
+    if archive:
+        lines = write_lines(lines, get_csv_file_path(filename, dir_name))
+    return lines
+
+
+def write_parquet(frame, file):
+    frame.to_parquet(file, index=False)
+
+
+def write_feather(frame, file):
+    frame.reset_index(drop=True).to_feather(file)
+
+
+# export_format: (writer, file extension, content type). Register another writer here to support a new format
+COLUMNAR_EXPORT_FORMATS = {
+    "parquet": (write_parquet, "parquet", "application/vnd.apache.parquet"),
+    "feather": (write_feather, "feather", "application/vnd.apache.arrow.file"),
+}
+
+
+def csv_cell(value):
+    """
+    Returns the text the csv writer writes for a cell value
+    :param value:
+    :return:
+    """
+    return "" if value is None else str(value)
+
+
+def generate_columnar_frame(field_names, queryset, field_map):
+    """
+    Builds a DataFrame with the same columns and cells as the csv export: the rows come from
+    generate_csv_rows (so the columns are compiled the same way) EXPORT_CHUNK_SIZE rows at a time,
+    and every cell holds the text the csv has
+    :param field_names:
+    :param queryset:
+    :param field_map:
+    :return:
+    """
+    rows = generate_csv_rows(field_names, queryset, field_map)
+    header = next(rows)
+
+    def chunk_to_frame(chunk):
+        return pd.DataFrame([[csv_cell(value) for value in row] for row in chunk], columns=header, dtype="object")
+
+    chunks = iter(lambda: list(itertools.islice(rows, EXPORT_CHUNK_SIZE)), [])
+    frames = [chunk_to_frame(chunk) for chunk in chunks] or [chunk_to_frame([])]
+    return pd.concat(frames, ignore_index=True)
+
+
+def export_columnar(field_names, queryset, field_map, export_format):
+    """
+    Returns the export as the content of a `export_format` file
+    :param field_names:
+    :param queryset:
+    :param field_map:
+    :param export_format: one of COLUMNAR_EXPORT_FORMATS
+    :return:
+    """
+    if export_format not in COLUMNAR_EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format `{export_format}`")
+
+    writer, _, _ = COLUMNAR_EXPORT_FORMATS[export_format]
+    frame = generate_columnar_frame(field_names, queryset, field_map)
+    file = io.BytesIO()
+    writer(frame, file)
+    return file.getvalue()
+
+
 class StoneManager(models.Manager):
-    def generate_external_id_csv(self, queryset):
+    def generate_external_id_csv(self, queryset, stream=False, archive=False):
         filename = "Gradia_id_" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
         dir_name = settings.MEDIA_ROOT + "/csv_downloads/download_ids/"
         field_names = ["external_id"]
 
-        return generate_csv(filename, dir_name, field_names, queryset, {})
+        return export_csv(filename, dir_name, field_names, queryset, {}, stream=stream, archive=archive)
 
-    def generate_master_report_csv(self, queryset):
+    def generate_master_report_csv(self, queryset, stream=False, archive=False, cache=False):
         filename = "Master_report_" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
         dir_name = settings.MEDIA_ROOT + "/csv_downloads/master_reports/"
         field_names = get_stone_fields(Stone)
-        return generate_csv(filename, dir_name, field_names, queryset, {})
+        return export_csv(filename, dir_name, field_names, queryset, {}, stream=stream, archive=archive, cache=cache)
 
-    def generate_basic_grading_template(self, request, queryset):
+    def generate_basic_grading_template(self, request, queryset, stream=False, archive=False):
         filename = "Basic_Grading_Template_" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
         dir_name = settings.MEDIA_ROOT + "/csv_downloads/basic_grading_template/"
         field_names = [
@@ -175,9 +671,9 @@ class StoneManager(models.Manager):
             "basic_remarks",
         ]
 
-        return generate_csv(filename, dir_name, field_names, queryset, {})
+        return export_csv(filename, dir_name, field_names, queryset, {}, stream=stream, archive=archive)
 
-    def generate_goldway_grading_template(self, request, queryset):
+    def generate_goldway_grading_template(self, request, queryset, stream=False, archive=False):
         filename = "Goldway_Grading_Template_" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
         dir_name = settings.MEDIA_ROOT + "csv_downloads/goldway_grading_template/"
         field_names = [
@@ -191,11 +687,17 @@ class StoneManager(models.Manager):
             "gw_fluorescence",
             "gw_remarks",
         ]
-        return generate_csv(
-            filename, dir_name, field_names, queryset, field_map={"nano_etch_inscription": "external_id"}
+        return export_csv(
+            filename,
+            dir_name,
+            field_names,
+            queryset,
+            field_map={"nano_etch_inscription": "external_id"},
+            stream=stream,
+            archive=archive,
         )
 
-    def generate_gia_grading_template(self, request, queryset):
+    def generate_gia_grading_template(self, request, queryset, stream=False, archive=False):
         filename = "GIA_Grading_Template_" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
         dir_name = settings.MEDIA_ROOT + "csv_downloads/gia_grading_template/"
         field_names = [
@@ -207,11 +709,17 @@ class StoneManager(models.Manager):
             "gia_color",
             "gia_remarks",
         ]
-        return generate_csv(
-            filename, dir_name, field_names, queryset, field_map={"nano_etch_inscription": "external_id"}
+        return export_csv(
+            filename,
+            dir_name,
+            field_names,
+            queryset,
+            field_map={"nano_etch_inscription": "external_id"},
+            stream=stream,
+            archive=archive,
         )
 
-    def generate_to_goldway_csv(self, request, queryset):
+    def generate_to_goldway_csv(self, request, queryset, stream=False, archive=False):
         filename = "To_Goldway_" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
         dir_name = settings.MEDIA_ROOT + "/csv_downloads/to_goldway/"
 
@@ -226,11 +734,17 @@ class StoneManager(models.Manager):
             "basic_carat",
         ]
 
-        return generate_csv(
-            filename, dir_name, field_names, queryset, field_map={"nano_etch_inscription": "external_id"}
+        return export_csv(
+            filename,
+            dir_name,
+            field_names,
+            queryset,
+            field_map={"nano_etch_inscription": "external_id"},
+            stream=stream,
+            archive=archive,
         )
 
-    def generate_adjust_goldway_csv(self, queryset):
+    def generate_adjust_goldway_csv(self, queryset, stream=False, archive=False, cache=False):
         filename = "Adjust_Goldway" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
         dir_name = settings.MEDIA_ROOT + "/csv_downloads/adjust_goldway/"
         field_names = [
@@ -260,11 +774,18 @@ class StoneManager(models.Manager):
             "gw_adjust_remarks",
         ]
 
-        return generate_csv(
-            filename, dir_name, field_names, queryset, field_map={"nano_etch_inscription": "external_id"}
+        return export_csv(
+            filename,
+            dir_name,
+            field_names,
+            queryset,
+            field_map={"nano_etch_inscription": "external_id"},
+            stream=stream,
+            archive=archive,
+            cache=cache,
         )
 
-    def generate_to_GIA_csv(self, queryset):
+    def generate_to_GIA_csv(self, queryset, stream=False, archive=False, cache=False):
         filename = "To_GIA_" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
         dir_name = settings.MEDIA_ROOT + "/csv_downloads/to_GIA/"
         field_names = [
@@ -275,11 +796,18 @@ class StoneManager(models.Manager):
             "gw_color_adjusted_final",
         ]
 
-        return generate_csv(
-            filename, dir_name, field_names, queryset, field_map={"nano_etch_inscription": "external_id"}
+        return export_csv(
+            filename,
+            dir_name,
+            field_names,
+            queryset,
+            field_map={"nano_etch_inscription": "external_id"},
+            stream=stream,
+            archive=archive,
+            cache=cache,
         )
 
-    def generate_adjust_GIA_csv(self, queryset):
+    def generate_adjust_GIA_csv(self, queryset, stream=False, archive=False, cache=False):
         filename = "Adjust_GIA" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
         dir_name = settings.MEDIA_ROOT + "/csv_downloads/adjust_gia/"
         field_names = [
@@ -308,11 +836,18 @@ class StoneManager(models.Manager):
             "gia_adjust_remarks",
         ]
 
-        return generate_csv(
-            filename, dir_name, field_names, queryset, field_map={"nano_etch_inscription": "external_id"}
+        return export_csv(
+            filename,
+            dir_name,
+            field_names,
+            queryset,
+            field_map={"nano_etch_inscription": "external_id"},
+            stream=stream,
+            archive=archive,
+            cache=cache,
         )
 
-    def generate_basic_report_csv(self, queryset):
+    def generate_basic_report_csv(self, queryset, stream=False, archive=False, cache=False):
         filename = "Basic_Report" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
         dir_name = settings.MEDIA_ROOT + "/csv_downloads/Basic_Report/"
 
@@ -383,72 +918,40 @@ class StoneManager(models.Manager):
             "lower_half_angle_grade",
         ]
 
-        return generate_csv(filename, dir_name, field_names, queryset, {})
+        return export_csv(filename, dir_name, field_names, queryset, {}, stream=stream, archive=archive, cache=cache)
 
-    def generate_triple_report_csv(self, queryset):
+    def generate_triple_report_csv(self, queryset, stream=False, archive=False, cache=False):
         filename = "Triple_Report_Lab_Export" + str(datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")) + ".csv"
         dir_name = settings.MEDIA_ROOT + "/csv_downloads/Triple_Report/"
 
-        field_names = [
-            "date",
-            "gradia_ID",
-            "carat",
-            "color",
-            "clarity",
-            "fluorescence",
-            "culet",
-            "culet_description",
-            "cut",
-            "polish",
-            "symmetry",
-            "table_size",
-            "crown_angle",
-            "pavilion_angle",
-            "star_length",
-            "lower_half",
-            "girdle_thickness",
-            "girdle_maximum",
-            "girdle_minimum",
-            "crown_height",
-            "pavilion_depth",
-            "total_depth",
-            "comments",
-            "diameter_min",
-            "diameter_max",
-            "height",
-            "goldway_AI_code",
-            "GIA_batch_code",
-            "inclusion",
-        ]
-        field_map = {
-            "date": "adjust_gia_date",
-            "gradia_ID": "external_id",
-            "carat": "basic_carat",
-            "color": "gia_color_adjusted_final",
-            "clarity": "gw_clarity_adjusted_final",
-            "fluorescence": "gw_fluorescence_adjusted_final",
-            "culet": "gia_culet_adjusted_final",
-            "culet_description": "gia_culet_characteristic_final",
-            "cut": "auto_final_gradia_cut_grade",
-            "polish": "basic_polish_final",
-            "symmetry": "sarine_symmetry",
-            "girdle_thickness": "girdle_thickness_rounded",
-            "girdle_maximum": "girdle_max_grade",
-            "girdle_minimum": "basic_girdle_min_grade_final",
-            "table_size": "table_size_rounded",
-            "crown_angle": "crown_angle_rounded",
-            "pavilion_angle": "pavilion_angle_rounded",
-            "star_length": "star_length_rounded",
-            "lower_half": "lower_half_rounded",
-            "crown_height": "crown_height_rounded",
-            "pavilion_depth": "pavilion_depth_rounded",
-            "total_depth": "total_depth_rounded",
-            "goldway_AI_code": "gw_verification",
-            "GIA_batch_code": "gia_verification",
-            "inclusion": "basic_inclusions_final",
-        }
-
-        return generate_csv(filename, dir_name, field_names, queryset, field_map=field_map)
+        return export_csv(
+            filename,
+            dir_name,
+            TRIPLE_REPORT_FIELD_NAMES,
+            queryset,
+            field_map=TRIPLE_REPORT_FIELD_MAP,
+            stream=stream,
+            archive=archive,
+            cache=cache,
+        )
+
+    def generate_master_report(self, queryset, export_format):
+        """
+        Returns the master report as `export_format` (see COLUMNAR_EXPORT_FORMATS) file content
+        :param queryset:
+        :param export_format:
+        :return:
+        """
+        return export_columnar(get_stone_fields(Stone), queryset, {}, export_format)
+
+    def generate_triple_report(self, queryset, export_format):
+        """
+        Returns the triple report as `export_format` (see COLUMNAR_EXPORT_FORMATS) file content
+        :param queryset:
+        :param export_format:
+        :return:
+        """
+        return export_columnar(TRIPLE_REPORT_FIELD_NAMES, queryset, TRIPLE_REPORT_FIELD_MAP, export_format)
 
 
 class Split(models.Model):
@@ -460,12 +963,19 @@ class Split(models.Model):
     def __str__(self):
         return f"Split of {self.original_parcel}"
 
-    def split_into_summary(self):
+    def split_into_summary(self, parcels=None, stones=None):
+        """
+        :param parcels: number of parcels split into, counted if None
+        :param stones: number of stones split into, counted if None
+        :return:
+        """
         summary = ""
-        parcels = Parcel.objects.filter(split_from=self).count()
+        if parcels is None:
+            parcels = Parcel.objects.filter(split_from=self).count()
         if parcels:
             summary += f"{parcels} parcels"
-        stones = Stone.objects.filter(split_from=self).count()
+        if stones is None:
+            stones = Stone.objects.filter(split_from=self).count()
         if stones:
             summary += f"{stones} stones"
         if summary == "":
@@ -578,9 +1088,18 @@ class Parcel(AbstractParcel):
         parcel = ParcelTransfer.most_recent_transfer(self)
         return f"{parcel.from_user} -> {parcel.to_user} (on {parcel.initiated_date:%D})"
 
-    def get_action_html_link_for_user(self, user):
+    def get_action_html_link_for_user(self, user, transfer=None, is_vault_manager=None):
+        """
+        :param user:
+        :param transfer: the most recent transfer of the parcel, looked up if None
+        :param is_vault_manager: callable returning whether user is a vault manager, a group query if None
+        :return:
+        """
         # in the future might have to check user permissions here
-        transfer = ParcelTransfer.most_recent_transfer(self)
+        if transfer is None:
+            transfer = ParcelTransfer.most_recent_transfer(self)
+        if is_vault_manager is None:
+            is_vault_manager = user.groups.filter(name="vault_manager").exists
         close_parcel = f"<a href='{reverse('grading:close_parcel', args=[self.id])}'>Close Parcel</a>"
 
         if transfer.fresh:
@@ -595,11 +1114,7 @@ class Parcel(AbstractParcel):
                         f"<a href='{reverse('grading:return_to_vault', args=[self.id])}'>Return to Vault</a>"
                     )
                     return format_html(f"<ul><li>{close_parcel}</li><{return_to_vault}</li></ul>")
-            if (
-                transfer.in_transit()
-                and transfer.to_user.username == "vault"
-                and user.groups.filter(name="vault_manager").exists()
-            ):
+            if transfer.in_transit() and transfer.to_user.username == "vault" and is_vault_manager():
                 confirm_stones = (
                     f"<a href='{reverse('grading:confirm_received', args=[self.id])}'>Confirm Stones for Vault</a>"
                 )
@@ -622,9 +1137,11 @@ class GoldwayVerification(models.Model):
     invoice_number = models.CharField(max_length=15, unique=True, blank=True)
     started = models.DateTimeField(auto_now_add=True)
 
+    code_field = "invoice_number"
+
     @property
     def code(self):
-        return self.invoice_number
+        return getattr(self, self.code_field)
 
     def summary(self):
         return f"{self.stone_set.count()} stones"
@@ -635,9 +1152,11 @@ class GiaVerification(models.Model):
     invoice_number = models.CharField(max_length=15, blank=True)
     started = models.DateTimeField(auto_now_add=True)
 
+    code_field = "receipt_number"
+
     @property
     def code(self):
-        return self.receipt_number
+        return getattr(self, self.code_field)
 
     def summary(self):
         return f"{self.stone_set.count()} stones"
@@ -668,6 +1187,9 @@ class Stone(
     macro_filename = models.CharField(max_length=20, unique=True, null=True, blank=True)
     nano_filename = models.CharField(max_length=20, unique=True, null=True, blank=True)
 
+    # data version of the stone, used to key the export cache
+    modified_date = models.DateTimeField(auto_now=True, null=True)
+
     objects = StoneManager()
 
     def __str__(self):
@@ -739,9 +1261,10 @@ class Stone(
         self.external_id = self.external_id[:-2]  # Just strip of -B
         self.save_external()
 
-    def generate_basic_external_id(self):
+    def generate_basic_external_id(self, save=True):
         """
         Generates full basic external_id
+        :param save: set to False to only set external_id, e.g. when the stone is saved with bulk_update
         :returns:
         """
         payload_part = self.generate_payload()
@@ -750,7 +1273,8 @@ class Stone(
         hashed = hashlib.blake2b(digest_size=3)
         hashed.update(payload_part.encode("utf-8"))  # 4 characters # GB starts the ID
         self.external_id = f"G{hashed.hexdigest()[:-1]}{later_part}-B"
-        self.save_external()
+        if save:
+            self.save_external()
 
     @property
     def is_sarine_grading_complete(self):
@@ -788,7 +1312,7 @@ class Stone(
         Returns true / false on whether it is done with goldway grading
         :return:
         """
-        return self.gw_verification is not None and self.date_from_gw is not None
+        return self.gw_verification_id is not None and self.date_from_gw is not None
 
     @property
     def is_gia_grading_complete(self):
@@ -796,7 +1320,7 @@ class Stone(
         Returns true /false on whether it is done with gia grading
         :return:
         """
-        return self.gia_verification is not None and self.date_from_gia is not None
+        return self.gia_verification_id is not None and self.date_from_gia is not None
 
     @property
     def is_goldway_adjusting_grading_complete(self):
@@ -841,3 +1365,153 @@ class Stone(
             and self.is_gia_grading_complete
             and self.is_gia_adjusting_grading_complete
         )
+
+
+class ExportJob(models.Model):
+    """
+    A csv export built in the background by the `run_export_jobs` worker. Pending jobs are the queue,
+    so no broker is needed
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PENDING, "Pending"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+
+    # export_type: (label, StoneManager method generating the csv, filename prefix)
+    EXPORT_TYPES = {
+        "master_report": ("Master Report", "generate_master_report_csv", "Master_report_"),
+        "triple_report": ("Triple Report", "generate_triple_report_csv", "Triple_Report_Lab_Export"),
+        "basic_report": ("Basic Report", "generate_basic_report_csv", "Basic_Report"),
+    }
+    EXPORT_TYPE_CHOICES = [(export_type, label) for export_type, (label, _, _) in EXPORT_TYPES.items()]
+
+    # a job still running after this long is taken to belong to a dead worker
+    RUNNING_TIMEOUT = timedelta(hours=1)
+
+    export_type = models.CharField(max_length=20, choices=EXPORT_TYPE_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    # comma separated pks and order_by() of the exported queryset
+    stone_ids = models.TextField()
+    ordering = models.TextField(blank=True)
+
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    file = models.FileField(upload_to="csv_downloads/export_jobs/", blank=True)
+    error = models.TextField(blank=True)
+
+    created_by = models.ForeignKey(User, on_delete=models.PROTECT, related_name="export_jobs")
+    created_date = models.DateTimeField(auto_now_add=True)
+    started_date = models.DateTimeField(null=True, blank=True)
+    finished_date = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_export_type_display()} #{self.pk} ({self.status})"
+
+    @classmethod
+    def enqueue(cls, export_type, queryset, created_by):
+        """
+        Queues the export of the stones in `queryset`, keeping its ordering
+        :param export_type: one of EXPORT_TYPES
+        :param queryset:
+        :param created_by:
+        :return:
+        """
+        if export_type not in cls.EXPORT_TYPES:
+            raise ValueError(f"Unknown export type `{export_type}`")
+
+        order_by = queryset.query.order_by
+        ordering = ",".join(order_by) if all(isinstance(field, str) for field in order_by) else ""
+        stone_ids = list(queryset.order_by("pk").values_list("pk", flat=True))
+        return cls.objects.create(
+            export_type=export_type,
+            stone_ids=",".join(str(stone_id) for stone_id in stone_ids),
+            ordering=ordering,
+            total_rows=len(stone_ids),
+            created_by=created_by,
+        )
+
+    @classmethod
+    def requeue_stale(cls, timeout=None):
+        """
+        Puts the jobs running for longer than `timeout` back in the queue, their worker is assumed dead
+        :param timeout: defaults to RUNNING_TIMEOUT
+        :return: the number of jobs requeued
+        """
+        timeout = cls.RUNNING_TIMEOUT if timeout is None else timeout
+        started_before = datetime.utcnow().replace(tzinfo=utc) - timeout
+        return cls.objects.filter(status=cls.RUNNING, started_date__lt=started_before).update(
+            status=cls.PENDING, started_date=None, processed_rows=0
+        )
+
+    @classmethod
+    def claim_next(cls, timeout=None):
+        """
+        Marks the oldest pending job as running and returns it, or None if the queue is empty.
+        The status update only succeeds for one worker, so several workers can share the queue.
+        Jobs left running by a dead worker are queued again first
+        :param timeout: see requeue_stale
+        :return:
+        """
+        cls.requeue_stale(timeout)
+        for job in cls.objects.filter(status=cls.PENDING).order_by("created_date", "pk"):
+            started_date = datetime.utcnow().replace(tzinfo=utc)
+            claimed = cls.objects.filter(pk=job.pk, status=cls.PENDING).update(
+                status=cls.RUNNING, started_date=started_date
+            )
+            if claimed:
+                job.status = cls.RUNNING
+                job.started_date = started_date
+                return job
+        return None
+
+    def get_queryset(self):
+        stone_ids = [int(stone_id) for stone_id in self.stone_ids.split(",") if stone_id]
+        queryset = Stone.objects.filter(pk__in=stone_ids)
+        if self.ordering:
+            queryset = queryset.order_by(*self.ordering.split(","))
+        return queryset
+
+    @property
+    def progress(self):
+        """
+        Returns the percentage of rows written so far
+        :return:
+        """
+        if self.status == self.DONE:
+            return 100
+        if not self.total_rows:
+            return 0
+        return int(100 * self.processed_rows / self.total_rows)
+
+    def run(self):
+        """
+        Writes the export to `file`, saving processed_rows after every chunk so the admin can show progress.
+        Any error marks the job as failed instead of being raised
+        :return:
+        """
+        _, method_name, filename_prefix = self.EXPORT_TYPES[self.export_type]
+        # the files are only served by ExportJobAdmin, the random part keeps them from being guessed under MEDIA_URL
+        timestamp = datetime.utcnow().strftime("%d-%m-%Y_%H-%M-%S")
+        filename = f"{filename_prefix}{timestamp}_{secrets.token_hex(8)}.csv"
+
+        try:
+            with tempfile.TemporaryFile() as file:
+                lines = getattr(Stone.objects, method_name)(self.get_queryset(), stream=True)
+                file.write(next(lines).encode())
+                self.processed_rows = 0
+                for line in lines:
+                    file.write(line.encode())
+                    self.processed_rows += 1
+                    if self.processed_rows % EXPORT_CHUNK_SIZE == 0:
+                        ExportJob.objects.filter(pk=self.pk).update(processed_rows=self.processed_rows)
+                self.file.save(filename, File(file, name=filename), save=False)
+        except Exception:
+            self.status = self.FAILED
+            self.error = traceback.format_exc()
+        else:
+            self.status = self.DONE
+
+        self.finished_date = datetime.utcnow().replace(tzinfo=utc)
+        self.save()
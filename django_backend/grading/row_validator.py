@@ -0,0 +1,37 @@
+class RowValidator:
+
+    # Validates csv rows like form_class(row).is_valid() would, with one form instance per upload:
+    # the form (and its deep copied fields) is built once and bound to every row in turn
+
+    def __init__(self, form_class):
+        """
+        :param form_class: ModelForm class
+        """
+        self.form = form_class(data={})
+        self.model = self.form._meta.model
+
+    def row_errors(self, data):
+        """
+        Bind the form to a row and validate it
+        :param data: dict of field: value
+        :return: the ErrorDict of the row, empty if it is valid
+        """
+        self.form.data = data
+        # a new instance per row, construct_instance() leaves the defaults of the fields missing from the row
+        self.form.instance = self.model()
+        self.form._bound_fields_cache = {}
+        self.form.full_clean()
+        return self.form.errors
+
+    def errors(self, rows):
+        """
+        Validate every row once
+        :param rows: list of dicts of field: value
+        :return: {row number: ErrorDict} of the invalid rows, the same as form_class(row).errors
+        """
+        errors = {}
+        for row, data in enumerate(rows):
+            row_errors = self.row_errors(data)
+            if row_errors:
+                errors[row] = row_errors
+        return errors
@@ -1,15 +1,38 @@
+import csv
+import io
+import os
+import tempfile
+from datetime import timedelta
 from decimal import Decimal
 
 from unittest.mock import patch
 
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
 from django.contrib.admin.sites import AdminSite
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
 import pandas as pd
 
-from grading.admin import StoneAdmin
-from grading.models import Stone
+from grading.admin import ExportJobAdmin, StoneAdmin
+from grading.models import (
+    ExportJob,
+    GiaVerification,
+    GoldwayVerification,
+    Parcel,
+    Receipt,
+    Split,
+    Stone,
+    compile_csv_column,
+    evict_export_cache,
+    generate_csv_rows,
+)
+from grading.helpers import get_stone_fields
 from grading.forms import (
     SarineUploadForm,
     BasicUploadForm,
@@ -19,12 +42,12 @@ from grading.forms import (
     GIAAdjustingUploadForm,
 )
 
-from ownerships.models import StoneTransfer
+from customers.models import Entity
+from ownerships.models import AbstractItemCustody, ParcelTransfer, StoneCustody, StoneTransfer
 
 from stonegrading.mixins import GWGradingAdjustMixin, GIAGradingAdjustMixin, BasicGradingMixin
 from stonegrading.grades import CuletCharacteristics
 
-
 User = get_user_model()
 
 """
@@ -57,6 +80,14 @@ class DownloadCSVAdminTest(TestCase):
 
         self.request = RequestFactory()
 
+    def get_response_content(self, response):
+        """
+        Consume the streamed csv download and return it as a string
+        :param response:
+        :return:
+        """
+        return b"".join(response.streaming_content).decode()
+
     def upload_initial_grading_results(self):
         """
         Upload both basic and sarine
@@ -148,7 +179,7 @@ class DownloadCSVAdminTest(TestCase):
         self.assertTrue(file_name.startswith("Basic_Grading_Template_"))
 
         # Test content of csv file
-        headers, content = [row for row in response.content.decode().split("\n") if row != ""]
+        headers, content = [row for row in self.get_response_content(response).split("\n") if row != ""]
         headers = headers.split(",")
 
         self.assertEqual(len(headers), 41)
@@ -166,7 +197,7 @@ class DownloadCSVAdminTest(TestCase):
         self.assertEqual(disposition_type, "attachment")
         self.assertTrue(file_name.startswith("Adjust_Goldway"))
 
-        headers, content = [row for row in response.content.decode().split("\n") if row != ""]
+        headers, content = [row for row in self.get_response_content(response).split("\n") if row != ""]
         headers = headers.split(",")
         self.assertEqual(len(headers), 24)
 
@@ -189,7 +220,7 @@ class DownloadCSVAdminTest(TestCase):
         self.assertEqual(disposition_type, "attachment")
         self.assertTrue(file_name.startswith("To_GIA"))
 
-        headers, content = [row for row in response.content.decode().split("\n") if row != ""]
+        headers, content = [row for row in self.get_response_content(response).split("\n") if row != ""]
         headers = headers.split(",")
 
         self.assertEqual(len(headers), 5)
@@ -220,7 +251,7 @@ class DownloadCSVAdminTest(TestCase):
         self.assertEqual(disposition_type, "attachment")
         self.assertTrue(file_name.startswith("Adjust_GIA"))
 
-        headers, content = [row for row in response.content.decode().split("\n") if row != ""]
+        headers, content = [row for row in self.get_response_content(response).split("\n") if row != ""]
         headers = headers.split(",")
         self.assertEqual(len(headers), 23)
 
@@ -248,7 +279,7 @@ class DownloadCSVAdminTest(TestCase):
         self.assertEqual(disposition_type, "attachment")
         self.assertTrue(file_name.startswith("Basic_Report"))
 
-        headers, content = [row for row in response.content.decode().split("\n") if row != ""]
+        headers, content = [row for row in self.get_response_content(response).split("\n") if row != ""]
         headers = headers.split(",")
         self.assertEqual(len(headers), 64)
 
@@ -335,7 +366,7 @@ class DownloadCSVAdminTest(TestCase):
         self.assertEqual(disposition_type, "attachment")
         self.assertTrue(file_name.startswith("Triple_Report_Lab_Export"))
 
-        content = [row for row in response.content.decode().split("\n") if row != ""]
+        content = [row for row in self.get_response_content(response).split("\n") if row != ""]
         content, headers = content[1:], content[0]
         headers = headers.split(",")
         self.assertEqual(len(headers), 29)
@@ -471,7 +502,7 @@ class DownloadCSVAdminTest(TestCase):
         self.assertTrue(file_name.startswith("Goldway_Grading_Template_"))
 
         # Test content of csv file
-        headers, content = [row for row in response.content.decode().split("\n") if row != ""]
+        headers, content = [row for row in self.get_response_content(response).split("\n") if row != ""]
         headers = headers.split(",")
 
         self.assertEqual(len(headers), 9)
@@ -498,7 +529,7 @@ class DownloadCSVAdminTest(TestCase):
         self.assertTrue(file_name.startswith("GIA_Grading_Template_"))
 
         # Test content of csv file
-        headers, content = [row for row in response.content.decode().split("\n") if row != ""]
+        headers, content = [row for row in self.get_response_content(response).split("\n") if row != ""]
         headers = headers.split(",")
 
         self.assertEqual(len(headers), 7)
@@ -523,7 +554,346 @@ class DownloadCSVAdminTest(TestCase):
         self.assertEqual(disposition_type, "attachment")
         self.assertTrue(file_name.startswith("Gradia_ids_"))
 
-        headers, content = [row for row in response.content.decode().split('\n"')]
+        headers, content = [row for row in self.get_response_content(response).split('\n"')]
         header = headers.split(",")
         self.assertEqual(len(header), 1)
         self.assertEqual(headers, "external_id")
+
+    def test_download_csv_is_streamed_without_writing_to_disk(self):
+        with patch("grading.models.generate_csv") as mocked_generate_csv:
+            response = self.admin.download_master_reports(request=self.request, queryset=self.queryset)
+            content = self.get_response_content(response)
+
+        self.assertTrue(response.streaming)
+        self.assertFalse(mocked_generate_csv.called)
+
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(len(rows), self.queryset.count() + 1)
+        self.assertEqual(rows[0], get_stone_fields(Stone))
+        # the master report columns are the stone data, without the modified_date bookkeeping column
+        self.assertNotIn("modified_date", rows[0])
+        self.assertEqual(len(rows[0]), len(Stone._meta.fields) - 1)
+
+    def test_download_csv_archives_to_disk_when_enabled(self):
+        self.admin.archive_csv_downloads = True
+        media_root = tempfile.mkdtemp()
+        with self.settings(MEDIA_ROOT=media_root):
+            response = self.admin.download_master_reports(request=self.request, queryset=self.queryset)
+            content = self.get_response_content(response)
+
+        archive_dir = os.path.join(media_root, "csv_downloads", "master_reports")
+        (archived_file,) = os.listdir(archive_dir)
+        with open(os.path.join(archive_dir, archived_file)) as file:
+            self.assertEqual(file.read(), content)
+
+    def test_csv_cell_is_empty_when_the_attribute_raises(self):
+        # a stone without split_from has no parcel
+        stone = Stone(internal_id=1)
+        for field in ("parcel_code", "customer_receipt_number"):
+            self.assertEqual(compile_csv_column(field, {}, Stone, is_lab_export=False)(stone), "")
+        self.assertEqual(compile_csv_column("internal_id", {}, Stone, is_lab_export=False)(stone), 1)
+
+    def test_export_query_count_does_not_grow_with_row_count(self):
+        self.upload_all_grading_results()
+
+        query_counts = []
+        for internal_ids in ((1,), (1, 5, 6)):
+            queryset = self.queryset.filter(internal_id__in=internal_ids)
+            for generate in (Stone.objects.generate_triple_report_csv, Stone.objects.generate_master_report_csv):
+                with CaptureQueriesContext(connection) as context:
+                    list(generate(queryset, stream=True))
+                query_counts.append(len(context.captured_queries))
+
+        single_stone_counts, many_stones_counts = query_counts[:2], query_counts[2:]
+        self.assertEqual(single_stone_counts, many_stones_counts)
+        # one query for the stones, one to prefetch the inclusions
+        self.assertEqual(many_stones_counts[0], 2)
+
+    def test_export_rows_keep_reversed_queryset_order_across_chunks(self):
+        for queryset in (self.queryset, self.queryset.order_by("-pk"), self.queryset.order_by("internal_id", "-pk")):
+            expected_ids = [str(stone.internal_id) for stone in reversed(queryset.all())]
+
+            with patch("grading.models.EXPORT_CHUNK_SIZE", 2):
+                rows = list(generate_csv_rows(["internal_id"], queryset, {}))
+
+            self.assertEqual(rows[0], ["internal_id"])
+            self.assertEqual([str(row[0]) for row in rows[1:]], expected_ids)
+
+    def test_download_triple_report_parquet_matches_csv(self):
+        self.upload_all_grading_results()
+        queryset = self.queryset.filter(internal_id__in=(1, 5, 6))
+
+        csv_response = self.admin.download_export_triple_report_to_lab(request=self.request, queryset=queryset)
+        response = self.admin.download_triple_report_parquet(request=self.request, queryset=queryset)
+
+        self.assertEqual(response["Content-Type"], "application/vnd.apache.parquet")
+        self.assertTrue(response["Content-Disposition"].endswith(".parquet"))
+
+        csv_content = io.StringIO(self.get_response_content(csv_response))
+        csv_frame = pd.read_csv(csv_content, dtype=str, keep_default_na=False)
+        frame = pd.read_parquet(io.BytesIO(response.content))
+        pd.testing.assert_frame_equal(frame, csv_frame, check_dtype=False)
+
+    def test_download_master_report_feather_matches_csv(self):
+        self.upload_all_grading_results()
+
+        csv_response = self.admin.download_master_reports(request=self.request, queryset=self.queryset)
+        response = self.admin.download_master_reports_feather(request=self.request, queryset=self.queryset)
+
+        csv_content = io.StringIO(self.get_response_content(csv_response))
+        csv_frame = pd.read_csv(csv_content, dtype=str, keep_default_na=False)
+        frame = pd.read_feather(io.BytesIO(response.content))
+        # every column, including the foreign keys (split_from, verifications, graders)
+        pd.testing.assert_frame_equal(frame, csv_frame, check_dtype=False)
+
+    def test_columnar_export_rejects_unknown_format(self):
+        with self.assertRaises(ValueError):
+            Stone.objects.generate_master_report(self.queryset, "xlsx")
+
+    def test_large_report_download_is_queued_and_built_by_worker(self):
+        expected_content = self.get_response_content(
+            self.admin.download_master_reports(request=self.request, queryset=self.queryset)
+        )
+
+        request = RequestFactory().get("/")
+        request.user = User.objects.get(username="gary")
+        self.admin.background_export_threshold = 0
+        with patch("grading.admin.messages") as mocked_messages:
+            response = self.admin.download_master_reports(request=request, queryset=self.queryset)
+
+        self.assertIsNone(response)
+        self.assertTrue(mocked_messages.info.called)
+        job = ExportJob.objects.get()
+        self.assertEqual(job.status, ExportJob.PENDING)
+        self.assertEqual(job.total_rows, self.queryset.count())
+
+        with self.settings(MEDIA_ROOT=tempfile.mkdtemp()):
+            call_command("run_export_jobs", "--once", stdout=io.StringIO())
+            job.refresh_from_db()
+            self.assertEqual(job.status, ExportJob.DONE)
+            self.assertEqual(job.processed_rows, job.total_rows)
+            self.assertEqual(job.progress, 100)
+            with job.file.open() as file:
+                self.assertEqual(file.read().decode(), expected_content)
+
+    def test_export_job_is_claimed_once(self):
+        job = ExportJob.enqueue("triple_report", self.queryset, created_by=User.objects.get(username="gary"))
+
+        self.assertEqual(ExportJob.claim_next(), job)
+        self.assertIsNone(ExportJob.claim_next())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.RUNNING)
+
+    def test_stale_running_export_job_is_claimed_again(self):
+        job = ExportJob.enqueue("triple_report", self.queryset, created_by=User.objects.get(username="gary"))
+        self.assertEqual(ExportJob.claim_next(), job)
+
+        # still within the timeout, the worker may be alive
+        self.assertIsNone(ExportJob.claim_next())
+
+        ExportJob.objects.filter(pk=job.pk).update(
+            started_date=now() - ExportJob.RUNNING_TIMEOUT - timedelta(minutes=1)
+        )
+        self.assertEqual(ExportJob.claim_next(), job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.RUNNING)
+
+    def test_export_job_file_is_only_served_to_its_creator_or_viewers(self):
+        creator = User.objects.get(username="gary")
+        creator.is_staff = True
+        creator.save()
+        other_user = User.objects.get(username="kary")
+        other_user.is_staff = True
+        other_user.save()
+
+        job = ExportJob.enqueue("basic_report", self.queryset, created_by=creator)
+        with self.settings(MEDIA_ROOT=tempfile.mkdtemp()):
+            call_command("run_export_jobs", "--once", stdout=io.StringIO())
+            job.refresh_from_db()
+            download_url = reverse("admin:grading_exportjob_download", args=(job.pk,))
+
+            self.client.force_login(other_user)
+            self.assertEqual(self.client.get(download_url).status_code, 403)
+
+            self.client.force_login(creator)
+            response = self.client.get(download_url)
+            self.assertEqual(response.status_code, 200)
+            with job.file.open() as file:
+                self.assertEqual(b"".join(response.streaming_content), file.read())
+            response.close()
+
+            self.client.force_login(User.objects.get(username="admin"))
+            self.assertEqual(self.client.get(download_url).status_code, 200)
+
+        # the file is linked through the admin, not MEDIA_URL
+        self.assertIn(download_url, ExportJobAdmin(model=ExportJob, admin_site=AdminSite()).download_link(job))
+
+    def test_admin_downloads_are_not_cached_by_default(self):
+        self.assertFalse(self.admin.cache_csv_downloads)
+
+        with patch("grading.models.get_export_cache_path") as get_export_cache_path:
+            response = self.admin.download_master_reports(request=self.request, queryset=self.queryset)
+            self.get_response_content(response)
+        self.assertFalse(get_export_cache_path.called)
+
+    def test_cached_export_is_served_without_querying_the_stones(self):
+        with self.settings(MEDIA_ROOT=tempfile.mkdtemp()):
+            content = "".join(Stone.objects.generate_to_GIA_csv(self.queryset, stream=True, cache=True))
+            with CaptureQueriesContext(connection) as context:
+                cached_content = "".join(Stone.objects.generate_to_GIA_csv(self.queryset, stream=True, cache=True))
+
+            self.assertEqual(cached_content, content)
+            # only the data version of the stones is queried
+            self.assertEqual(len(context.captured_queries), 1)
+
+            stone = self.queryset.first()
+            stone.external_id = "G0000000001"
+            stone.save()
+            updated_content = "".join(Stone.objects.generate_to_GIA_csv(self.queryset, stream=True, cache=True))
+            self.assertIn("G0000000001", updated_content)
+
+    def test_export_cache_evicts_least_recently_used_files(self):
+        cache_dir = tempfile.mkdtemp()
+        for index, name in enumerate(("old.csv", "recent.csv")):
+            path = os.path.join(cache_dir, name)
+            with open(path, "w") as file:
+                file.write("x" * 10)
+            os.utime(path, (index, index))
+
+        evict_export_cache(cache_dir, max_bytes=15)
+
+        self.assertEqual(os.listdir(cache_dir), ["recent.csv"])
+
+
+class ParcelAdminChangelistTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(username="admin", password="admin")
+        self.vault = User.objects.create(username="vault")
+        self.user.groups.add(Group.objects.create(name="vault_manager"))
+        self.receipt = Receipt.objects.create(
+            entity=Entity.objects.create(name="Van Klaren", address="addressy", phone="12345678", email="vk@vk.com"),
+            code="VK-0001",
+            intake_by=self.user,
+        )
+        self.client.login(username="admin", password="admin")
+
+    def add_parcels(self, count):
+        for _ in range(count):
+            number = Parcel.objects.count()
+            parcel = Parcel.objects.create(
+                receipt=self.receipt,
+                gradia_parcel_code=f"VK{number}",
+                customer_parcel_code=f"cust-{number}",
+                total_carats=2,
+                total_pieces=2,
+                reference_price_per_carat=1,
+            )
+            ParcelTransfer.objects.create(
+                item=parcel, from_user=self.user, to_user=self.vault, created_by=self.user, fresh=True
+            )
+
+            # split every parcel into another one
+            split = Split.objects.create(original_parcel=parcel, split_by=self.user)
+            split_parcel = Parcel.objects.create(
+                receipt=self.receipt,
+                gradia_parcel_code=f"VK{number}-1",
+                customer_parcel_code=f"cust-{number}-1",
+                total_carats=1,
+                total_pieces=1,
+                reference_price_per_carat=1,
+                split_from=split,
+            )
+            ParcelTransfer.objects.create(
+                item=split_parcel, from_user=self.user, to_user=self.user, created_by=self.user, confirmed_date=now()
+            )
+
+    def changelist_query_count(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("admin:grading_parcel_changelist"), {"owner": "include"})
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.content.decode()
+
+    def test_changelist_query_count_does_not_grow_with_row_count(self):
+        self.add_parcels(2)
+        few_parcels_count, content = self.changelist_query_count()
+        self.assertIn("1 parcels", content)
+        self.assertIn("Confirm Stones for Vault", content)
+
+        self.add_parcels(8)
+        many_parcels_count, content = self.changelist_query_count()
+        self.assertEqual(content.count("Return to Vault"), 10)
+        self.assertEqual(few_parcels_count, many_parcels_count)
+
+
+class StoneAdminTransferActionsTest(TestCase):
+    fixtures = ("grading/fixtures/test_data.json",)
+
+    def setUp(self):
+        self.admin = StoneAdmin(model=Stone, admin_site=AdminSite())
+        self.grader = User.objects.get(username="gary")
+        self.vault = User.objects.get(username="vault")
+
+        file = open("grading/tests/fixtures/sarine-01.csv", "rb")
+        form = SarineUploadForm(
+            data={}, files={"file": SimpleUploadedFile(file.name, file.read())}, user=self.grader
+        )
+        self.assertTrue(form.is_valid())
+        form.save()
+
+        # the stones start in the vault
+        for stone in Stone.objects.all():
+            StoneTransfer.initiate_transfer(
+                item=stone, from_user=stone.custody.holder, to_user=self.vault, created_by=self.grader
+            )
+            StoneTransfer.confirm_received(item=stone)
+
+        self.stones = Stone.objects.all()
+
+    def get_request(self, user):
+        request = RequestFactory().get("/")
+        request.user = user
+        return request
+
+    def assertTransferredTo(self, to_user, from_user):
+        """
+        Every stone has a fresh unconfirmed transfer from from_user to to_user, and is in its custody
+        :param to_user:
+        :param from_user:
+        :return:
+        """
+        for stone in self.stones:
+            transfer = StoneTransfer.most_recent_transfer(stone)
+            self.assertEqual(transfer.from_user, from_user)
+            self.assertEqual(transfer.to_user, to_user)
+            self.assertTrue(transfer.fresh)
+            self.assertIsNone(transfer.confirmed_date)
+
+            custody = StoneCustody.objects.get(item=stone)
+            self.assertEqual(custody.transfer, transfer)
+            self.assertEqual(custody.holder, to_user)
+            self.assertEqual(custody.status, AbstractItemCustody.UNCONFIRMED)
+
+    def test_transfer_to_goldway(self):
+        self.admin.transfer_to_goldway(self.get_request(self.grader), self.stones)
+
+        self.assertTransferredTo(User.objects.get(username="goldway"), from_user=self.vault)
+        verification = GoldwayVerification.objects.get()
+        for stone in self.stones:
+            self.assertEqual(stone.gw_verification, verification)
+
+    def test_transfer_to_GIA(self):
+        self.admin.transfer_to_GIA(self.get_request(self.grader), self.stones)
+
+        self.assertTransferredTo(User.objects.get(username="gia"), from_user=self.vault)
+        verification = GiaVerification.objects.get()
+        for stone in self.stones:
+            self.assertEqual(stone.gia_verification, verification)
+
+    def test_transfer_to_vault(self):
+        goldway = User.objects.get(username="goldway")
+        self.admin.transfer_to_goldway(self.get_request(self.grader), self.stones)
+        self.admin.confirm_received_stones(self.get_request(goldway), self.stones)
+
+        self.admin.transfer_to_vault(self.get_request(goldway), self.stones)
+
+        self.assertTransferredTo(self.vault, from_user=goldway)
@@ -1,11 +1,18 @@
+import re
+from unittest.mock import patch
 from decimal import Decimal
 
+import pandas as pd
+
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils.datetime_safe import datetime
 from django.utils.timezone import utc
 from grading.forms import (
+    clean_column,
     UploadFormMetaClass,
     BaseUploadForm,
     SarineUploadForm,
@@ -18,7 +25,10 @@ from grading.forms import (
     NanoImageFilenameUploadForm,
 )
 from grading.models import Stone, GiaVerification
+from grading.inclusion_cache import INCLUSIONS
+from grading.row_validator import RowValidator
 from stonegrading.mixins import SarineGradingMixin
+from stonegrading.models import Inclusion
 from ownerships.models import StoneTransfer
 
 User = get_user_model()
@@ -251,6 +261,164 @@ class MetaClassTest(TestCase):
             self.assertIn(method, processing_methods)
 
 
+class CleanColumnTest(TestCase):
+    def test_cleaners_run_once_per_distinct_value(self):
+        """
+        Tests that the cleaners are applied in order, once per distinct value, with missing values passed as None
+        """
+        cleaned = []
+
+        def strip(value):
+            cleaned.append(value)
+            return value.strip() if isinstance(value, str) else value
+
+        def remarks(value):
+            return "" if value is None else value
+
+        column = pd.Series([" VS1 ", "VS2", " VS1 ", float("nan"), None, "VS2"])
+
+        self.assertEqual(list(clean_column(column, (strip, remarks))), ["VS1", "VS2", "VS1", "", "", "VS2"])
+        self.assertEqual(cleaned, [" VS1 ", "VS2", None])
+
+
+class RowValidatorTest(TestCase):
+    fixtures = ("grading/fixtures/test_data.json",)
+
+    def test_errors_match_validating_a_form_per_row(self):
+        """
+        Tests that the csv errors are the same as the errors of a StoneDataForm per row, in the same order
+        """
+
+        class SampleUploadClass(BaseUploadForm):
+            class Meta:
+                mixin = SarineGradingMixin
+                new = True
+
+        with open("grading/tests/fixtures/sarine-01-type.csv", "rb") as file:
+            form = SampleUploadClass(data={}, files={"file": SimpleUploadedFile(file.name, file.read())})
+        self.assertFalse(form.is_valid())
+
+        rows = form.stone_data + [dict(form.stone_data[0], internal_id="x", table_size=None, girdle_min_grade="?")]
+        expected_errors = {}
+        for row, data in enumerate(rows):
+            stone_data_form = form.StoneDataForm(data)
+            if not stone_data_form.is_valid():
+                expected_errors[row] = stone_data_form.errors
+
+        errors = RowValidator(form.StoneDataForm).errors(rows)
+        self.assertEqual(list(errors), list(expected_errors))
+        for row, error_dict in errors.items():
+            self.assertEqual(list(error_dict), list(expected_errors[row]))
+            self.assertEqual(str(error_dict), str(expected_errors[row]))
+        self.assertEqual(
+            {row: str(error_dict) for row, error_dict in form.csv_errors.items()},
+            {row: str(error_dict) for row, error_dict in list(expected_errors.items())[:-1]},
+        )
+
+
+class RowValidatorParityTest(TestCase):
+    """
+    RowValidator binds one form to every row in turn, these tests feed the rows every upload form validates
+    (plus a bad value in every column) through it and through a StoneDataForm per row, so no state of a row
+    leaks into the next
+    """
+
+    fixtures = ("grading/fixtures/test_data.json",)
+
+    def setUp(self):
+        self.user = User.objects.get(username="gary")
+        for form_class, csv_filename in ((SarineUploadForm, "sarine-01.csv"), (BasicUploadForm, "basic-01.csv")):
+            with open(f"grading/tests/fixtures/{csv_filename}", "rb") as file:
+                form = form_class(
+                    data={}, files={"file": SimpleUploadedFile(file.name, file.read())}, user=self.user
+                )
+            self.assertTrue(form.is_valid())
+            form.save()
+
+    def validated_rows(self, form_class, csv_filename, **kwargs):
+        """
+        Validate the csv with form_class and return the form and the rows it validated with RowValidator
+        :param form_class:
+        :param csv_filename:
+        :param kwargs:
+        :return:
+        """
+        validated = []
+        errors = RowValidator.errors
+
+        def spy(validator, rows):
+            validated.extend(dict(row) for row in rows)
+            return errors(validator, rows)
+
+        with open(f"grading/tests/fixtures/{csv_filename}", "rb") as file:
+            form = form_class(data={}, files={"file": SimpleUploadedFile(file.name, file.read())}, **kwargs)
+        with patch.object(RowValidator, "errors", spy):
+            form.is_valid()
+        self.assertTrue(validated, f"{form_class.__name__} did not validate the rows of {csv_filename}")
+        return form, validated
+
+    def assertSameErrorsAsFormPerRow(self, form_class, csv_filename, **kwargs):
+        form, rows = self.validated_rows(form_class, csv_filename, **kwargs)
+        for field in form.StoneDataForm.base_fields:
+            for bad_value in ("?", "", None):
+                rows.append(dict(rows[0], **{field: bad_value}))
+
+        expected_errors = {}
+        for row, data in enumerate(rows):
+            stone_data_form = form.StoneDataForm(data)
+            if not stone_data_form.is_valid():
+                expected_errors[row] = stone_data_form.errors
+
+        errors = RowValidator(form.StoneDataForm).errors(rows)
+        self.assertEqual(list(errors), list(expected_errors))
+        for row, error_dict in errors.items():
+            self.assertEqual(list(error_dict), list(expected_errors[row]), f"row {row}: {rows[row]}")
+            self.assertEqual(str(error_dict), str(expected_errors[row]), f"row {row}: {rows[row]}")
+
+    def test_sarine_upload(self):
+        self.assertSameErrorsAsFormPerRow(SarineUploadForm, "sarine-01-type.csv", user=self.user)
+
+    def test_basic_upload(self):
+        self.assertSameErrorsAsFormPerRow(BasicUploadForm, "basic-01-type.csv", user=self.user)
+
+    def test_goldway_grading_upload(self):
+        self.assertSameErrorsAsFormPerRow(GWGradingUploadForm, "gold_way_invalid.csv", user=self.user)
+
+    def test_goldway_adjusting_upload(self):
+        self.assertSameErrorsAsFormPerRow(GWAdjustingUploadForm, "gw_adjust_invalid.csv")
+
+    def test_gia_grading_upload(self):
+        self.assertSameErrorsAsFormPerRow(GIAUploadForm, "gia-invalid.csv", user=self.user)
+
+    def test_gia_adjusting_upload(self):
+        self.assertSameErrorsAsFormPerRow(GIAAdjustingUploadForm, "gia_adjusting_invalid.csv")
+
+
+class InclusionCacheTest(TestCase):
+    fixtures = ("grading/fixtures/test_data.json",)
+
+    def setUp(self):
+        INCLUSIONS.clear()
+        self.inclusion = Inclusion.objects.first()
+
+    def test_inclusions_are_loaded_once_and_cleared_when_an_inclusion_is_saved(self):
+        expected = {self.inclusion.inclusion: self.inclusion}
+        with self.assertNumQueries(1):
+            self.assertEqual(INCLUSIONS.get_inclusions([self.inclusion.inclusion]), expected)
+            self.assertEqual(INCLUSIONS.get_inclusions([self.inclusion.inclusion]), expected)
+
+        self.inclusion.save()
+        self.assertIsNone(INCLUSIONS.inclusions)
+
+    def test_unknown_inclusions_are_looked_up_in_one_query(self):
+        INCLUSIONS.load()
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                INCLUSIONS.get_inclusions(["Unknown 1", "Unknown 2", self.inclusion.inclusion]),
+                {self.inclusion.inclusion: self.inclusion},
+            )
+
+
 class BaseUploadFormClassTest(TestCase):
     """"""
 
@@ -735,6 +903,78 @@ class BasicUploadFormTest(TestCase):
                     error, f"Stone with internal_id: `{stone_ids[row_number]}` has already been uploaded"
                 )
 
+    def test_graders_are_resolved_in_one_query_and_unknown_graders_reported_together(self):
+        self.do_sarine_upload()
+
+        with open("grading/tests/fixtures/basic-01.csv", "rb") as file:
+            content = file.read().replace(b",Gary,Kary,Tanly,", b",Gary,Nobody,Ghost,", 1)
+
+        form = BasicUploadForm(
+            data={}, user=self.grader, files={"file": SimpleUploadedFile("basic-01.csv", content)}
+        )
+        self.assertFalse(form.is_valid())
+
+        grader_stage = next(stage for stage in form.timings.stages if stage["stage"] == "process_graders")
+        self.assertEqual(grader_stage["queries"], 1)
+        self.assertEqual(
+            {field: list(errors) for field, errors in form.csv_errors[0].items()},
+            {
+                "basic_grader_2": ["Grader user `Nobody` account does not exist"],
+                "basic_grader_3": ["Grader user `Ghost` account does not exist"],
+            },
+        )
+        self.assertEqual(list(form.csv_errors), [0])
+
+    def test_stone_queries_do_not_grow_with_row_count(self):
+        """
+        Tests that the existence and already uploaded checks share one query on the stone table
+        """
+        self.do_sarine_upload()
+
+        with open("grading/tests/fixtures/basic-01.csv", "rb") as file:
+            header, *rows = file.read().splitlines(keepends=True)
+
+        stone_table = re.compile(r"FROM [`\"]?grading_stone[`\"]?\s")
+        stone_query_counts = []
+        for row_count in (1, len(rows)):
+            content = header + b"".join(rows[:row_count])
+            form = BasicUploadForm(
+                data={}, user=self.grader, files={"file": SimpleUploadedFile("basic-01.csv", content)}
+            )
+            with CaptureQueriesContext(connection) as context:
+                self.assertTrue(form.is_valid())
+
+            stone_queries = [query["sql"] for query in context.captured_queries if stone_table.search(query["sql"])]
+            stone_query_counts.append(len(stone_queries))
+
+        self.assertEqual(stone_query_counts, [1, 1])
+
+    def test_save_query_count_does_not_grow_with_row_count(self):
+        """
+        Tests that the stones of an upload are saved with a fixed number of queries
+        """
+        self.do_sarine_upload()
+
+        with open("grading/tests/fixtures/basic-01.csv", "rb") as file:
+            header, *rows = file.read().splitlines(keepends=True)
+
+        save_query_counts = []
+        for upload_rows in (rows[:1], rows[1:]):
+            content = header + b"".join(upload_rows)
+            form = BasicUploadForm(
+                data={}, user=self.grader, files={"file": SimpleUploadedFile("basic-01.csv", content)}
+            )
+            self.assertTrue(form.is_valid())
+            with CaptureQueriesContext(connection) as context:
+                form.save()
+            save_query_counts.append(len(context.captured_queries))
+
+        self.assertGreater(len(rows[1:]), 1)
+        self.assertEqual(save_query_counts[0], save_query_counts[1])
+        for stone in Stone.objects.filter(internal_id__in=(1, 5, 6)):
+            self.assertTrue(stone.is_basic_grading_complete)
+            self.assertIsNotNone(stone.external_id)
+
 
 def get_date_from_str(date_string):
     day, month, year = [int(value) for value in date_string.split("/")]
@@ -0,0 +1,106 @@
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.forms.models import model_to_dict
+
+from grading.auto_grade.grading_modules.batch_grading_calculations import AUTO_GRADE_INPUT_FIELDS
+from grading.auto_grade.process_csv import auto_grade_stone, grade_chunk
+from grading.forms import SarineUploadForm, BasicUploadForm
+from grading.models import Stone
+
+User = get_user_model()
+
+
+class RegradeStonesManagementCommandTest(TestCase):
+    fixtures = ("grading/fixtures/test_data.json",)
+
+    def setUp(self):
+        self.upload_initial_stone_data()
+
+    def upload_initial_stone_data(self):
+        """
+        Upload sarine and basic grading results
+        :return:
+        """
+        with open("grading/tests/fixtures/sarine-01.csv", "rb") as csv_file:
+            upload_file = SimpleUploadedFile(csv_file.name, csv_file.read())
+
+        form = SarineUploadForm(data={}, files={"file": upload_file}, user=User.objects.get(username="kary"))
+        self.assertTrue(form.is_valid())
+        form.save()
+
+        with open("grading/tests/fixtures/basic-01.csv", "rb") as csv_file:
+            upload_file = SimpleUploadedFile(csv_file.name, csv_file.read())
+
+        form = BasicUploadForm(data={}, files={"file": upload_file}, user=User.objects.get(username="kary"))
+        self.assertTrue(form.is_valid())
+        form.save()
+
+    def test_regrade_restores_auto_grades(self):
+        """
+        Tests that regrade_stones saves the same auto grades as the basic upload
+        :return:
+        """
+        stone = Stone.objects.exclude(auto_girdle_grade="PR").first()
+        expected_grade = stone.auto_girdle_grade
+        auto_fields = [field.name for field in Stone._meta.fields if field.name.startswith("auto")]
+        other_grades = {field: getattr(stone, field) for field in auto_fields if field != "auto_girdle_grade"}
+        Stone.objects.filter(pk=stone.pk).update(auto_girdle_grade="PR")
+
+        out = io.StringIO()
+        call_command("regrade_stones", "--workers", "0", "--chunk-size", "2", stdout=out)
+
+        stone.refresh_from_db()
+        self.assertEqual(stone.auto_girdle_grade, expected_grade)
+        # the auto grades that did not change are kept
+        self.assertEqual({field: getattr(stone, field) for field in other_grades}, other_grades)
+        self.assertIn(f"{Stone.objects.count()} stones graded, changed for 1, 0 failed", out.getvalue())
+
+        for stone in Stone.objects.all():
+            stone_dict = model_to_dict(stone, exclude=[field.name for field in Stone._meta.many_to_many])
+            for field, value in auto_grade_stone(dict(stone_dict)).items():
+                if field.startswith("auto"):
+                    self.assertEqual(getattr(stone, field), value)
+
+    def test_chunks_are_graded_in_spawned_workers(self):
+        """
+        Tests that grade_chunk can be unpickled by workers which do not set up Django (spawn is the default start
+        method on macOS and Windows)
+        :return:
+        """
+        stones = pd.DataFrame.from_records(Stone.objects.values("pk", "internal_id", *AUTO_GRADE_INPUT_FIELDS))
+
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            graded, errors = executor.submit(grade_chunk, stones).result()
+
+        expected_graded, expected_errors = grade_chunk(stones)
+        pd.testing.assert_frame_equal(graded, expected_graded)
+        self.assertEqual(errors, expected_errors)
+
+    def test_dry_run_prints_changes_without_saving(self):
+        stone = Stone.objects.exclude(auto_girdle_grade="PR").first()
+        Stone.objects.filter(pk=stone.pk).update(auto_girdle_grade="PR")
+
+        out = io.StringIO()
+        call_command("regrade_stones", "--workers", "0", "--dry-run", stdout=out)
+
+        stone.refresh_from_db()
+        self.assertEqual(stone.auto_girdle_grade, "PR")
+        self.assertIn(f"{stone.internal_id} auto_girdle_grade: 'PR' ->", out.getvalue())
+        self.assertIn("would change for 1", out.getvalue())
+
+    def test_filters_stones_by_parcel(self):
+        out = io.StringIO()
+        call_command("regrade_stones", "--workers", "0", "--parcel", "no-such-parcel", stdout=out)
+        self.assertIn("0 stones graded", out.getvalue())
+
+    def test_invalid_date_raises_command_error(self):
+        with self.assertRaises(CommandError):
+            call_command("regrade_stones", "--workers", "0", "--since", "yesterday", stdout=io.StringIO())
@@ -1,13 +1,12 @@
 import re
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.messages.api import get_messages
 
 from grading.models import Parcel, Split, Stone
 from ownerships.models import StoneTransfer
 
-
 User = get_user_model()
 
 
@@ -111,6 +110,46 @@ class TestCSVUpload(TestCase):
         # float() because django will return a Decimal of 0.090
         self.assertEqual(float(stone_1.basic_carat), 0.09)
 
+    @override_settings(UPLOAD_TIMING_HEADER=True)
+    def test_basic_grading_data_upload_records_stage_timings(self):
+        """
+        Tests that the upload stages are logged and returned in the Server-Timing header
+        :return:
+        """
+        Stone.objects.all().delete()
+        self.setup_sarine_data()
+        self.client.login(**self.grader)
+        with self.assertLogs("grading.upload_timing", level="INFO") as logs:
+            response = self.client.post(
+                self.basic_grading_data_upload_url, {"file": self.basic_grading_upload_csv_file}
+            )
+        self.assertEqual(response.status_code, 302)
+
+        stages = [record.upload_stage for record in logs.records]
+        self.assertEqual(
+            [stage["stage"] for stage in stages],
+            [
+                "read_csv",
+                "clean_columns",
+                "stone_index",
+                "process_graders",
+                "process_stone_upload",
+                "validate_rows",
+                "save",
+            ],
+        )
+        self.assertTrue(all(stage["rows"] == 3 for stage in stages))
+        self.assertEqual(stages[2]["queries"], 1)
+        self.assertIn("process_graders;dur=", response["Server-Timing"])
+
+    @override_settings(UPLOAD_TIMING_HEADER=False)
+    def test_upload_timing_header_is_not_added_when_disabled(self):
+        Stone.objects.all().delete()
+        self.client.login(**self.grader)
+        response = self.client.post(self.sarine_data_upload_url, {"file": self.sarine_upload_csv_file})
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn("Server-Timing", response)
+
     def test_gw_grading_data_upload_get_page(self):
         """
         Tests that gold way grading upload get page returns 200
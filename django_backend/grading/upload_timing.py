@@ -0,0 +1,72 @@
+import logging
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTimings:
+
+    # Wall time, row count and number of database queries of every stage of a csv upload
+
+    def __init__(self, form_name):
+        self.form_name = form_name
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """
+        Time the code run in the with block as the stage `name`
+        The stage dict is yielded so rows can be set once they are known
+        :param name:
+        :param rows:
+        :return:
+        """
+        stage = {"form": self.form_name, "stage": name, "rows": rows, "queries": 0, "duration_ms": None}
+
+        def count_query(execute, sql, params, many, context):
+            stage["queries"] += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count_query):
+                yield stage
+        finally:
+            stage["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            self.stages.append(stage)
+            logger.info(
+                "%s %s: %.1f ms, %s rows, %s queries",
+                self.form_name,
+                name,
+                stage["duration_ms"],
+                stage["rows"],
+                stage["queries"],
+                extra={"upload_stage": stage},
+            )
+
+    def as_server_timing(self):
+        """
+        Value of a Server-Timing header (shown by the browser developer tools) with a metric per stage
+        :return:
+        """
+        return ", ".join(
+            f'{stage["stage"]};dur={stage["duration_ms"]};desc="{stage["rows"]} rows, {stage["queries"]} queries"'
+            for stage in self.stages
+        )
+
+
+def add_upload_timing_header(response, form):
+    """
+    Add the Server-Timing header of the form's upload stages to response when settings.UPLOAD_TIMING_HEADER is on
+    :param response:
+    :param form: upload form (with timings)
+    :return: response
+    """
+    timings = getattr(form, "timings", None)
+    if getattr(settings, "UPLOAD_TIMING_HEADER", False) and timings and timings.stages:
+        response["Server-Timing"] = timings.as_server_timing()
+    return response
@@ -2,7 +2,6 @@ from datetime import datetime
 from multiprocessing import context
 from re import template
 
-from django.contrib.auth.models import User
 from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import render
 from django.urls import reverse
@@ -11,6 +10,8 @@ from django.views import View
 from django.contrib.auth.mixins import LoginRequiredMixin
 
 
+from ownerships.system_users import SYSTEM_USERS
+
 from .models import Parcel, Receipt, ParcelTransfer
 
 from .forms import (
@@ -27,15 +28,14 @@ from .forms import (
 from stonegrading.mixins import BasicGradingMixin, SarineGradingMixin, GWGradingMixin, GIAGradingMixin
 
 from .forms import CSVImportForm
+from .upload_timing import add_upload_timing_header
 
 
 class ReturnToVaultView(View):
     def get(self, request, pk, *args, **kwargs):
         parcel = Parcel.objects.get(pk=pk)
         try:
-            ParcelTransfer.can_create_transfer(
-                item=parcel, from_user=request.user, to_user=User.objects.get(username="vault")
-            )
+            ParcelTransfer.can_create_transfer(item=parcel, from_user=request.user, to_user=SYSTEM_USERS.vault)
         except Exception as e:
             return HttpResponse(e)
 
@@ -46,13 +46,11 @@ class ReturnToVaultView(View):
     def post(self, request, pk, *args, **kwargs):
         parcel = Parcel.objects.get(pk=pk)
         try:
-            ParcelTransfer.can_create_transfer(
-                item=parcel, from_user=request.user, to_user=User.objects.get(username="vault")
-            )
+            ParcelTransfer.can_create_transfer(item=parcel, from_user=request.user, to_user=SYSTEM_USERS.vault)
         except Exception as e:
             return HttpResponse(e)
         ParcelTransfer.initiate_transfer(
-            item=parcel, from_user=request.user, to_user=User.objects.get(username="vault"), created_by=request.user
+            item=parcel, from_user=request.user, to_user=SYSTEM_USERS.vault, created_by=request.user
         )
         return HttpResponseRedirect(reverse("admin:grading_parcel_change", args=[parcel.id]))
 
@@ -172,12 +170,16 @@ class SarineUploadView(LoginRequiredMixin, View):
         """
         form = SarineUploadForm(user=request.user, data={}, files=request.FILES)
         if not form.is_valid():
-            return errors_page(request=request, title="Sarine Grading", form=form, link="grading")
+            return add_upload_timing_header(
+                errors_page(request=request, title="Sarine Grading", form=form, link="grading"), form
+            )
 
         stones = form.save()
         split_id = stones[0].split_from.pk
 
-        return HttpResponseRedirect(reverse("admin:grading_split_change", args=(split_id,)))
+        return add_upload_timing_header(
+            HttpResponseRedirect(reverse("admin:grading_split_change", args=(split_id,))), form
+        )
 
 
 class BasicGradingUploadView(LoginRequiredMixin, View):
@@ -208,12 +210,16 @@ class BasicGradingUploadView(LoginRequiredMixin, View):
         """
         form = BasicUploadForm(data={}, user=request.user, files=request.FILES)
         if not form.is_valid():
-            return errors_page(request=request, title="Basic Grading", form=form, link="grading")
+            return add_upload_timing_header(
+                errors_page(request=request, title="Basic Grading", form=form, link="grading"), form
+            )
 
         stones = form.save()
         split_id = stones[0].split_from.pk
 
-        return HttpResponseRedirect(reverse("admin:grading_split_change", args=(split_id,)))
+        return add_upload_timing_header(
+            HttpResponseRedirect(reverse("admin:grading_split_change", args=(split_id,))), form
+        )
 
 
 class GIAGradingAdjustView(LoginRequiredMixin, View):
@@ -232,12 +238,16 @@ class GIAGradingAdjustView(LoginRequiredMixin, View):
     def post(self, request, *args, **kwargs):
         form = GIAAdjustingUploadForm(data={}, files=request.FILES)
         if not form.is_valid():
-            return errors_page(request=request, title="GIA Adjusting Grading", form=form, link="grading")
+            return add_upload_timing_header(
+                errors_page(request=request, title="GIA Adjusting Grading", form=form, link="grading"), form
+            )
 
         stones = form.save()
         split_id = stones[0].split_from_id
 
-        return HttpResponseRedirect(reverse("admin:grading_split_change", args=(split_id,)))
+        return add_upload_timing_header(
+            HttpResponseRedirect(reverse("admin:grading_split_change", args=(split_id,))), form
+        )
 
 
 """
@@ -275,12 +285,16 @@ class GWGradingAdjustView(LoginRequiredMixin, View):
     def post(self, request, *args, **kwargs):
         form = GWAdjustingUploadForm(data={}, files=request.FILES)
         if not form.is_valid():
-            return errors_page(request=request, title="GW Adjusting Grading", form=form, link="grading")
+            return add_upload_timing_header(
+                errors_page(request=request, title="GW Adjusting Grading", form=form, link="grading"), form
+            )
 
         stones = form.save()
         split_id = stones[0].split_from_id
 
-        return HttpResponseRedirect(reverse("admin:grading_split_change", args=(split_id,)))
+        return add_upload_timing_header(
+            HttpResponseRedirect(reverse("admin:grading_split_change", args=(split_id,))), form
+        )
 
 
 class GWGradingUploadView(LoginRequiredMixin, View):
@@ -299,12 +313,16 @@ class GWGradingUploadView(LoginRequiredMixin, View):
 
         form = GWGradingUploadForm(data={}, user=request.user, files=request.FILES)
         if not form.is_valid():
-            return errors_page(request=request, title="Goldway Grading", form=form, link="grading")
+            return add_upload_timing_header(
+                errors_page(request=request, title="Goldway Grading", form=form, link="grading"), form
+            )
 
         stones = form.save()
         split_id = stones[0].split_from.pk
 
-        return HttpResponseRedirect(reverse("admin:grading_split_change", args=(split_id,)))
+        return add_upload_timing_header(
+            HttpResponseRedirect(reverse("admin:grading_split_change", args=(split_id,))), form
+        )
 
 
 class GIAGradingUploadView(LoginRequiredMixin, View):
@@ -333,12 +351,16 @@ class GIAGradingUploadView(LoginRequiredMixin, View):
         """
         form = GIAUploadForm(data={}, user=request.user, files=request.FILES)
         if not form.is_valid():
-            return errors_page(request=request, title="GIA Grading", form=form, link="grading")
+            return add_upload_timing_header(
+                errors_page(request=request, title="GIA Grading", form=form, link="grading"), form
+            )
 
         stones = form.save()
         split_id = stones[0].split_from.pk
 
-        return HttpResponseRedirect(reverse("admin:grading_split_change", args=(split_id,)))
+        return add_upload_timing_header(
+            HttpResponseRedirect(reverse("admin:grading_split_change", args=(split_id,))), form
+        )
 
 
 class MacroFileNameUpload(LoginRequiredMixin, View):
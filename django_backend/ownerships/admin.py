@@ -1,7 +1,7 @@
 from django.contrib import admin
-from django.contrib.auth.models import User
 
 from .models import ParcelTransfer, StoneTransfer
+from .system_users import SYSTEM_USERS
 
 
 class ItemTransferAdmin(admin.ModelAdmin):
@@ -27,7 +27,7 @@ class ItemTransferAdmin(admin.ModelAdmin):
         return True
 
     def save_model(self, request, obj, form, change):
-        vault = User.objects.get(username="vault")
+        vault = SYSTEM_USERS.vault
         created_by = request.user
         created = self.model.initiate_transfer(obj.item, vault, obj.to_user, created_by, obj.remarks)
         obj.from_user = vault
@@ -1,5 +1,20 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class OwnershipsConfig(AppConfig):
     name = "ownerships"
+
+    def ready(self):
+        from django.contrib.auth.models import User
+
+        from .models import ParcelTransfer, StoneTransfer, refresh_custody
+        from .system_users import SYSTEM_USERS
+
+        post_save.connect(SYSTEM_USERS.clear, sender=User, dispatch_uid="ownerships.system_users.save")
+        post_delete.connect(SYSTEM_USERS.clear, sender=User, dispatch_uid="ownerships.system_users.delete")
+        for model in (ParcelTransfer, StoneTransfer):
+            post_save.connect(refresh_custody, sender=model, dispatch_uid=f"ownerships.custody.{model.__name__}")
+            post_delete.connect(
+                refresh_custody, sender=model, dispatch_uid=f"ownerships.custody.{model.__name__}.delete"
+            )
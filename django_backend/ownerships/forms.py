@@ -13,10 +13,10 @@ from grading.forms import get_error_headers
 from grading.views import errors_page
 
 from .models import StoneTransfer
+from .system_users import SYSTEM_USERS
 
 import pandas as pd
 
-
 User = get_user_model()
 
 
@@ -162,7 +162,7 @@ class GWStoneTransferForm(BaseTransferUploadForm):
         transfers = []
 
         for stone_id in stone_ids:
-            goldway_user = User.objects.get(username="goldway")
+            goldway_user = SYSTEM_USERS.goldway
             transfer = self.transfer_to(to_user=goldway_user, stone_id=stone_id)
             transfers.append(transfer)
 
@@ -195,7 +195,7 @@ class GiaStoneTransferForm(BaseTransferUploadForm):
         stone_ids, _ = self.cleaned_data
         transfers = []
         for stone_id in stone_ids:
-            gia_user = User.objects.get(username="gia")
+            gia_user = SYSTEM_USERS.gia
             transfer = self.transfer_to(to_user=gia_user, stone_id=stone_id)
             transfers.append(transfer)
 
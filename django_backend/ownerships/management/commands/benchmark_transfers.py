@@ -0,0 +1,194 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from customers.models import Entity
+from grading.models import Parcel, Receipt
+from ownerships.models import ParcelTransfer
+
+SEED_BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed parcel transfers in a test database and report the query plan and latency of the transfer lookups "
+        "without and with the transfer indexes. The database of the settings is not touched."
+    )
+
+    def add_arguments(self, parser):
+        """
+        Add arguments
+        :param parser:
+        :return:
+        """
+        parser.add_argument("--transfers", type=int, default=1_000_000, help="number of transfers to seed")
+        parser.add_argument("--parcels", type=int, default=100_000, help="number of parcels to spread them over")
+        parser.add_argument("--users", type=int, default=50, help="number of users to transfer between")
+        parser.add_argument("--repeat", type=int, default=20, help="number of timed runs of every lookup")
+        parser.add_argument("--batch", type=int, default=500, help="number of parcels of the bulk lookups")
+        parser.add_argument("--keepdb", action="store_true", help="keep the seeded test database for the next run")
+
+    def seed(self, options):
+        """
+        Create the users and parcels, and a chain of transfers for every parcel, the last one fresh
+        :param options:
+        :return:
+        """
+        rng = random.Random(0)
+        User.objects.bulk_create(User(username=f"benchmark-{number}") for number in range(options["users"]))
+        users = list(User.objects.filter(username__startswith="benchmark-").values_list("pk", flat=True))
+
+        entity = Entity.objects.create(name="Benchmark", address="-", phone="-", email="-")
+        receipt = Receipt.objects.create(entity=entity, code="BENCHMARK", intake_by_id=users[0])
+        Parcel.objects.bulk_create(
+            (
+                Parcel(
+                    receipt=receipt,
+                    gradia_parcel_code=f"BM{number}",
+                    customer_parcel_code=f"BM{number}",
+                    total_carats=1,
+                    total_pieces=1,
+                    reference_price_per_carat=1,
+                )
+                for number in range(options["parcels"])
+            ),
+            batch_size=SEED_BATCH_SIZE,
+        )
+        parcels = list(Parcel.objects.filter(receipt=receipt).order_by("pk").values_list("pk", flat=True))
+
+        # initiated_date is auto_now_add, the seeded transfers get dates spread over the last years instead
+        initiated_date = ParcelTransfer._meta.get_field("initiated_date")
+        initiated_date.auto_now_add = False
+        try:
+            start = now() - timedelta(days=3 * 365)
+            transfers = []
+            for index, parcel in enumerate(parcels):
+                chain_length = options["transfers"] // len(parcels) + (index < options["transfers"] % len(parcels))
+                holder = users[0]
+                date = start + timedelta(minutes=rng.randrange(60 * 24 * 365))
+                for position in range(chain_length):
+                    to_user = rng.choice(users)
+                    last = position == chain_length - 1
+                    transfers.append(
+                        ParcelTransfer(
+                            item_id=parcel,
+                            from_user_id=holder,
+                            to_user_id=to_user,
+                            created_by_id=holder,
+                            initiated_date=date,
+                            confirmed_date=None if last and rng.random() < 0.1 else date + timedelta(hours=1),
+                            fresh=last,
+                        )
+                    )
+                    holder = to_user
+                    date += timedelta(minutes=rng.randrange(1, 60 * 24 * 30))
+
+                if len(transfers) >= SEED_BATCH_SIZE:
+                    ParcelTransfer.objects.bulk_create(transfers)
+                    transfers = []
+            ParcelTransfer.objects.bulk_create(transfers)
+        finally:
+            initiated_date.auto_now_add = True
+
+    def lookups(self, options):
+        """
+        The transfer lookups to measure, each a function of a random number generator
+        :param options:
+        :return: dict of name: function
+        """
+        parcels = list(Parcel.objects.values_list("pk", flat=True))
+        users = list(User.objects.filter(username__startswith="benchmark-"))
+
+        return {
+            "most_recent_transfer": lambda rng: ParcelTransfer.most_recent_transfer(Parcel(pk=rng.choice(parcels))),
+            "get_current_location": lambda rng: ParcelTransfer.get_current_location(Parcel(pk=rng.choice(parcels))),
+            "get_current_holding": lambda rng: ParcelTransfer.get_current_holding(rng.choice(users)),
+            f"latest_transfers ({options['batch']} parcels)": lambda rng: ParcelTransfer.latest_transfers(
+                rng.sample(parcels, min(options["batch"], len(parcels)))
+            ),
+            f"fresh transfers ({options['batch']} parcels)": lambda rng: list(
+                ParcelTransfer.objects.filter(
+                    fresh=True, item_id__in=rng.sample(parcels, min(options["batch"], len(parcels)))
+                )
+            ),
+        }
+
+    def explain(self, sql):
+        """
+        Query plan of sql
+        :param sql:
+        :return: list of lines
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}")
+            return [" | ".join(str(column) for column in row) for row in cursor.fetchall()]
+
+    def measure(self, name, lookup, repeat):
+        """
+        Print the query plans of the lookup, and the median and slowest of repeat runs
+        :param name:
+        :param lookup:
+        :param repeat:
+        :return:
+        """
+        rng = random.Random(1)
+        with CaptureQueriesContext(connection) as queries:
+            lookup(rng)
+
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            lookup(rng)
+            durations.append((time.perf_counter() - start) * 1000)
+
+        self.stdout.write(
+            f"  {name:<34} median {statistics.median(durations):9.3f} ms   max {max(durations):9.3f} ms   "
+            f"{len(queries)} queries"
+        )
+        for query in queries:
+            for line in self.explain(query["sql"]):
+                self.stdout.write(f"      {line}")
+
+    def handle(self, *args, **options):
+        """
+        Seed the test database (unless kept from a previous run) and measure the lookups without and with the indexes
+        :param args:
+        :param options:
+        :return:
+        """
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        try:
+            if not ParcelTransfer.objects.exists():
+                start = time.perf_counter()
+                self.seed(options)
+                self.stdout.write(
+                    f"seeded {ParcelTransfer.objects.count()} transfers of {Parcel.objects.count()} parcels "
+                    f"in {time.perf_counter() - start:.1f} s"
+                )
+
+            lookups = self.lookups(options)
+            indexes = ParcelTransfer._meta.indexes
+
+            with connection.schema_editor() as schema_editor:
+                for index in indexes:
+                    schema_editor.remove_index(ParcelTransfer, index)
+            self.stdout.write(f"\n{connection.vendor}, without the transfer indexes:")
+            for name, lookup in lookups.items():
+                self.measure(name, lookup, options["repeat"])
+
+            with connection.schema_editor() as schema_editor:
+                for index in indexes:
+                    schema_editor.add_index(ParcelTransfer, index)
+            self.stdout.write(f"\n{connection.vendor}, with {', '.join(index.name for index in indexes)}:")
+            for name, lookup in lookups.items():
+                self.measure(name, lookup, options["repeat"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
@@ -0,0 +1,78 @@
+# Generated by Django 3.1.4 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_custody(apps, schema_editor):
+    for transfer_name, custody_name in [("ParcelTransfer", "ParcelCustody"), ("StoneTransfer", "StoneCustody")]:
+        Transfer = apps.get_model("ownerships", transfer_name)
+        Custody = apps.get_model("ownerships", custody_name)
+
+        newest = Transfer.objects.filter(item=models.OuterRef("item")).order_by("-initiated_date", "-pk").values("pk")[:1]
+        custodies = []
+        for transfer in Transfer.objects.filter(pk=models.Subquery(newest)).iterator():
+            if not transfer.fresh:
+                status = "expired"
+            elif transfer.confirmed_date is None:
+                status = "unconfirmed"
+            else:
+                status = "confirmed"
+            custodies.append(
+                Custody(
+                    item_id=transfer.item_id,
+                    transfer_id=transfer.pk,
+                    holder_id=transfer.to_user_id,
+                    status=status,
+                    since=transfer.initiated_date,
+                )
+            )
+        Custody.objects.bulk_create(custodies, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grading', '0004_stone_modified_date'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ownerships', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParcelCustody',
+            fields=[
+                ('holder', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('status', models.CharField(choices=[('confirmed', 'confirmed'), ('unconfirmed', 'unconfirmed'), ('expired', 'expired')], max_length=11)),
+                ('since', models.DateTimeField()),
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='custody', serialize=False, to='grading.parcel')),
+                ('transfer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ownerships.parceltransfer')),
+            ],
+            options={
+                'verbose_name_plural': 'parcel custodies',
+            },
+        ),
+        migrations.CreateModel(
+            name='StoneCustody',
+            fields=[
+                ('holder', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('status', models.CharField(choices=[('confirmed', 'confirmed'), ('unconfirmed', 'unconfirmed'), ('expired', 'expired')], max_length=11)),
+                ('since', models.DateTimeField()),
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='custody', serialize=False, to='grading.stone')),
+                ('transfer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ownerships.stonetransfer')),
+            ],
+            options={
+                'verbose_name_plural': 'stone custodies',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='parcelcustody',
+            index=models.Index(fields=['holder', 'status'], name='parcel_custody_holder_status'),
+        ),
+        migrations.AddIndex(
+            model_name='stonecustody',
+            index=models.Index(fields=['holder', 'status'], name='stone_custody_holder_status'),
+        ),
+        migrations.RunPython(fill_custody, migrations.RunPython.noop),
+    ]
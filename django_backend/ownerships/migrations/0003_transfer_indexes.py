@@ -0,0 +1,40 @@
+# Generated by Django 3.1.4 on 2026-10-18 14:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('grading', '0004_stone_modified_date'),
+        ('ownerships', '0002_custody'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='parceltransfer',
+            index=models.Index(fields=['item', 'initiated_date'], name='parceltransfer_item_initiated'),
+        ),
+        migrations.AddIndex(
+            model_name='parceltransfer',
+            index=models.Index(fields=['to_user', 'fresh'], name='parceltransfer_to_user_fresh'),
+        ),
+        migrations.AddIndex(
+            model_name='parceltransfer',
+            index=models.Index(fields=['fresh', 'item'], name='parceltransfer_fresh_item'),
+        ),
+        migrations.AddIndex(
+            model_name='stonetransfer',
+            index=models.Index(fields=['item', 'initiated_date'], name='stonetransfer_item_initiated'),
+        ),
+        migrations.AddIndex(
+            model_name='stonetransfer',
+            index=models.Index(fields=['to_user', 'fresh'], name='stonetransfer_to_user_fresh'),
+        ),
+        migrations.AddIndex(
+            model_name='stonetransfer',
+            index=models.Index(fields=['fresh', 'item'], name='stonetransfer_fresh_item'),
+        ),
+    ]
@@ -2,10 +2,64 @@ from datetime import datetime
 
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
+from django.db.models import OuterRef, Q, Subquery
 from django.utils.timezone import utc
 
+from .system_users import SYSTEM_USERS
+
+
+class AbstractItemCustody(models.Model):
+    """
+    Where an item is: a copy of the holder and status of its most recent transfer, kept up to date by
+    update_custody() (on every save or delete of a transfer and after bulk changes) so lists can filter and
+    show it with a join
+    """
+
+    CONFIRMED = "confirmed"
+    UNCONFIRMED = "unconfirmed"
+    EXPIRED = "expired"
+    STATUS_CHOICES = [(CONFIRMED, "confirmed"), (UNCONFIRMED, "unconfirmed"), (EXPIRED, "expired")]
+
+    holder = models.ForeignKey(User, on_delete=models.PROTECT, related_name="+")
+    status = models.CharField(max_length=11, choices=STATUS_CHOICES)
+    since = models.DateTimeField()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def status_of(cls, transfer):
+        if not transfer.fresh:
+            return cls.EXPIRED
+        if transfer.in_transit():
+            return cls.UNCONFIRMED
+        return cls.CONFIRMED
+
+    def location(self):
+        return [self.holder, self.status]
+
+    def __str__(self):
+        return f"{self.item_id}: {self.holder} ({self.status})"
+
+
+class ParcelCustody(AbstractItemCustody):
+    item = models.OneToOneField("grading.Parcel", on_delete=models.CASCADE, primary_key=True, related_name="custody")
+    transfer = models.OneToOneField("ParcelTransfer", on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        verbose_name_plural = "parcel custodies"
+        indexes = [models.Index(fields=["holder", "status"], name="parcel_custody_holder_status")]
+
+
+class StoneCustody(AbstractItemCustody):
+    item = models.OneToOneField("grading.Stone", on_delete=models.CASCADE, primary_key=True, related_name="custody")
+    transfer = models.OneToOneField("StoneTransfer", on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        verbose_name_plural = "stone custodies"
+        indexes = [models.Index(fields=["holder", "status"], name="stone_custody_holder_status")]
+
 
 class AbstractItemTransfer(models.Model):
     initiated_date = models.DateTimeField(auto_now_add=True)
@@ -19,9 +73,66 @@ class AbstractItemTransfer(models.Model):
     def in_transit(self):
         return self.confirmed_date is None
 
+    # AbstractItemCustody subclass of the items
+    custody_model = None
+
     class Meta:
         abstract = True
 
+    @classmethod
+    def update_custody(cls, item_ids):
+        """
+        Update the custody of the items to their most recent transfer, e.g. after changing transfers in bulk
+        :param item_ids:
+        :return:
+        """
+        transfers = cls.latest_transfers(item_ids).values()
+        custodies = cls.custody_model.objects.in_bulk([transfer.item_id for transfer in transfers])
+
+        new, changed = [], []
+        for transfer in transfers:
+            values = {
+                "transfer_id": transfer.pk,
+                "holder_id": transfer.to_user_id,
+                "status": cls.custody_model.status_of(transfer),
+                "since": transfer.initiated_date,
+            }
+            custody = custodies.get(transfer.item_id)
+            if custody is None:
+                new.append(cls.custody_model(item_id=transfer.item_id, **values))
+            elif any(getattr(custody, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(custody, field, value)
+                changed.append(custody)
+
+        with transaction.atomic():
+            cls.custody_model.objects.bulk_update(changed, ["transfer", "holder", "status", "since"], batch_size=500)
+            cls.custody_model.objects.bulk_create(new, batch_size=500)
+
+    @classmethod
+    def latest_transfers(cls, item_ids):
+        """
+        The most recent transfer of every item, in one query
+        :param item_ids:
+        :return: dict of item id: transfer, without the items that were never transferred
+        """
+        newest = cls.objects.filter(item=OuterRef("item")).order_by("-initiated_date", "-pk").values("pk")[:1]
+        transfers = cls.objects.filter(item_id__in=item_ids, pk=Subquery(newest)).select_related("to_user")
+        return {transfer.item_id: transfer for transfer in transfers}
+
+    @classmethod
+    def items_latest_transfers(cls, items):
+        """
+        latest_transfers of items, raises PermissionDenied if one of them was never transferred
+        :param items:
+        :return: dict of item id: transfer
+        """
+        last_transfers = cls.latest_transfers([item.pk for item in items])
+        for item in items:
+            if item.pk not in last_transfers:
+                raise PermissionDenied(f"{item} has never been transferred")
+        return last_transfers
+
     @classmethod
     def most_recent_transfer(cls, item):
         try:
@@ -53,8 +164,18 @@ class AbstractItemTransfer(models.Model):
 
     @classmethod
     def can_create_transfer(cls, item, from_user, to_user):
-        split = User.objects.get(username="split")
-        last_transfer = cls.most_recent_transfer(item)
+        cls.check_transfer(cls.most_recent_transfer(item), from_user, to_user)
+
+    @staticmethod
+    def check_transfer(last_transfer, from_user, to_user):
+        """
+        Raises PermissionDenied if from_user cannot transfer the item of last_transfer (its most recent one) to to_user
+        :param last_transfer:
+        :param from_user:
+        :param to_user:
+        :return:
+        """
+        split = SYSTEM_USERS.split
         if last_transfer.to_user != from_user and to_user != split:
             raise PermissionDenied(
                 f"you are not the current owner, only the user signed in as {last_transfer.to_user} can do this"
@@ -76,19 +197,76 @@ class AbstractItemTransfer(models.Model):
         last_transfer = cls.most_recent_transfer(item)
 
         cls.can_create_transfer(item, from_user, to_user)
-        last_transfer.fresh = False
-        last_transfer.save()
+        with transaction.atomic():
+            # an update, so the custody is only refreshed once, by the creation of the new transfer
+            cls.objects.filter(pk=last_transfer.pk).update(fresh=False)
+            last_transfer.fresh = False
 
-        created = cls.objects.create(
-            item=last_transfer.item, from_user=from_user, to_user=to_user, remarks=remarks, created_by=created_by
-        )
+            created = cls.objects.create(
+                item=last_transfer.item, from_user=from_user, to_user=to_user, remarks=remarks, created_by=created_by
+            )
+        return created
+
+    @classmethod
+    def bulk_can_create_transfer(cls, items, from_user, to_user):
+        """
+        can_create_transfer for many items, with one query for their most recent transfers
+        :param items:
+        :param from_user:
+        :param to_user:
+        :return: dict of item id: most recent transfer
+        """
+        last_transfers = cls.items_latest_transfers(items)
+        for item in items:
+            try:
+                cls.check_transfer(last_transfers[item.pk], from_user, to_user)
+            except PermissionDenied as error:
+                raise PermissionDenied(f"{item}: {error}") from error
+        return last_transfers
+
+    @classmethod
+    def bulk_initiate_transfer(cls, items, from_user, to_user, created_by, remarks=""):
+        """
+        initiate_transfer for many items in one transaction: the most recent transfers are expired with one
+        update before the new ones are inserted (so there is one fresh transfer per item throughout)
+        :param items:
+        :param from_user:
+        :param to_user:
+        :param created_by:
+        :param remarks:
+        :return: list of the created transfers
+        """
+        items = list({item.pk: item for item in items}.values())
+        with transaction.atomic():
+            last_transfers = cls.bulk_can_create_transfer(items, from_user, to_user)
+            cls.objects.filter(pk__in=[transfer.pk for transfer in last_transfers.values()]).update(fresh=False)
+            created = cls.objects.bulk_create(
+                [
+                    cls(item=item, from_user=from_user, to_user=to_user, remarks=remarks, created_by=created_by)
+                    for item in items
+                ],
+                batch_size=500,
+            )
+            cls.update_custody(list(last_transfers))
         return created
 
     @classmethod
     def can_confirm_received(cls, item, user):
         owner, status = item.current_location()
+        cls.check_confirm_received(owner, status, user, lambda: user.groups.filter(name="vault_manager").exists())
+
+    @staticmethod
+    def check_confirm_received(owner, status, user, is_vault_manager):
+        """
+        Raises PermissionDenied if user cannot confirm receiving an item at owner with status
+        :param owner:
+        :param status:
+        :param user:
+        :param is_vault_manager: callable returning whether user is a vault manager, only called if needed
+        :return:
+        """
         if owner != user:
-            if owner.username == "vault" and user.groups.filter(name="vault_manager").exists():
+            if owner.username == "vault" and is_vault_manager():
                 # okay if it is to vault and user is a vault manager
                 pass
             else:
@@ -105,15 +283,76 @@ class AbstractItemTransfer(models.Model):
     def confirm_received(cls, item):
         last_transfer = cls.most_recent_transfer(item)
         cls.can_confirm_received(item, last_transfer.to_user)
-        last_transfer.confirmed_date = datetime.utcnow().replace(tzinfo=utc)
-        last_transfer.save()
+        with transaction.atomic():
+            # the custody is refreshed by the post_save signal
+            last_transfer.confirmed_date = datetime.utcnow().replace(tzinfo=utc)
+            last_transfer.save()
+
+    @classmethod
+    def bulk_can_confirm_received(cls, items, user=None):
+        """
+        can_confirm_received for many items, with one query for their most recent transfers and at most one
+        for the groups of user
+        :param items:
+        :param user: the user confirming, if None every item is confirmed by its holder like confirm_received does
+        :return: dict of item id: most recent transfer
+        """
+        last_transfers = cls.items_latest_transfers(items)
+        vault_manager = []
+
+        def is_vault_manager():
+            if not vault_manager:
+                vault_manager.append(user.groups.filter(name="vault_manager").exists())
+            return vault_manager[0]
+
+        for item in items:
+            last_transfer = last_transfers[item.pk]
+            status = cls.custody_model.status_of(last_transfer)
+            try:
+                cls.check_confirm_received(
+                    last_transfer.to_user, status, user or last_transfer.to_user, is_vault_manager
+                )
+            except PermissionDenied as error:
+                raise PermissionDenied(f"{item}: {error}") from error
+        return last_transfers
+
+    @classmethod
+    def bulk_confirm_received(cls, items, user=None):
+        """
+        confirm_received for many items, their most recent transfers are confirmed with one update
+        :param items:
+        :param user: the user confirming, if None every item is confirmed by its holder like confirm_received does
+        :return: number of transfers confirmed
+        """
+        items = list({item.pk: item for item in items}.values())
+        with transaction.atomic():
+            last_transfers = cls.bulk_can_confirm_received(items, user)
+            confirmed = cls.objects.filter(pk__in=[transfer.pk for transfer in last_transfers.values()]).update(
+                confirmed_date=datetime.utcnow().replace(tzinfo=utc)
+            )
+            cls.update_custody(list(last_transfers))
+        return confirmed
 
     def __str__(self):
         return f"{self.item}: {self.from_user} -> {self.to_user}"
 
 
+def refresh_custody(sender, instance, **kwargs):
+    """
+    post_save and post_delete receiver of the transfers, the custody of the item follows any saved transfer
+    (also from loaddata or the admin) and falls back to the previous transfer when the latest one is deleted.
+    Queryset updates do not send signals, the bulk methods update the custody themselves
+    :param sender:
+    :param instance:
+    :param kwargs:
+    :return:
+    """
+    sender.update_custody([instance.item_id])
+
+
 class ParcelTransfer(AbstractItemTransfer):
     item = models.ForeignKey("grading.Parcel", on_delete=models.PROTECT)
+    custody_model = ParcelCustody
 
     class Meta:
         constraints = [
@@ -121,6 +360,14 @@ class ParcelTransfer(AbstractItemTransfer):
                 fields=["item"], condition=Q(fresh=True), name="only_one_fresh_transfer_per_parcel"
             )
         ]
+        indexes = [
+            # most_recent_transfer / latest_transfers
+            models.Index(fields=["item", "initiated_date"], name="parceltransfer_item_initiated"),
+            # get_current_holding
+            models.Index(fields=["to_user", "fresh"], name="parceltransfer_to_user_fresh"),
+            # the fresh transfers of items (MySQL has no partial index for the unique constraint)
+            models.Index(fields=["fresh", "item"], name="parceltransfer_fresh_item"),
+        ]
 
 
 class StoneTransfer(AbstractItemTransfer):
@@ -128,6 +375,7 @@ class StoneTransfer(AbstractItemTransfer):
     from_user = models.ForeignKey(User, on_delete=models.PROTECT, related_name="gave_stones")
     to_user = models.ForeignKey(User, on_delete=models.PROTECT, related_name="received_stones")
     created_by = models.ForeignKey(User, on_delete=models.PROTECT, related_name="created_stones")
+    custody_model = StoneCustody
 
     class Meta:
         constraints = [
@@ -135,3 +383,11 @@ class StoneTransfer(AbstractItemTransfer):
                 fields=["item"], condition=Q(fresh=True), name="only_one_fresh_transfer_per_stone"
             )
         ]
+        indexes = [
+            # most_recent_transfer / latest_transfers
+            models.Index(fields=["item", "initiated_date"], name="stonetransfer_item_initiated"),
+            # get_current_holding
+            models.Index(fields=["to_user", "fresh"], name="stonetransfer_to_user_fresh"),
+            # the fresh transfers of items (MySQL has no partial index for the unique constraint)
+            models.Index(fields=["fresh", "item"], name="stonetransfer_fresh_item"),
+        ]
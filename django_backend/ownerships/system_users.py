@@ -0,0 +1,74 @@
+import threading
+
+from django.contrib.auth.models import User
+
+
+class SystemUsers:
+
+    # The accounts standing for places rather than people (the vault, goldway, gia, ...), loaded
+    # together once per process. The cache is cleared by the User post_save / post_delete signals
+    # (connected in OwnershipsConfig.ready), so recreated accounts, e.g. fixture reloads, are picked up
+
+    USERNAMES = ("vault", "split", "goldway", "gia", "exit")
+
+    def __init__(self):
+        self.users = None
+        self.lock = threading.Lock()
+
+    def get(self, username):
+        """
+        Returns the system user `username`, raises User.DoesNotExist like User.objects.get if there is none
+        :param username:
+        :return:
+        """
+        users = self.users
+        if users is None or username not in users:
+            with self.lock:
+                if self.users is None or username not in self.users:
+                    self.users = {
+                        user.username: user for user in User.objects.filter(username__in={*self.USERNAMES, username})
+                    }
+                users = self.users
+
+        try:
+            return users[username]
+        except KeyError:
+            raise User.DoesNotExist(f"There is no `{username}` user")
+
+    @property
+    def vault(self):
+        return self.get("vault")
+
+    @property
+    def split(self):
+        return self.get("split")
+
+    @property
+    def goldway(self):
+        return self.get("goldway")
+
+    @property
+    def gia(self):
+        return self.get("gia")
+
+    @property
+    def exit(self):
+        return self.get("exit")
+
+    def clear(self, sender=None, instance=None, **kwargs):
+        """
+        Signal receiver, the users are loaded again on the next use when one of them (or a user taking
+        one of their usernames) is saved or deleted
+        :param sender:
+        :param instance:
+        :param kwargs:
+        :return:
+        """
+        users = self.users
+        if users is None:
+            return
+        if instance is None or instance.username in users or any(user.pk == instance.pk for user in users.values()):
+            self.users = None
+
+
+SYSTEM_USERS = SystemUsers()
@@ -1,12 +1,17 @@
+from unittest.mock import patch
+
 from django.contrib import admin
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, User
+from django.core.exceptions import PermissionDenied
 from django.db import IntegrityError
 from django.test import TestCase
+from django.utils.timezone import now
 
 from customers.models import Entity
 from grading.models import Parcel, Receipt
 
-from ..models import ParcelTransfer
+from ..models import AbstractItemCustody, ParcelCustody, ParcelTransfer
+from ..system_users import SYSTEM_USERS
 
 
 class ParcelTransferTest(TestCase):
@@ -46,3 +51,174 @@ class ParcelTransferTest(TestCase):
 
     def test_has_useful_repr(self):
         self.assertEqual(str(self.transfer), "parcel VK20200701 (2ct, 2pcs, receipt VK-0001): user -> user")
+
+
+class ItemCustodyTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="user")
+        self.vault = User.objects.create(username="vault")
+        User.objects.create(username="split")
+        receipt = Receipt.objects.create(
+            entity=Entity.objects.create(name="Van Klaren", address="addressy", phone="12345678", email="vk@vk.com"),
+            code="VK-0001",
+            intake_by=self.user,
+        )
+        self.parcel = Parcel.objects.create(
+            receipt=receipt,
+            gradia_parcel_code="VK20200701",
+            customer_parcel_code="cust-parcel-1",
+            total_carats=2,
+            total_pieces=2,
+            reference_price_per_carat=1,
+        )
+        ParcelTransfer.objects.create(
+            item=self.parcel, from_user=self.user, to_user=self.user, created_by=self.user, confirmed_date=now()
+        )
+
+    def assertCustodyMatchesTransfers(self):
+        custody = ParcelCustody.objects.get(item=self.parcel)
+        self.assertEqual(custody.location(), ParcelTransfer.get_current_location(self.parcel))
+        self.assertEqual(custody.transfer, ParcelTransfer.most_recent_transfer(self.parcel))
+
+    def test_custody_follows_transfers(self):
+        self.assertCustodyMatchesTransfers()
+        self.assertEqual(ParcelCustody.objects.get().status, AbstractItemCustody.CONFIRMED)
+
+        ParcelTransfer.initiate_transfer(self.parcel, self.user, self.vault, self.user)
+        self.assertCustodyMatchesTransfers()
+        self.assertEqual(ParcelCustody.objects.get().location(), [self.vault, AbstractItemCustody.UNCONFIRMED])
+
+        ParcelTransfer.confirm_received(self.parcel)
+        self.assertCustodyMatchesTransfers()
+
+        # e.g. an edit in the admin
+        last_transfer = ParcelTransfer.most_recent_transfer(self.parcel)
+        last_transfer.fresh = False
+        last_transfer.save()
+        self.assertCustodyMatchesTransfers()
+        self.assertEqual(ParcelCustody.objects.get().status, AbstractItemCustody.EXPIRED)
+
+    def test_custody_falls_back_to_the_previous_transfer_on_delete(self):
+        transfer = ParcelTransfer.initiate_transfer(self.parcel, self.user, self.vault, self.user)
+        transfer.delete()
+
+        self.assertCustodyMatchesTransfers()
+        self.assertEqual(ParcelCustody.objects.get().location(), [self.user, AbstractItemCustody.EXPIRED])
+
+    def test_confirming_by_saving_the_transfer_updates_the_custody(self):
+        # like confirm_stones_checked in the views
+        transfer = ParcelTransfer.initiate_transfer(self.parcel, self.user, self.vault, self.user)
+        transfer.confirmed_date = now()
+        transfer.save()
+
+        self.assertCustodyMatchesTransfers()
+        self.assertEqual(ParcelCustody.objects.get().location(), [self.vault, AbstractItemCustody.CONFIRMED])
+
+    def test_initiate_transfer_updates_the_custody_once(self):
+        with patch.object(ParcelTransfer, "update_custody", wraps=ParcelTransfer.update_custody) as update_custody:
+            ParcelTransfer.initiate_transfer(self.parcel, self.user, self.vault, self.user)
+        update_custody.assert_called_once_with([self.parcel.id])
+
+    def test_confirm_received_updates_the_custody_once(self):
+        ParcelTransfer.initiate_transfer(self.parcel, self.user, self.vault, self.user)
+        with patch.object(ParcelTransfer, "update_custody", wraps=ParcelTransfer.update_custody) as update_custody:
+            ParcelTransfer.confirm_received(self.parcel)
+        update_custody.assert_called_once_with([self.parcel.id])
+
+    def test_update_custody_repairs_bulk_changes(self):
+        ParcelTransfer.objects.filter(item=self.parcel).update(to_user=self.vault)
+        ParcelCustody.objects.all().delete()
+
+        ParcelTransfer.update_custody([self.parcel.id])
+        self.assertEqual(ParcelCustody.objects.get().location(), [self.vault, AbstractItemCustody.CONFIRMED])
+
+
+class BulkTransferTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="user")
+        self.vault = User.objects.create(username="vault")
+        User.objects.create(username="split")
+        receipt = Receipt.objects.create(
+            entity=Entity.objects.create(name="Van Klaren", address="addressy", phone="12345678", email="vk@vk.com"),
+            code="VK-0001",
+            intake_by=self.user,
+        )
+        self.parcels = []
+        for number in range(3):
+            parcel = Parcel.objects.create(
+                receipt=receipt,
+                gradia_parcel_code=f"VK2020070{number}",
+                customer_parcel_code=f"cust-parcel-{number}",
+                total_carats=2,
+                total_pieces=2,
+                reference_price_per_carat=1,
+            )
+            ParcelTransfer.objects.create(
+                item=parcel, from_user=self.user, to_user=self.user, created_by=self.user, confirmed_date=now()
+            )
+            self.parcels.append(parcel)
+
+    def test_bulk_initiate_transfer(self):
+        SYSTEM_USERS.split
+        with self.assertNumQueries(10):
+            created = ParcelTransfer.bulk_initiate_transfer(self.parcels, self.user, self.vault, self.user)
+
+        self.assertEqual(len(created), 3)
+        for parcel in self.parcels:
+            self.assertEqual(parcel.current_location(), [self.vault, "unconfirmed"])
+            self.assertEqual(ParcelTransfer.objects.filter(item=parcel).count(), 2)
+            self.assertEqual(ParcelCustody.objects.get(item=parcel).location(), [self.vault, "unconfirmed"])
+
+    def test_bulk_initiate_transfer_creates_nothing_if_an_item_cannot_be_transferred(self):
+        ParcelTransfer.initiate_transfer(self.parcels[1], self.user, self.vault, self.user)
+
+        with self.assertRaisesMessage(PermissionDenied, str(self.parcels[1])):
+            ParcelTransfer.bulk_initiate_transfer(self.parcels, self.user, self.vault, self.user)
+        self.assertEqual(ParcelTransfer.objects.filter(fresh=True, to_user=self.user).count(), 2)
+        self.assertEqual(ParcelTransfer.objects.count(), 4)
+
+    def test_bulk_confirm_received(self):
+        ParcelTransfer.bulk_initiate_transfer(self.parcels, self.user, self.vault, self.user)
+
+        # not the holder nor a vault manager
+        with self.assertRaises(PermissionDenied):
+            ParcelTransfer.bulk_confirm_received(self.parcels, self.user)
+
+        self.assertEqual(ParcelTransfer.bulk_confirm_received(self.parcels, self.vault), 3)
+        for parcel in self.parcels:
+            self.assertEqual(parcel.current_location(), [self.vault, "confirmed"])
+            self.assertEqual(ParcelCustody.objects.get(item=parcel).location(), [self.vault, "confirmed"])
+
+        # already confirmed
+        with self.assertRaises(PermissionDenied):
+            ParcelTransfer.bulk_confirm_received(self.parcels)
+
+    def test_vault_manager_can_bulk_confirm_for_the_vault(self):
+        ParcelTransfer.bulk_initiate_transfer(self.parcels, self.user, self.vault, self.user)
+        self.user.groups.add(Group.objects.create(name="vault_manager"))
+
+        ParcelTransfer.bulk_confirm_received(self.parcels, self.user)
+        self.assertEqual(ParcelTransfer.objects.filter(fresh=True, confirmed_date__isnull=False).count(), 3)
+
+
+class SystemUsersTest(TestCase):
+    def setUp(self):
+        SYSTEM_USERS.clear()
+        self.vault = User.objects.create(username="vault")
+        self.split = User.objects.create(username="split")
+
+    def test_system_users_are_loaded_together_once(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(SYSTEM_USERS.vault, self.vault)
+            self.assertEqual(SYSTEM_USERS.split, self.split)
+            self.assertEqual(SYSTEM_USERS.get("vault"), self.vault)
+
+    def test_recreated_system_user_is_reloaded(self):
+        self.assertEqual(SYSTEM_USERS.vault, self.vault)
+        self.vault.delete()
+        new_vault = User.objects.create(username="vault")
+        self.assertEqual(SYSTEM_USERS.vault.pk, new_vault.pk)
+
+    def test_missing_system_user_raises_does_not_exist(self):
+        with self.assertRaises(User.DoesNotExist):
+            SYSTEM_USERS.goldway